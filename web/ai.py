@@ -2,7 +2,7 @@ from openai import OpenAI
 import os
 
 
-def new(system_prompt, user_prompt):
+def new(system_prompt, user_prompt, timeout=None):
     api_key = os.environ.get('DEEPSEEK_API_KEY') or os.environ.get('OPENAI_API_KEY')
     if not api_key:
         raise ValueError(
@@ -12,7 +12,11 @@ def new(system_prompt, user_prompt):
     base_url = os.environ.get('OPENAI_BASE_URL') or 'https://api.deepseek.com'
     model = os.environ.get('OPENAI_MODEL') or 'deepseek-chat'
 
-    client = OpenAI(api_key=api_key, base_url=base_url)
+    if timeout is not None:
+        # 有截止时间的调用不做自动重试，超时直接抛出由调用方回退
+        client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+    else:
+        client = OpenAI(api_key=api_key, base_url=base_url)
 
     response = client.chat.completions.create(
         model=model,
@@ -13,7 +13,6 @@ AI辅助报警决策系统 - ESP32火灾报警系统智能中间层
 6. AI智能决策干预
 """
 
-import sqlite3
 import json
 import numpy as np
 import time
@@ -22,6 +21,9 @@ from collections import deque
 import logging
 import os
 from ai import new
+from log_pipeline import sampled
+from storage import get_storage
+from timeutil import now_ms
 
 logger = logging.getLogger(__name__)
 
@@ -132,8 +134,9 @@ class AIAlarmDecisionEngine:
         current_time = time.time()
         cutoff_time = current_time - seconds
 
+        # 决策工作线程与MQTT线程并发访问，先取快照再遍历
         recent_data = []
-        for entry in self.data_history:
+        for entry in list(self.data_history):
             if entry['device_id'] == device_id and entry['timestamp'] >= cutoff_time:
                 recent_data.append(entry['data'])
 
@@ -293,30 +296,32 @@ class AIAlarmDecisionEngine:
     def _get_recent_alarms(self, device_id, hours=24):
         """获取最近的报警记录"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with get_storage(self.db_path).read() as conn:
+                cursor = conn.cursor()
 
-            cutoff_time = datetime.now() - timedelta(hours=hours)
+                cutoff_time = now_ms() - hours * 3600 * 1000
 
-            cursor.execute("""
-                SELECT severity, timestamp FROM alert_history
-                WHERE device_id = ? AND timestamp > ?
-                ORDER BY timestamp DESC
-            """, (device_id, cutoff_time))
+                cursor.execute("""
+                    SELECT severity, timestamp FROM alert_history
+                    WHERE device_id = ? AND timestamp > ?
+                    ORDER BY timestamp DESC
+                """, (device_id, cutoff_time))
 
-            alarms = cursor.fetchall()
-            conn.close()
+                alarms = cursor.fetchall()
 
             return alarms
         except Exception as e:
             logger.error(f"获取报警历史失败: {e}")
             return []
 
-    def ai_prediction(self, device_id, current_data, pattern_analysis):
-        """使用AI模型进行预测"""
-        try:
-            # 构建AI提示
-            prompt_context = f"""
+    def ai_prediction(self, device_id, current_data, pattern_analysis, timeout=None):
+        """使用AI模型进行预测（timeout为远程调用的最长等待秒数）
+
+        远程调用超时或失败时异常直接抛出，由调用方回退到硬件判断，
+        不以默认置信度参与加权（否则一次失败的调用也可能降级硬件报警）。
+        """
+        # 构建AI提示
+        prompt_context = f"""
 你是一个火灾报警系统的AI分析师，负责降低误报率。请分析以下传感器数据：
 
 当前传感器数据:
@@ -338,32 +343,32 @@ class AIAlarmDecisionEngine:
 只返回数字，不要其他解释。
 """
 
-            # 调用AI
-            ai_response = new("你是火灾报警AI分析师，只返回0-1之间的置信度分数", prompt_context)
-
-            # 解析AI响应
-            try:
-                confidence = float(ai_response.strip())
-                confidence = max(0.0, min(1.0, confidence))  # 确保在0-1范围内
-                return confidence
-            except ValueError:
-                logger.warning(f"AI响应解析失败: {ai_response}")
-                return 0.5  # 默认中等置信度
+        # 调用AI（超时/连接错误不在此处理）
+        ai_response = new("你是火灾报警AI分析师，只返回0-1之间的置信度分数", prompt_context, timeout=timeout)
 
-        except Exception as e:
-            logger.error(f"AI预测失败: {e}")
-            return 0.5  # AI失败时返回中等置信度
-
-    def make_decision(self, device_id, current_data, hardware_result):
+        # 解析AI响应
+        try:
+            confidence = float(ai_response.strip())
+            confidence = max(0.0, min(1.0, confidence))  # 确保在0-1范围内
+            return confidence
+        except ValueError:
+            logger.warning(f"AI响应解析失败: {ai_response}")
+            return 0.5  # 默认中等置信度
+
+    def make_decision(self, device_id, current_data, hardware_result, timeout=None):
         """AI辅助决策函数
 
         Args:
             device_id: 设备ID
             current_data: 当前传感器数据
             hardware_result: 硬件阈值判断结果 ('normal', 'warning', 'alarm')
+            timeout: AI远程调用的最长等待时间（秒），None表示不限制
 
         Returns:
             dict: 包含最终决策和详细分析
+
+        Raises:
+            Exception: 需要远程AI复核且调用超时或失败时抛出，调用方应沿用硬件判断
         """
 
         # 添加数据到历史
@@ -392,7 +397,7 @@ class AIAlarmDecisionEngine:
         sensor_health = self.analyze_sensor_health(device_id)
 
         # AI预测
-        ai_confidence = self.ai_prediction(device_id, current_data, pattern_analysis)
+        ai_confidence = self.ai_prediction(device_id, current_data, pattern_analysis, timeout=timeout)
 
         # 计算各维度得分
         hardware_score = 0.8 if hardware_result == 'alarm' else 0.6
@@ -482,7 +487,8 @@ class AIAlarmDecisionEngine:
             'intervention': decision['intervention']
         })
 
-        logger.info(f"AI决策完成 - 设备:{device_id}, 硬件:{hardware_result} -> 最终:{decision['final_result']}, 置信度:{final_confidence:.2f}, 干预:{decision['intervention']}")
+        logger.info(f"AI决策完成 - 设备:{device_id}, 硬件:{hardware_result} -> 最终:{decision['final_result']}, 置信度:{final_confidence:.2f}, 干预:{decision['intervention']}",
+                    extra=sampled(('ai_decision', device_id)))
 
         return decision
 
@@ -492,7 +498,7 @@ class AIAlarmDecisionEngine:
         cutoff_time = current_time - hours * 3600
 
         recent_decisions = [
-            d for d in self.alarm_history
+            d for d in list(self.alarm_history)
             if d['timestamp'] >= cutoff_time
         ]
 
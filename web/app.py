@@ -12,50 +12,65 @@ Main Functions:
 - Alarm management
 """
 
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import (Flask, render_template, request, jsonify, send_from_directory, send_file, Response,
+                   stream_with_context)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_cors import CORS
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, emit
 import paho.mqtt.client as mqtt
 import sqlite3
+import numpy as np
 import json
 import time
 import os
+import tempfile
 import sys
-from datetime import datetime, timedelta, timezone
+from datetime import datetime
 import threading
 import logging
+import atexit
+import socket
 from threading import Lock
+from contextlib import contextmanager
 from intelligent_analysis import intelligent_analyzer
 from ai_alarm_decision import ai_assisted_alarm_decision, ai_decision_engine
-
-# 时区转换函数
-def to_local_timestamp(utc_dt):
-    """将UTC datetime转换为本地时间戳（北京时间 UTC+8）"""
-    if utc_dt is None:
+from decision_pool import AlarmDecisionPool
+from ingest_buffer import SensorIngestBuffer
+from device_registry import DeviceRegistry
+from device_state import DeviceStateView
+from broadcaster import SocketBroadcaster
+from payload_normalizer import payload_normalizer
+from ingest_dedup import SequenceDeduplicator
+from migrations import run_migrations
+from storage import get_storage
+from partitions import SensorPartitions
+from rollups import SensorRollups
+from device_latest import LatestReadings
+from tsengine import TimeSeriesStore, column_values
+import downsample
+from fleet_snapshot import FleetSnapshotService
+from http_cache import DataVersion, HttpCache, READINGS, ALERTS, DEVICES
+from state_channels import StateChannels, ChartTail
+from timeutil import EpochMillis, now_ms, to_ms, from_ms, iso_ms, epoch_seconds
+from pagination import decode_cursor, keyset_page, page_size
+import export
+from log_pipeline import LogPipeline, PayloadRing, sampled
+from ingest_worker import (ROLE_WEB, ROLE_INGEST, DEVICE_STATE_EVENT, MqttEventEmitter, get_role,
+                           subscription_topics, is_internal_topic, decode_internal_event)
+
+# 时间戳转换函数
+def to_local_timestamp(value):
+    """将UTC时间（毫秒时间戳或datetime）转换为秒级时间戳，前端按本地时区（北京时间）显示"""
+    if value is None:
         return time.time()
-    
-    # 如果是字符串，先解析为datetime
-    if isinstance(utc_dt, str):
-        try:
-            # 假设是UTC时间的ISO格式字符串
-            utc_dt = datetime.fromisoformat(utc_dt)
-        except:
-            return time.time()
-    
-    # 确保datetime是timezone-aware的UTC时间
-    if utc_dt.tzinfo is None:
-        utc_dt = utc_dt.replace(tzinfo=timezone.utc)
-    
-    # 转换为北京时间 (UTC+8)
-    beijing_tz = timezone(timedelta(hours=8))
-    local_dt = utc_dt.astimezone(beijing_tz)
-    
-    # 返回时间戳
-    return local_dt.timestamp()
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+    return epoch_seconds(value)
+
+# Configure logging - records are queued and written to stderr by a background thread
+log_pipeline = LogPipeline(level=logging.INFO)
+log_pipeline.start()
+atexit.register(log_pipeline.stop)
 logger = logging.getLogger(__name__)
 
 # Flask application initialization - handle PyInstaller bundled paths
@@ -119,33 +134,138 @@ app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_file.replace('\\', '/'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # MQTT configuration - 使用公网端口映射
-app.config['MQTT_BROKER_URL'] = '2.tcp.vip.cpolar.cn'
-app.config['MQTT_BROKER_PORT'] = 14357
+app.config['MQTT_BROKER_URL'] = os.environ.get('FIRE_ALARM_MQTT_BROKER', '2.tcp.vip.cpolar.cn')
+app.config['MQTT_BROKER_PORT'] = int(os.environ.get('FIRE_ALARM_MQTT_PORT', '14357'))
 app.config['MQTT_USERNAME'] = ''
 app.config['MQTT_PASSWORD'] = ''
 app.config['MQTT_KEEPALIVE'] = 60
 app.config['MQTT_TLS_ENABLED'] = False
 
+# AI决策工作池配置 - 远程AI复核在独立线程中执行
+app.config['AI_DECISION_WORKERS'] = int(os.environ.get('FIRE_ALARM_AI_WORKERS', '2'))
+app.config['AI_DECISION_QUEUE_SIZE'] = 64
+app.config['AI_DECISION_DEADLINE'] = 8.0  # 单次决策截止时间（秒），超时沿用硬件判断
+
+# 传感器写缓冲配置 - 按条数或时间批量入库
+app.config['INGEST_BATCH_ROWS'] = 200
+app.config['INGEST_BATCH_DELAY'] = 0.25  # 秒
+app.config['DEVICE_REGISTRY_FLUSH_INTERVAL'] = 5.0  # 设备状态写回间隔（秒）
+app.config['FLEET_SNAPSHOT_TTL'] = float(os.environ.get('FIRE_ALARM_FLEET_SNAPSHOT_TTL', 1.0))  # 设备快照缓存（秒）
+
+# 轮询接口HTTP缓存 - 数据版本不变时返回304，服务端按 (接口, 参数, 版本) 缓存响应
+app.config['HTTP_CACHE_ENTRIES'] = 256
+app.config['HTTP_CACHE_MAX_AGE'] = 30  # 秒，在线状态等随时间变化的字段最多延迟这么久
+
+# WebSocket合并推送配置 - 同一设备每帧最多推送一次，报警立即发送
+app.config['BROADCAST_FRAME_INTERVAL'] = float(os.environ.get('FIRE_ALARM_BROADCAST_INTERVAL', '0.2'))  # 秒
+app.config['BROADCAST_SERIALIZE_SAMPLE'] = 100  # 每100次发送抽样统计一次各事件的序列化耗时
+
+# 状态通道 - 前端订阅后收到一次快照和之后的增量（设备/从机/实时曲线/连接状态），不再定时轮询
+app.config['STATE_CHANNEL_INTERVAL'] = float(os.environ.get('FIRE_ALARM_STATE_CHANNEL_INTERVAL', '1.0'))  # 检查间隔（秒）
+app.config['CHART_TAIL_POINTS'] = 20  # 实时曲线保留的采样点数
+app.config['CHART_SAMPLE_INTERVAL'] = 5.0  # 实时曲线采样间隔（秒）
+
+# 原始载荷缓冲 - 每个设备保留最近N条MQTT原始数据，供 /api/admin/payloads 排查问题
+app.config['RAW_PAYLOAD_HISTORY'] = 50
+
+# 运行角色 - all: 单进程（默认）; web: 只提供前端和查询; ingest: 只接收数据（见 ingest_worker.py）
+app.config['FIRE_ALARM_ROLE'] = get_role()
+app.config['INGEST_SHARE_GROUP'] = os.environ.get('FIRE_ALARM_INGEST_GROUP', 'fire_alarm_ingest')
+
+# MQTT至少一次投递 - QoS 1订阅 + 持久会话（断线/重启期间的消息由broker保留），重复投递按序号去重
+# 持久会话要求客户端ID固定；多个接收工作进程需各自设置 FIRE_ALARM_WORKER_ID
+app.config['MQTT_QOS'] = 1
+app.config['MQTT_CLEAN_SESSION'] = False
+app.config['MQTT_CLIENT_ID'] = os.environ.get('FIRE_ALARM_MQTT_CLIENT_ID') or \
+    f"fire_alarm_{app.config['FIRE_ALARM_ROLE']}_{socket.gethostname()}_{os.environ.get('FIRE_ALARM_WORKER_ID', '0')}"
+app.config['DEDUP_WINDOW'] = 256  # 每个设备记住的最近消息数
+
+# SQLite存储层 - WAL模式，批量写入走唯一的写连接，分析与查询共用只读连接池
+app.config['SQLITE_READERS'] = int(os.environ.get('FIRE_ALARM_SQLITE_READERS', '4'))
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('FIRE_ALARM_SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = 5000
+app.config['SQLITE_MMAP_SIZE'] = 256 * 1024 * 1024
+app.config['SQLITE_CACHE_KB'] = 32768  # 每个连接的页缓存
+
+storage = get_storage(db_file, readers=app.config['SQLITE_READERS'], pragmas={
+    'synchronous': app.config['SQLITE_SYNCHRONOUS'],
+    'busy_timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'],
+    'mmap_size': app.config['SQLITE_MMAP_SIZE'],
+    'cache_size': -app.config['SQLITE_CACHE_KB']
+})
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = storage.engine_options()
+# 查询接口的ORM读取使用只读连接（query_only），与写入使用的连接分开
+READONLY_BIND = 'readonly'
+app.config['SQLALCHEMY_BINDS'] = {
+    READONLY_BIND: dict(storage.engine_options(readonly=True), url=app.config['SQLALCHEMY_DATABASE_URI'])
+}
+
+# 数据保留 - 传感器数据按天（或按周）分区，过期后整个分区删除
+app.config['SENSOR_PARTITION_PERIOD'] = os.environ.get('FIRE_ALARM_PARTITION_PERIOD', 'day')  # day / week
+app.config['SENSOR_RETENTION_DAYS'] = 30
+app.config['ALERT_RETENTION_DAYS'] = 90
+app.config['ALERT_PRUNE_BATCH'] = 1000  # 报警记录分批删除，每批一个短事务
+
+# 汇总表 - 入库时维护按设备的1分钟/1小时/1天聚合，历史接口按窗口和点数上限选择分辨率
+app.config['HISTORY_MAX_POINTS'] = 500  # 每个设备的默认最大点数
+app.config['HISTORY_DOWNSAMPLE'] = os.environ.get('FIRE_ALARM_HISTORY_DOWNSAMPLE', 'lttb')  # lttb / minmax / none
+app.config['ROLLUP_RETENTION_DAYS'] = {'1m': 30, '1h': 365, '1d': None}  # None 表示永久保留
+
+# 列式时序存储 - 按设备压缩分块保存原始读数，智能分析与原始分辨率历史曲线从这里读取
+app.config['SENSOR_SERIES_CHUNK_ROWS'] = int(os.environ.get('FIRE_ALARM_SERIES_CHUNK_ROWS', 512))
+app.config['SENSOR_SERIES_RETENTION_DAYS'] = 365
+
+# 原始数据分页 - /api/data/range、/api/sensor/history 按 (timestamp, id) 游标分页，每页条数有上限
+app.config['PAGE_DEFAULT_ROWS'] = 500
+app.config['PAGE_MAX_ROWS'] = int(os.environ.get('FIRE_ALARM_PAGE_MAX_ROWS', 5000))
+
 # Initialize extensions with simple configuration
 db = SQLAlchemy(app)
-CORS(app)
+# 跨域的前端（如小程序、桌面端）需要读取分页游标响应头
+CORS(app, expose_headers=['X-Next-Cursor'])
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
-# MQTT client setup
-mqtt_client = mqtt.Client()
+ROLE = app.config['FIRE_ALARM_ROLE']
+INGESTS_DATA = ROLE != ROLE_WEB  # web 角色不做数据接收
+
+# AI decision worker pool
+decision_pool = AlarmDecisionPool(
+    workers=app.config['AI_DECISION_WORKERS'],
+    queue_size=app.config['AI_DECISION_QUEUE_SIZE'],
+    deadline=app.config['AI_DECISION_DEADLINE']
+)
+if INGESTS_DATA:
+    decision_pool.start()
+
+# Last raw MQTT payloads per device (dumped on demand instead of logged per message)
+raw_payloads = PayloadRing(per_device=app.config['RAW_PAYLOAD_HISTORY'])
+
+# MQTT client setup (fixed client id + persistent session)
+mqtt_client = mqtt.Client(client_id=app.config['MQTT_CLIENT_ID'],
+                          clean_session=app.config['MQTT_CLEAN_SESSION'])
+
+# Redelivery dedup and per-device gap counting for QoS 1
+sequence_dedup = SequenceDeduplicator(window=app.config['DEDUP_WINDOW'])
+
+# Coalescing WebSocket broadcaster; ingest workers hand their frames to the web process over MQTT
+broadcaster = SocketBroadcaster(
+    MqttEventEmitter(mqtt_client) if ROLE == ROLE_INGEST else socketio,
+    frame_interval=app.config['BROADCAST_FRAME_INTERVAL'],
+    serialize_sample=app.config['BROADCAST_SERIALIZE_SAMPLE']
+)
+broadcaster.start()
 
 # Eventlet handles concurrency automatically
 
 def on_connect(client, userdata, flags, rc):
     """MQTT连接回调"""
-    logger.info(f"MQTT连接成功，返回码: {rc}")
+    logger.info(f"MQTT连接成功，返回码: {rc}, 会话保留: {bool(flags.get('session present'))}")
     logger.info(f"Connected to broker: {app.config['MQTT_BROKER_URL']}:{app.config['MQTT_BROKER_PORT']}")
-    # 订阅主题
-    client.subscribe('esp32/+/data/json')
-    client.subscribe('esp32/+/alert/#')
-    client.subscribe('esp32/+/status/#')
-    client.subscribe('esp32/+/control')  # 添加控制主题订阅
-    logger.info("MQTT主题订阅: esp32/+/data/json, esp32/+/alert/#, esp32/+/status/#, esp32/+/control")
+    # 订阅主题（按运行角色：设备主题 / 共享订阅 / 内部事件主题）
+    topics = subscription_topics(ROLE, app.config['INGEST_SHARE_GROUP'])
+    for topic in topics:
+        client.subscribe(topic, qos=app.config['MQTT_QOS'])
+    logger.info(f"MQTT主题订阅({ROLE}): {', '.join(topics)}")
 
 def on_disconnect(client, userdata, rc):
     """MQTT断开连接回调"""
@@ -161,17 +281,20 @@ def on_message(client, userdata, msg):
         topic = msg.topic
         payload = msg.payload.decode('utf-8') if isinstance(msg.payload, bytes) else msg.payload
 
-        logger.info(f"收到MQTT消息 - 主题: {topic}, 内容: {payload}")
-        logger.info(f"消息详情 - 主题长度: {len(topic)}, 内容长度: {len(payload)}")
+        # Web进程：接收工作进程发布的内部事件
+        if is_internal_topic(topic):
+            process_internal_event(*decode_internal_event(topic, payload))
+            return
+
+        # 主题格式 esp32/<设备ID>/...，按设备保存原始载荷
+        topic_parts = topic.split('/')
+        raw_payloads.record(topic_parts[1] if len(topic_parts) > 1 else topic, topic, payload)
 
         # 在Flask应用上下文中处理数据
         with app.app_context():
             if '/data/json' in topic:
-                logger.info("处理传感器数据消息...")
-                # 处理传感器数据
-                data = json.loads(payload)
-                logger.info(f"解析的传感器数据: {data}")
-                process_sensor_data(data)
+                # 处理传感器数据（格式按主题缓存，不再逐条打印整条数据）
+                process_sensor_data(json.loads(payload), topic)
 
             elif '/alert/' in topic:
                 logger.info("处理警报数据消息...")
@@ -189,7 +312,8 @@ def on_message(client, userdata, msg):
                 logger.info(f"收到未处理主题的消息: {topic}")
 
     except json.JSONDecodeError as e:
-        logger.error(f"JSON解析错误: {e}, 内容: {payload}")
+        # 原始内容已保存在载荷缓冲中，可通过 /api/admin/payloads 查看
+        logger.error(f"JSON解析错误({topic}): {e}", extra=sampled(('json_error', topic)))
     except Exception as e:
         logger.error(f"处理MQTT消息错误: {e}")
         logger.error(f"错误详情: {str(e)}")
@@ -200,15 +324,6 @@ mqtt_client.on_connect = on_connect
 mqtt_client.on_disconnect = on_disconnect
 mqtt_client.on_message = on_message
 
-# 连接MQTT broker
-try:
-    logger.info("正在连接MQTT broker...")
-    mqtt_client.connect(app.config['MQTT_BROKER_URL'], app.config['MQTT_BROKER_PORT'], 60)
-    mqtt_client.loop_start()
-    logger.info("MQTT客户端启动")
-except Exception as e:
-    logger.error(f"MQTT连接失败: {e}")
-
 # Database models
 class SensorData(db.Model):
     """Sensor data model"""
@@ -221,7 +336,7 @@ class SensorData(db.Model):
     humidity = db.Column(db.Float)
     light_level = db.Column(db.Float)  # 光照传感器
     alert_status = db.Column(db.Boolean, default=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(EpochMillis, default=now_ms)  # UTC毫秒，见 timeutil.py
 
 class AlertHistory(db.Model):
     """Alert history model"""
@@ -235,9 +350,22 @@ class AlertHistory(db.Model):
     humidity = db.Column(db.Float)
     light_level = db.Column(db.Float)  # 光照传感器
     location = db.Column(db.String(100))
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(EpochMillis, default=now_ms)
     resolved = db.Column(db.Boolean, default=False)
-    resolved_time = db.Column(db.DateTime)
+    resolved_time = db.Column(EpochMillis)
+
+class DeviceLatest(db.Model):
+    """Latest sensor reading per device, upserted by ingest (see device_latest.py)"""
+    __tablename__ = 'device_latest'
+    device_id = db.Column(db.String(50), primary_key=True)
+    device_type = db.Column(db.String(20))
+    flame_value = db.Column(db.Integer)
+    smoke_value = db.Column(db.Integer)
+    temperature = db.Column(db.Float)
+    humidity = db.Column(db.Float)
+    light_level = db.Column(db.Float)
+    alert_status = db.Column(db.Boolean)
+    timestamp = db.Column(EpochMillis)
 
 class DeviceInfo(db.Model):
     """Device information model"""
@@ -253,235 +381,388 @@ class DeviceInfo(db.Model):
     config = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-# Create database tables
+# Create database tables, then bring indexes/schema up to the latest version
 with app.app_context():
     db.create_all()
+schema_before, schema_after = run_migrations(db_file, partition_period=app.config['SENSOR_PARTITION_PERIOD'])
+if schema_before != schema_after:
+    logger.info(f"数据库结构已升级: v{schema_before} -> v{schema_after}")
 
-# MQTT连接已通过paho-mqtt直接处理
+# Router for the time-partitioned sensor_data tables
+sensor_partitions = SensorPartitions(storage, period=app.config['SENSOR_PARTITION_PERIOD'])
 
-def process_sensor_data(data):
-    """Process sensor data with thread safety"""
+@contextmanager
+def read_session():
+    """查询接口使用的只读ORM会话（SQLALCHEMY_BINDS 中的只读引擎），用法与 db.session 相同"""
+    session = Session(db.engines[READONLY_BIND])
     try:
-        # Debug logging to see available keys
-        logger.info(f"Processing sensor data. Keys: {list(data.keys())}")
-        if 'data' in data and isinstance(data['data'], dict):
-             logger.info(f"Nested data keys: {list(data['data'].keys())}")
-
-        device_id = data.get('device_id', 'unknown')
-
-        # Check if this is slave data (contains slave_id or sensors with slave structure)
-        is_slave_data = False
-        slave_id = None
-
-        # Initialize sensor values
-        flame_value = 0
-        smoke_value = 0
-        alert_status = False
-
-        if 'slave_id' in data:
-            # This is slave data sent directly from slave
-            is_slave_data = True
-            slave_id = data['slave_id']
-            device_id = slave_id  # Use slave_id as device_id
-            logger.info(f"Processing slave data from {slave_id}")
-
-            # Extract sensor values from slave structure
-            if 'sensors' in data and 'flame' in data['sensors']:
-                flame_sensor = data['sensors']['flame']
-                flame_value = flame_sensor.get('analog', 1200)
-
-            if 'sensors' in data and 'mq2_smoke' in data['sensors']:
-                mq2_sensor = data['sensors']['mq2_smoke']
-                smoke_value = mq2_sensor.get('analog', 1800)
-
-            alert_status = data.get('overall_status') in ['alarm', 'warning']
-
-        elif 'sensors' in data and 'flame' in data['sensors'] and 'mq2_smoke' in data['sensors']:
-            # This is slave data forwarded by master
-            is_slave_data = True
-            slave_id = data.get('slave_id', device_id)
-            device_id = slave_id
-
-            # Extract sensor values from slave structure
-            flame_sensor = data['sensors']['flame']
-            mq2_sensor = data['sensors']['mq2_smoke']
-
-            flame_value = flame_sensor.get('analog', 1200)
-            smoke_value = mq2_sensor.get('analog', 1800)
-            alert_status = data.get('overall_status') in ['alarm', 'warning']
+        yield session
+    finally:
+        session.close()
 
-        else:
-            # This is master data
-            # Check for nested 'data' field which is common in some JSON formats
-            source_data = data
-            if 'data' in data and isinstance(data['data'], dict):
-                logger.info("Detected nested 'data' field, checking for values there as well")
-                source_data = data['data']
-            
-            flame_value = data.get('flame', source_data.get('flame', 0))
-            smoke_value = data.get('smoke', source_data.get('smoke', 0))
-            alert_status = data.get('alert', source_data.get('alert', False))
-
-        # 获取光照传感器数值 (兼容多种键名)
-        light_value = data.get('light')
-        if light_value is None:
-            light_value = data.get('light_level')
-        if light_value is None:
-            light_value = data.get('lux')
-        if light_value is None:
-            light_value = data.get('illuminance')
-            
-        # Also check nested data if available
-        if light_value is None and 'data' in data and isinstance(data['data'], dict):
-            nested_data = data['data']
-            light_value = nested_data.get('light')
-            if light_value is None:
-                light_value = nested_data.get('light_level')
-            if light_value is None:
-                light_value = nested_data.get('lux')
-
-        logger.info(f"DEBUG: Extracted light_value: {light_value} (Type: {type(light_value)})")
-        if light_value is None:
-             logger.warning(f"DEBUG: Failed to extract light value from data: {data}")
+def sensor_data_between(start=None, end=None):
+    """只联合与时间窗口重叠的分区的 SensorData 实体，用法与 SensorData 相同"""
+    return aliased(SensorData, sensor_partitions.range_selectable(SensorData.__table__.columns, start, end),
+                   adapt_on_names=True)
+
+# Per-device 1m/1h/1d rollups, maintained in the same transaction as the raw insert
+sensor_rollups = SensorRollups(storage, max_points=app.config['HISTORY_MAX_POINTS'])
+
+# Latest reading per device, so "current value" endpoints never sort history
+latest_readings = LatestReadings()
+
+# Compressed per-device column chunks, appended in the same transaction as the raw insert
+sensor_series = TimeSeriesStore(storage, chunk_rows=app.config['SENSOR_SERIES_CHUNK_ROWS'])
+intelligent_analyzer.series = sensor_series
+
+# Data versions bumped per resource by the write paths; polled endpoints answer 304 while
+# the resources they read (readings of one device, alerts, device metadata) are unchanged
+data_version = DataVersion()
+http_cache = HttpCache(data_version, max_entries=app.config['HTTP_CACHE_ENTRIES'])
+
+def polled_on(*resources):
+    """Cache decorator for a polled endpoint that only reads the given resources"""
+    return http_cache.cached(max_age=app.config['HTTP_CACHE_MAX_AGE'], resources=resources or None)
+
+# In-memory device registry, loaded once and written back in bulk
+device_registry = DeviceRegistry(flush_interval=app.config['DEVICE_REGISTRY_FLUSH_INTERVAL'])
+with app.app_context():
+    device_registry.load(DeviceInfo.query.all())
+
+# All devices with latest reading, built in one query and cached briefly; metadata comes from the registry
+fleet_snapshots = FleetSnapshotService(storage, ttl=app.config['FLEET_SNAPSHOT_TTL'], registry=device_registry)
+
+# Materialized latest state per device, seeded once from the fleet snapshot
+device_state = DeviceStateView()
+fleet = fleet_snapshots.current()
+device_state.load([device for device in fleet if device.has_reading],
+                  {device.device_id: device.location for device in fleet})
+
+# Server-side state channels: one snapshot on subscribe, then per-channel patches
+state_channels = StateChannels(socketio, data_version, interval=app.config['STATE_CHANNEL_INTERVAL'])
+state_channels.register('devices', lambda: {device['device_id']: device for device in device_state.snapshot()},
+                        max_age=1.0)
+state_channels.register('slaves', lambda: {slave['device_id']: slave for slave in online_slave_entries()},
+                        max_age=10.0)
+state_channels.register('chart', ChartTail(device_state.snapshot, points=app.config['CHART_TAIL_POINTS'],
+                                           interval=app.config['CHART_SAMPLE_INTERVAL']),
+                        max_age=app.config['CHART_SAMPLE_INTERVAL'], keep_warm=True)
+state_channels.register('connection', lambda: connection_status(), max_age=5.0)
+
+# Write-behind buffer for sensor readings (flushed in batches by a background thread)
+ingest_buffer = SensorIngestBuffer(
+    lambda rows: flush_sensor_rows(rows),
+    max_rows=app.config['INGEST_BATCH_ROWS'],
+    max_delay=app.config['INGEST_BATCH_DELAY']
+)
+
+# MQTT连接已通过paho-mqtt直接处理
+
+def process_sensor_data(data, source='http'):
+    """Process sensor data with thread safety
+
+    Args:
+        data: Parsed JSON payload (master, slave or forwarded slave format)
+        source: Where the payload came from (MQTT topic / http), used to cache the payload shape
+    """
+    try:
+        # Shape is detected once per source, later messages go through the cached extractor
+        reading = payload_normalizer.normalize(source, data)
+        if reading is None:
+            return
+
+        # QoS 1 may redeliver a message, drop readings that were already processed
+        if not sequence_dedup.accept(reading.device_id, reading.sequence, reading.device_timestamp,
+                                     (reading.flame, reading.smoke, reading.temperature,
+                                      reading.humidity, reading.light)):
+            return
+
+        device_id = reading.device_id
+        is_slave_data = reading.is_slave
+        flame_value = reading.flame
+        smoke_value = reading.smoke
+        alert_status = reading.alert
+        light_value = reading.light
 
         # 准备传感器数据用于AI分析
         sensor_data_for_ai = {
             'flame_value': flame_value,
             'smoke_value': smoke_value,
-            'temperature': data.get('temperature'),
-            'humidity': data.get('humidity'),
+            'temperature': reading.temperature,
+            'humidity': reading.humidity,
             'light_level': light_value
         }
 
         # 获取硬件阈值判断结果（从数据中推断）
         hardware_result = 'alarm' if alert_status else 'normal'
-        if data.get('overall_status') == 'warning':
+        if reading.overall_status == 'warning':
             hardware_result = 'warning'
 
-        # AI辅助决策分析
-        try:
-            ai_decision = ai_assisted_alarm_decision(device_id, sensor_data_for_ai, hardware_result)
-
-            # 使用AI决策结果更新alert_status
-            final_alert_status = ai_decision['final_result'] in ['warning', 'alarm']
-
-            logger.info(f"AI决策 - 设备:{device_id}, 硬件:{hardware_result} -> AI:{ai_decision['final_result']}, 置信度:{ai_decision['confidence']:.2f}, 干预:{ai_decision['intervention']}")
+        # AI辅助决策：硬件判断正常时本地直接给出结论（无远程调用）；
+        # 警告/报警需要远程AI复核，交给决策工作池异步处理，避免阻塞MQTT网络线程
+        ai_decision = None
+        ai_pending = hardware_result != 'normal'
+        final_alert_status = alert_status
+        if not ai_pending:
+            try:
+                ai_decision = ai_assisted_alarm_decision(device_id, sensor_data_for_ai, hardware_result)
+                final_alert_status = ai_decision['final_result'] in ['warning', 'alarm']
+            except Exception as e:
+                logger.error(f"AI决策分析失败: {e}")
 
-            # 如果AI干预了硬件判断，记录特殊日志
-            if ai_decision['intervention']:
-                logger.warning(f"AI干预报警决策 - 设备:{device_id}, 原因:{ai_decision['reasoning']}")
+        # 放入写缓冲，由后台线程批量入库（一个批次一次提交）
+        device_type = 'slave' if is_slave_data else 'master'
+        record_time = now_ms()
+        ingest_buffer.append({
+            'device_id': device_id,
+            'device_type': device_type,
+            'flame_value': flame_value,
+            'smoke_value': smoke_value,
+            'temperature': reading.temperature,
+            'humidity': reading.humidity,
+            'light_level': light_value,  # 光照传感器数据
+            'alert_status': final_alert_status,  # 先按硬件判断保存，AI复核完成后回写
+            'timestamp': record_time
+        })
 
-        except Exception as e:
-            logger.error(f"AI决策分析失败: {e}")
-            # AI失败时使用原始硬件判断
-            final_alert_status = alert_status
-            ai_decision = None
-
-        # Save to database
-        sensor_data = SensorData(
-            device_id=device_id,
-            device_type='slave' if is_slave_data else 'master',
-            flame_value=flame_value,
-            smoke_value=smoke_value,
-            temperature=data.get('temperature'),
-            humidity=data.get('humidity'),
-            light_level=light_value,  # 光照传感器数据
-            alert_status=final_alert_status  # 使用AI决策后的结果
+        # Update device status in memory, written back to device_info periodically
+        if device_registry.touch(
+            device_id, device_type, from_ms(record_time),
+            name=reading.name,
+            location=reading.location,
+            master_id=reading.master_id
+        ):
+            fleet_snapshots.invalidate()  # newly registered device appears in the next snapshot
+            data_version.bump(DEVICES)
+
+        # Update materialized device state in O(1) and push only this device's delta
+        location = device_registry.get(device_id).location
+        state = device_state.update(
+            device_id, device_type, location,
+            flame_value, smoke_value, reading.temperature, reading.humidity,
+            light_value, final_alert_status, record_time
         )
-        db.session.add(sensor_data)
-
-        # Update device status
-        device = DeviceInfo.query.filter_by(device_id=device_id).first()
-        if device:
-            device.last_seen = datetime.utcnow()
-            device.status = 'online'
-            device.device_type = 'slave' if is_slave_data else 'master'
-        else:
-            # Create new device record
-            device_name = data.get('name', f"ESP32-{device_id}")
-            device_location = data.get('location', 'Dormitory')
-            device_type = 'slave' if is_slave_data else 'master'
+        if state:
+            send_device_update_to_ui(state)
 
-            device = DeviceInfo(
-                device_id=device_id,
-                name=device_name,
-                location=device_location,
-                device_type=device_type,
-                master_id=data.get('master_id') if is_slave_data else None,
-                last_seen=datetime.utcnow(),
-                status='online'
-            )
-            db.session.add(device)
+        # Ingest workers also hand the raw state to the web process, which keeps its own view
+        if ROLE == ROLE_INGEST:
+            publish_device_state(device_id, device_type, reading.name, location, reading.master_id,
+                                 flame_value, smoke_value, reading.temperature, reading.humidity,
+                                 light_value, final_alert_status, record_time)
 
-        db.session.commit()
+        if ai_pending:
+            decision_pool.submit(device_id, sensor_data_for_ai, hardware_result, apply_ai_decision,
+                                 context={'timestamp': record_time, 'is_slave': is_slave_data})
 
         # Prepare data for frontend
         frontend_data = {
             'device_id': device_id,
-            'device_type': 'slave' if is_slave_data else 'master',
+            'device_type': device_type,
             'flame': flame_value,
             'smoke': smoke_value,
-            'temperature': data.get('temperature'),
-            'humidity': data.get('humidity'),
+            'temperature': reading.temperature,
+            'humidity': reading.humidity,
             'light': light_value,
             'light_level': light_value,  # Ensure frontend receives 'light_level'
             'alert': final_alert_status,  # 使用AI决策后的结果
             'hardware_alert': alert_status,  # 保留原始硬件判断
-            'timestamp': datetime.utcnow().isoformat(),
-            'slave_name': data.get('slave_name') if is_slave_data else None,
-            'slave_location': data.get('slave_location') if is_slave_data else None,
-            'overall_status': ai_decision['final_result'] if ai_decision else (data.get('overall_status', 'normal' if not final_alert_status else 'alarm')),
+            'timestamp': iso_ms(record_time),
+            'slave_name': reading.slave_name,
+            'slave_location': reading.slave_location,
+            'overall_status': ai_decision['final_result'] if ai_decision else (reading.overall_status or ('normal' if not final_alert_status else 'alarm')),
             'ai_decision': {
+                'pending': ai_pending,
                 'intervention': ai_decision['intervention'] if ai_decision else False,
                 'confidence': ai_decision['confidence'] if ai_decision else 0.5,
-                'reasoning': ai_decision['reasoning'] if ai_decision else 'No AI analysis'
+                'reasoning': ai_decision['reasoning'] if ai_decision else ('AI复核中' if ai_pending else 'No AI analysis')
             }
         }
 
-        # Real-time push to frontend via WebSocket (for old UI)
-        socketio.emit('sensor_data', frontend_data)
-
-        # Send device update to 5-layer architecture UI
-        send_device_update_to_ui(device_id)
+        # Real-time push to frontend via WebSocket (for old UI), coalesced per device per frame
+        broadcaster.publish('sensor_data', frontend_data, key=device_id)
 
         # Special handling for slave data
         if is_slave_data:
-            socketio.emit('slave_data_update', frontend_data)
-            logger.info(f"Slave data saved and pushed: {device_id}")
-        else:
-            logger.info(f"Master data saved and pushed: {device_id}")
+            broadcaster.publish('slave_data_update', frontend_data, key=device_id)
 
     except Exception as e:
-        logger.error(f"Error processing sensor data: {e}")
-        logger.error(f"Data content: {data}")
-        db.session.rollback()
+        logger.error(f"Error processing sensor data from {source}: {e}", extra=sampled(('ingest_error', source)))
+
+def flush_sensor_rows(rows):
+    """批量写入传感器数据（写缓冲后台线程调用），按时间写入各自的分区，并在同一事务中更新汇总表、最新读数和时序分块"""
+    sensor_partitions.write(rows, in_transaction=(sensor_rollups.apply, latest_readings.apply,
+                                                 sensor_series.append))
+    data_version.bump(READINGS, devices={row['device_id'] for row in rows})
+
+def flush_device_rows(rows):
+    """批量写回设备注册表中的变更（注册表后台线程调用）"""
+    device_table = DeviceInfo.__table__
+    statement = sqlite_insert(device_table).values(rows)
+    # 已存在的设备只更新运行状态，名称/位置等登记信息保持不变
+    statement = statement.on_conflict_do_update(
+        index_elements=[device_table.c.device_id],
+        set_={
+            'last_seen': statement.excluded.last_seen,
+            'status': statement.excluded.status,
+            'device_type': statement.excluded.device_type
+        }
+    )
+    with storage.write() as conn:
+        conn.execute(statement)
+    fleet_snapshots.invalidate()
+    # Only last_seen/status change here, they follow the readings; registrations bumped DEVICES when touched
+    data_version.bump(READINGS, devices={row['device_id'] for row in rows})
+
+def publish_device_state(device_id, device_type, name, location, master_id, flame, smoke, temperature,
+                         humidity, light_level, alert, updated_at):
+    """Hand a device's state to the web process (ingest role), applied there by process_internal_event"""
+    broadcaster.publish(DEVICE_STATE_EVENT, {
+        'device_id': device_id,
+        'device_type': device_type,
+        'name': name,
+        'location': location,
+        'master_id': master_id,
+        'flame': flame,
+        'smoke': smoke,
+        'temperature': temperature,
+        'humidity': humidity,
+        'light_level': light_level,
+        'alert': alert,
+        'updated_at': updated_at
+    }, key=device_id)
+
+def apply_ai_decision(decision, context):
+    """AI决策完成后回写传感器记录并推送前端（在决策工作线程中执行）"""
+    try:
+        device_id = decision['device_id']
+        final_alert_status = decision['final_result'] in ['warning', 'alarm']
 
-def send_device_update_to_ui(device_id):
-    """Send device status update to 5-layer architecture UI"""
+        # 记录还在写缓冲中则直接修改，否则按 (device_id, timestamp) 回写数据库
+        patched = ingest_buffer.patch(
+            lambda row: row['device_id'] == device_id and row['timestamp'] == context['timestamp'],
+            {'alert_status': final_alert_status}
+        )
+        if not patched:
+            with storage.write() as conn:
+                previous = sensor_partitions.set_alert_status(conn, device_id, context['timestamp'], final_alert_status)
+                if previous is not None and previous != final_alert_status:
+                    sensor_rollups.adjust_alerts(conn, device_id, context['timestamp'], 1 if final_alert_status else -1)
+                    latest_readings.set_alert_status(conn, device_id, context['timestamp'], final_alert_status)
+            data_version.bump(READINGS, devices=(device_id,))
+
+        # 设备状态仍是这条记录时更新为最终报警状态，并推送设备更新（之后到达的新数据不被覆盖）
+        current = device_state.get(device_id)
+        if current is not None and current.updated_at == context['timestamp'] and current.alert != final_alert_status:
+            state = device_state.update(
+                device_id, current.device_type, current.location,
+                current.flame, current.smoke, current.temperature, current.humidity,
+                current.light_level, final_alert_status, current.updated_at
+            )
+            if state:
+                send_device_update_to_ui(state)
+                if ROLE == ROLE_INGEST:
+                    device = device_registry.get(device_id)
+                    publish_device_state(device_id, state.device_type, device.name if device else None,
+                                         state.location, device.master_id if device else None,
+                                         state.flame, state.smoke, state.temperature, state.humidity,
+                                         state.light_level, final_alert_status, state.updated_at)
+
+        logger.info(f"AI决策 - 设备:{device_id}, 硬件:{decision['hardware_result']} -> AI:{decision['final_result']}, 置信度:{decision['confidence']:.2f}, 干预:{decision['intervention']}",
+                    extra=sampled(('ai_decision_applied', device_id)))
+
+        # 如果AI干预了硬件判断，记录特殊日志
+        if decision['intervention']:
+            logger.warning(f"AI干预报警决策 - 设备:{device_id}, 原因:{decision['reasoning']}",
+                           extra=sampled(('ai_intervention', device_id)))
+
+        broadcaster.publish('ai_decision', {
+            'device_id': device_id,
+            'device_type': 'slave' if context['is_slave'] else 'master',
+            'record_timestamp': iso_ms(context['timestamp']),
+            'alert': final_alert_status,
+            'overall_status': decision['final_result'],
+            'hardware_result': decision['hardware_result'],
+            'ai_decision': {
+                'pending': False,
+                'fallback': decision.get('fallback', False),
+                'intervention': decision['intervention'],
+                'confidence': decision['confidence'],
+                'reasoning': decision['reasoning']
+            },
+            'timestamp': datetime.utcnow().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"Error applying AI decision: {e}")
+
+def send_device_update_to_ui(state):
+    """Send the changed device's state to 5-layer architecture UI"""
     try:
-        with app.app_context():
-            devices_data = get_devices().get_json()
-            socketio.emit('devices_update', devices_data)
-
-            # Check if this device has alarm condition
-            for device_data in devices_data:
-                if device_data['device_id'] == device_id and device_data['status'] == '警报':
-                    # Send alarm notification
-                    alarm_data = {
-                        'timestamp': time.time(),
-                        'device_id': device_data['device_id'],
-                        'location': device_data['location'],
-                        'temperature': device_data['temperature'],
-                        'smoke_level': device_data['smoke_level'],
-                        'status': '警报',
-                        'message': f"{device_data['location']} 检测到火灾风险！"
-                    }
-                    socketio.emit('alarm', alarm_data)
-                    break
+        # Slave devices are listed by /api/slaves, not in the device list
+        if state.device_type == 'slave':
+            return
+
+        device_data = state.to_dict()
+        broadcaster.publish('devices_update', [device_data], key=device_data['device_id'])
+
+        # Check if this device has alarm condition
+        if device_data['status'] == '警报':
+            # Send alarm notification
+            alarm_data = {
+                'timestamp': time.time(),
+                'device_id': device_data['device_id'],
+                'location': device_data['location'],
+                'temperature': device_data['temperature'],
+                'smoke_level': device_data['smoke_level'],
+                'status': '警报',
+                'message': f"{device_data['location']} 检测到火灾风险！"
+            }
+            broadcaster.urgent('alarm', alarm_data)
 
     except Exception as e:
         logger.error(f"Error sending device update to UI: {e}")
 
+def process_internal_event(event, data):
+    """Apply an event published by an ingest worker (web role)"""
+    try:
+        if event != broadcaster.batch_event:
+            # Alarms and other immediate events are forwarded as-is; the worker may have written
+            # anything for them, so every cached response of this process is invalidated
+            data_version.bump()
+            broadcaster.urgent(event, data)
+            return
+
+        # Readings (and AI verdicts) written by ingest workers only invalidate those devices
+        changed = {entry['device_id'] for entry in data.get(DEVICE_STATE_EVENT, [])}
+        changed.update(payload['device_id'] for payloads in data.values() for payload in payloads
+                       if isinstance(payload, dict) and payload.get('device_id'))
+        data_version.bump(READINGS, devices=changed)
+
+        # Device state entries keep this process's view current and are not forwarded to browsers
+        for entry in data.pop(DEVICE_STATE_EVENT, []):
+            updated_at = entry['updated_at']
+            if device_registry.touch(
+                entry['device_id'], entry['device_type'], from_ms(updated_at),
+                name=entry['name'], location=entry['location'], master_id=entry['master_id']
+            ):
+                fleet_snapshots.invalidate()
+                data_version.bump(DEVICES)
+            # Workers may deliver a device's readings out of order, older states are ignored
+            device_state.update(
+                entry['device_id'], entry['device_type'], entry['location'],
+                entry['flame'], entry['smoke'], entry['temperature'], entry['humidity'],
+                entry['light_level'], entry['alert'], updated_at
+            )
+
+        # Frames from several workers are merged into this process's frames
+        for name, payloads in data.items():
+            for payload in payloads:
+                broadcaster.publish(name, payload)
+
+    except Exception as e:
+        logger.error(f"Error processing internal event {event}: {e}", extra=sampled(('internal_event_error', event)))
+
 def process_alert_data(alert_data):
     """Process alert data"""
     try:
@@ -489,20 +770,20 @@ def process_alert_data(alert_data):
         data = alert_data.get('data', {})
         device_id = data.get('device_id') or alert_data.get('device_id')
 
-        # Save alert record
-        alert = AlertHistory(
-            device_id=device_id,
-            alert_type=alert_data.get('type', 'unknown'),
-            severity=alert_data.get('level', 'medium'),
-            flame_value=data.get('flame'),
-            smoke_value=data.get('smoke'),
-            temperature=data.get('temperature'),
-            humidity=data.get('humidity'),
-            light_level=data.get('light'),
-            location=data.get('location', alert_data.get('location', 'Unknown location'))
-        )
-        db.session.add(alert)
-        db.session.commit()
+        # Save alert record (through the single writer connection, like sensor data)
+        with storage.write() as conn:
+            conn.execute(AlertHistory.__table__.insert().values(
+                device_id=device_id,
+                alert_type=alert_data.get('type', 'unknown'),
+                severity=alert_data.get('level', 'medium'),
+                flame_value=data.get('flame'),
+                smoke_value=data.get('smoke'),
+                temperature=data.get('temperature'),
+                humidity=data.get('humidity'),
+                light_level=data.get('light'),
+                location=data.get('location', alert_data.get('location', 'Unknown location'))
+            ))
+        data_version.bump(ALERTS)
 
         # Push alert information to frontend
         alarm_data = {
@@ -515,14 +796,13 @@ def process_alert_data(alert_data):
             'message': alert_data.get('message', f"设备 {device_id} 检测到异常！")
         }
 
-        # Send alarm notification to frontend
-        socketio.emit('alarm', alarm_data)
+        # Send alarm notification to frontend immediately
+        broadcaster.urgent('alarm', alarm_data)
         logger.warning(f"Alert record created and notification sent: {device_id} - {alert_data.get('type')}")
 
     except Exception as e:
         logger.error(f"Error processing alert data: {e}")
         logger.error(f"Alert data content: {alert_data}")
-        db.session.rollback()
 
 def process_control_data(control_data, topic):
     """Process control command data"""
@@ -538,16 +818,16 @@ def process_control_data(control_data, topic):
             if action == 'on':
                 logger.info("舵机开启命令 - 转到180度")
                 # 这里可以选择记录日志或发送到前端
-                socketio.emit('servo_status', {'status': 'on', 'angle': 180})
+                broadcaster.urgent('servo_status', {'status': 'on', 'angle': 180})
 
             elif action == 'off':
                 logger.info("舵机关闭命令 - 转到0度")
-                socketio.emit('servo_status', {'status': 'off', 'angle': 0})
+                broadcaster.urgent('servo_status', {'status': 'off', 'angle': 0})
 
             elif action == 'test' and 'angle' in control_data:
                 angle = control_data.get('angle', 0)
                 logger.info(f"舵机测试命令 - 转到{angle}度")
-                socketio.emit('servo_status', {'status': 'test', 'angle': angle})
+                broadcaster.urgent('servo_status', {'status': 'test', 'angle': angle})
 
             else:
                 logger.warning(f"未知的舵机控制动作: {action}")
@@ -597,17 +877,19 @@ def intelligence():
     return render_template('intelligence.html')
 
 @app.route('/api/data/recent')
+@polled_on(READINGS)
 def get_recent_data():
     """Get recent sensor data"""
     try:
         limit = int(request.args.get('limit', 20))
         device_id = request.args.get('device_id')
         
-        query = SensorData.query.order_by(SensorData.timestamp.desc())
-        if device_id:
-            query = query.filter_by(device_id=device_id)
-            
-        data = query.limit(limit).all()
+        with read_session() as session:
+            query = session.query(SensorData).order_by(SensorData.timestamp.desc())
+            if device_id:
+                query = query.filter_by(device_id=device_id)
+
+            data = query.limit(limit).all()
         
         result = []
         for item in data:
@@ -620,7 +902,7 @@ def get_recent_data():
                 'humidity': item.humidity,
                 'light': item.light_level,
                 'alert': item.alert_status,
-                'timestamp': item.timestamp.isoformat()
+                'timestamp': iso_ms(item.timestamp)
             })
         
         return jsonify(result)
@@ -628,26 +910,41 @@ def get_recent_data():
         logger.error(f"Error getting recent data: {e}")
         return jsonify({'error': str(e)}), 500
 
+def paged_response(result, next_cursor):
+    """返回一页数据：正文保持为列表，下一页游标放在 X-Next-Cursor 响应头（最后一页没有该头）"""
+    response = jsonify(result)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
 @app.route('/api/data/range')
 def get_data_range():
-    """Get data within time range"""
+    """Get data within time range, newest first, one page per request (cursor / limit)"""
     try:
         start_time = request.args.get('start')
         end_time = request.args.get('end')
         device_id = request.args.get('device_id')
-        
-        query = SensorData.query
-        if start_time:
-            start = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-            query = query.filter(SensorData.timestamp >= start)
-        if end_time:
-            end = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
-            query = query.filter(SensorData.timestamp <= end)
-        if device_id:
-            query = query.filter_by(device_id=device_id)
-            
-        data = query.order_by(SensorData.timestamp.desc()).all()
-        
+        try:
+            cursor = decode_cursor(request.args.get('cursor'))
+            limit = page_size(request.args.get('limit'), app.config['PAGE_DEFAULT_ROWS'], app.config['PAGE_MAX_ROWS'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        start = to_ms(datetime.fromisoformat(start_time.replace('Z', '+00:00'))) if start_time else None
+        end = to_ms(datetime.fromisoformat(end_time.replace('Z', '+00:00'))) if end_time else None
+        sensor_range = sensor_data_between(start, end)
+
+        with read_session() as session:
+            query = session.query(sensor_range)
+            if start:
+                query = query.filter(sensor_range.timestamp >= start)
+            if end:
+                query = query.filter(sensor_range.timestamp <= end)
+            if device_id:
+                query = query.filter_by(device_id=device_id)
+
+            data, next_cursor = keyset_page(query, sensor_range.timestamp, sensor_range.id, cursor, limit)
+
         result = []
         for item in data:
             result.append({
@@ -659,10 +956,10 @@ def get_data_range():
                 'humidity': item.humidity,
                 'light': item.light_level,
                 'alert': item.alert_status,
-                'timestamp': item.timestamp.isoformat()
+                'timestamp': iso_ms(item.timestamp)
             })
         
-        return jsonify(result)
+        return paged_response(result, next_cursor)
     except Exception as e:
         logger.error(f"Error getting range data: {e}")
         return jsonify({'error': str(e)}), 500
@@ -671,7 +968,8 @@ def get_data_range():
 def get_alerts():
     """Get alert history"""
     try:
-        alerts = AlertHistory.query.order_by(AlertHistory.timestamp.desc()).limit(50).all()
+        with read_session() as session:
+            alerts = session.query(AlertHistory).order_by(AlertHistory.timestamp.desc()).limit(50).all()
         
         result = []
         for alert in alerts:
@@ -685,9 +983,9 @@ def get_alerts():
                 'temperature': alert.temperature,
                 'humidity': alert.humidity,
                 'location': alert.location,
-                'timestamp': alert.timestamp.isoformat(),
+                'timestamp': iso_ms(alert.timestamp),
                 'resolved': alert.resolved,
-                'resolved_time': alert.resolved_time.isoformat() if alert.resolved_time else None
+                'resolved_time': iso_ms(alert.resolved_time)
             })
         
         return jsonify(result)
@@ -700,13 +998,16 @@ def get_alerts():
 def resolve_alert(alert_id):
     """Mark an alert as resolved"""
     try:
-        alert = AlertHistory.query.get(alert_id)
-        if not alert:
+        alert_table = AlertHistory.__table__
+        with storage.write() as conn:
+            updated = conn.execute(
+                alert_table.update()
+                .where(alert_table.c.id == alert_id)
+                .values(resolved=True, resolved_time=now_ms())
+            ).rowcount
+        if not updated:
             return jsonify({'error': 'Alert not found'}), 404
-
-        alert.resolved = True
-        alert.resolved_time = datetime.utcnow()
-        db.session.commit()
+        data_version.bump(ALERTS)
 
         logger.info(f"Alert {alert_id} marked as resolved")
         return jsonify({'status': 'success', 'message': 'Alert resolved'})
@@ -721,12 +1022,61 @@ def receive_data():
     """Receive sensor data via HTTP POST (backup method)"""
     try:
         data = request.get_json()
-        process_sensor_data(data)
+        if ROLE == ROLE_WEB:
+            # Web进程不做数据接收，转发给工作进程处理
+            device_id = data.get('slave_id') or data.get('device_id', 'unknown')
+            mqtt_client.publish(f"esp32/{device_id}/data/json", json.dumps(data), qos=app.config['MQTT_QOS'])
+        else:
+            process_sensor_data(data)
         return jsonify({'status': 'success', 'message': 'Data received'})
     except Exception as e:
         logger.error(f"Error receiving HTTP data: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/ingest/stats')
+def ingest_stats():
+    """Ingest pipeline statistics (write buffer queue depth, flush latency)"""
+    try:
+        return jsonify({
+            'write_buffer': ingest_buffer.get_stats(),
+            'device_registry': device_registry.get_stats(),
+            'decision_pool': decision_pool.get_stats(),
+            'broadcaster': broadcaster.get_stats(),
+            'payload_normalizer': payload_normalizer.get_stats(),
+            'logging': log_pipeline.get_stats(),
+            'dedup': sequence_dedup.get_stats(),
+            'storage': storage.get_stats(),
+            'partitions': sensor_partitions.get_stats(),
+            'rollups': sensor_rollups.get_stats(),
+            'device_latest': latest_readings.get_stats(),
+            'fleet_snapshot': fleet_snapshots.get_stats(),
+            'http_cache': http_cache.get_stats(),
+            'state_channels': state_channels.get_stats(),
+            'series': sensor_series.get_stats(),
+            'role': ROLE,
+            'stale_state_updates': device_state.stale_updates,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Error getting ingest stats: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/payloads')
+def dump_raw_payloads():
+    """Dump the most recent raw MQTT payloads per device (for debugging ingest problems)"""
+    try:
+        device_id = request.args.get('device_id')
+        limit = request.args.get('limit', type=int)
+        return jsonify({
+            'payloads': raw_payloads.dump(device_id, limit),
+            'buffer': raw_payloads.get_stats(),
+            'logging': log_pipeline.get_stats(),
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Error dumping raw payloads: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/mqtt/status')
 def mqtt_status():
     """Check MQTT connection status"""
@@ -857,80 +1207,12 @@ def servo_control():
 
 # ESP32 Fire Alarm System API Routes
 @app.route('/api/devices')
+@polled_on(READINGS, DEVICES)
 def get_devices():
     """Get all device status for fire alarm system"""
     try:
-        # 数据超时时间（秒）- 超过这个时间没有新数据认为设备离线
-        DATA_TIMEOUT = 300  # 5分钟
-
-        # Only return devices that have actual sensor data
-        sensor_devices = db.session.query(SensorData.device_id.distinct()).all()
-        device_ids = [device[0] for device in sensor_devices]
-
-        result = []
-        # 使用 UTC 时间进行比较（与数据库存储的时间一致）
-        current_time = datetime.utcnow()
-
-        logger.info(f"查询设备数据: 找到 {len(device_ids)} 个设备ID")
-
-        for device_id in device_ids:
-            # Get device info
-            device = DeviceInfo.query.filter_by(device_id=device_id).first()
-
-            # Skip slave devices - they should only appear in /api/slaves
-            if device and device.device_type == 'slave':
-                continue
-
-            # Get latest sensor data for this device
-            latest_data = SensorData.query.filter_by(device_id=device_id)\
-                                    .order_by(SensorData.timestamp.desc()).first()
-
-            if latest_data:
-                # 检查数据是否超时
-                data_age = (current_time - latest_data.timestamp).total_seconds()
-                is_online = data_age < DATA_TIMEOUT
-
-                logger.info(f"设备 {device_id}: 数据年龄 {data_age:.0f} 秒, 在线={is_online}")
-
-                # 只有设备在线时才返回数据
-                if not is_online:
-                    continue
-
-                temperature = latest_data.temperature or 0
-                smoke_level = latest_data.smoke_value or 0
-                light_level = latest_data.light_level or 0  # 添加光照传感器值
-
-                # Determine status based on sensor values (fire alarm logic)
-                flame_value = latest_data.flame_value or 1200  # Default normal flame value
-                humidity = latest_data.humidity or 60  # Default normal humidity value
-
-                # Fire alarm logic - 与fire_alarm_oled.py保持一致
-                if (flame_value < 500 or       # 火焰传感器值低表示检测到火焰
-                    smoke_level < 1000 or      # MQ2烟雾传感器值低表示烟雾浓度高
-                    temperature > 40 or        # 温度过高
-                    light_level > 130):         # 光照过强
-                    status = "警报"
-                elif (flame_value < 1000 or     # 火焰传感器值偏低
-                      smoke_level < 1300 or    # 烟雾浓度中等
-                      temperature > 35 or      # 温度偏高
-                      light_level > 120):       # 光照偏强
-                    status = "警告"
-                else:
-                    status = "正常"
-
-                result.append({
-                    'device_id': device_id,
-                    'location': device.location if device else device_id,
-                    'temperature': round(temperature, 1),
-                    'humidity': round(latest_data.humidity, 1) if latest_data.humidity else 0,
-                    'smoke_level': round(smoke_level, 1),
-                    'flame': round(flame_value, 0),
-                    'light_level': round(latest_data.light_level, 1) if latest_data.light_level else 0,
-                    'status': status,
-                    'last_update': to_local_timestamp(latest_data.timestamp),
-                    'is_online': True  # 添加在线状态标识
-                })
-
+        # Served from the materialized device state (online master devices only)
+        result = device_state.snapshot()
         logger.info(f"返回 {len(result)} 个在线设备")
         return jsonify(result)
     except Exception as e:
@@ -938,20 +1220,19 @@ def get_devices():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/devices/all')
+@polled_on(READINGS, DEVICES)
 def get_all_devices():
     """Get all devices (including slaves) for history dashboard"""
     try:
-        # Get all devices from DeviceInfo
-        devices = DeviceInfo.query.all()
-
+        # All devices from the shared fleet snapshot
         result = []
-        for device in devices:
+        for device in fleet_snapshots.current():
             result.append({
                 'device_id': device.device_id,
                 'device_type': device.device_type,
                 'location': device.location,
                 'status': device.status,
-                'last_update': device.last_seen.isoformat() if device.last_seen else None
+                'last_update': iso_ms(device.last_seen)
             })
 
         return jsonify(result)
@@ -961,19 +1242,16 @@ def get_all_devices():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/slaves/realtime')
+@polled_on(READINGS, DEVICES)
 def get_slaves_realtime():
     """Get all slaves real-time sensor data"""
     try:
-        # 获取所有从机设备
-        slave_devices = DeviceInfo.query.filter_by(device_type='slave').all()
-        slave_ids = [device.device_id for device in slave_devices]
-
         result = []
 
-        for slave_id in slave_ids:
-            # 获取最新的传感器数据
-            latest_data = SensorData.query.filter_by(device_id=slave_id)\
-                                    .order_by(SensorData.timestamp.desc()).first()
+        # 所有从机的登记信息和最新读数（设备快照，一次查询）
+        for device in fleet_snapshots.current().of_type('slave'):
+            slave_id = device.device_id
+            latest_data = device if device.has_reading else None
 
             if latest_data:
                 # 根据传感器值计算状态
@@ -989,20 +1267,18 @@ def get_slaves_realtime():
                 else:
                     status = "正常"
 
-                device = DeviceInfo.query.filter_by(device_id=slave_id).first()
-
                 result.append({
                     'device_id': slave_id,
                     'device_type': 'slave',
-                    'location': device.location if device else '未知位置',
+                    'location': device.location or '未知位置',
                     'status': status,
                     'flame': latest_data.flame_value,
                     'smoke': latest_data.smoke_value,
                     'humidity': latest_data.humidity,
                     'temperature': latest_data.temperature,
                     'light_level': latest_data.light_level,
-                    'timestamp': latest_data.timestamp.isoformat(),
-                    'last_update': device.last_seen.isoformat() if device and device.last_seen else None
+                    'timestamp': iso_ms(latest_data.timestamp),
+                    'last_update': iso_ms(device.last_seen)
                 })
 
         return jsonify(result)
@@ -1016,26 +1292,27 @@ def get_slaves_alerts():
     """Get recent alerts from slave devices"""
     try:
         # 获取最近24小时的从机警报
-        since_time = datetime.utcnow() - timedelta(hours=24)
+        since_time = now_ms() - 24 * 3600 * 1000
 
         # 获取所有从机ID
-        slave_devices = DeviceInfo.query.filter_by(device_type='slave').all()
+        slave_devices = device_registry.all(device_type='slave')
         slave_ids = [device.device_id for device in slave_devices]
 
         alerts = []
         for slave_id in slave_ids:
             # 获取该从机的传感器数据
-            slave_data = SensorData.query.filter(
-                SensorData.device_id == slave_id,
-                SensorData.timestamp >= since_time
-            ).order_by(SensorData.timestamp.desc()).limit(50).all()
+            with read_session() as session:
+                slave_data = session.query(SensorData).filter(
+                    SensorData.device_id == slave_id,
+                    SensorData.timestamp >= since_time
+                ).order_by(SensorData.timestamp.desc()).limit(50).all()
 
             for data in slave_data:
                 if data.alert_status in ['warning', 'alarm']:
                     alerts.append({
                         'device_id': slave_id,
                         'alert_type': data.alert_status,
-                        'timestamp': data.timestamp.isoformat(),
+                        'timestamp': iso_ms(data.timestamp),
                         'data': {
                             'flame': data.flame_value,
                             'smoke': data.smoke_value,
@@ -1053,18 +1330,21 @@ def get_slaves_alerts():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/history')
+@polled_on(ALERTS, DEVICES)
 def get_alarm_history():
     """Get alarm history for fire alarm system"""
     try:
         # Get recent alerts from last 24 hours
-        since_time = datetime.utcnow() - timedelta(hours=24)
-        alerts = AlertHistory.query.filter(AlertHistory.timestamp >= since_time)\
-                                 .order_by(AlertHistory.timestamp.desc()).limit(50).all()
+        since_time = now_ms() - 24 * 3600 * 1000
+        with read_session() as session:
+            alerts = session.query(AlertHistory).filter(AlertHistory.timestamp >= since_time)\
+                                                .order_by(AlertHistory.timestamp.desc()).limit(50).all()
 
+        snapshot = fleet_snapshots.current()
         result = []
         for alert in alerts:
-            device = DeviceInfo.query.filter_by(device_id=alert.device_id).first()
-            location = device.location if device else alert.device_id
+            device = snapshot.get(alert.device_id)
+            location = (device.location if device else None) or alert.device_id
 
             result.append({
                 'timestamp': to_local_timestamp(alert.timestamp),
@@ -1084,53 +1364,49 @@ def get_alarm_history():
         return jsonify({'error': str(e)}), 500
 
 # Slave device API endpoints
-@app.route('/api/slaves')
-def get_slave_devices():
-    """Get all slave devices"""
-    try:
-        # 数据超时时间（秒）- 超过这个时间没有新数据认为设备离线
-        DATA_TIMEOUT = 300  # 5分钟
-
-        slaves = DeviceInfo.query.filter_by(device_type='slave').all()
-        # 使用 UTC 时间进行比较（与数据库存储的时间一致）
-        current_time = datetime.utcnow()
+def online_slave_entries():
+    """在线从机列表（/api/slaves 与 slaves 状态通道共用）"""
+    # 数据超时时间（秒）- 超过这个时间没有新数据认为设备离线
+    DATA_TIMEOUT = 300  # 5分钟
 
-        result = []
-        for slave in slaves:
-            # Get latest sensor data for this slave
-            latest_data = SensorData.query.filter_by(device_id=slave.device_id)\
-                                    .order_by(SensorData.timestamp.desc()).first()
+    # 使用 UTC 时间进行比较（与数据库存储的时间一致）
+    current_time = now_ms()
 
-            # 检查数据是否超时
-            is_online = False
-            if latest_data:
-                data_age = (current_time - latest_data.timestamp).total_seconds()
-                is_online = data_age < DATA_TIMEOUT
-                logger.info(f"从机 {slave.device_id}: 数据年龄 {data_age:.0f} 秒, 在线={is_online}")
+    result = []
+    for slave in fleet_snapshots.current().of_type('slave'):
+        # Latest sensor data for this slave (from the same snapshot)
+        latest_data = slave if slave.has_reading else None
 
-            # 只返回在线的从机设备
-            if not is_online:
-                continue
+        # 检查数据是否超时，只返回在线的从机设备
+        if not latest_data or (current_time - latest_data.timestamp) / 1000 >= DATA_TIMEOUT:
+            continue
 
-            result.append({
-                'device_id': slave.device_id,
-                'name': slave.name,
-                'location': slave.location,
-                'master_id': slave.master_id,
-                'status': slave.status,
-                'last_seen': to_local_timestamp(slave.last_seen) if slave.last_seen else None,
-                'is_online': True,
-                'latest_data': {
-                    'flame': latest_data.flame_value if latest_data else 0,
-                    'smoke': latest_data.smoke_value if latest_data else 0,
-                    'temperature': latest_data.temperature if latest_data else 0,
-                    'humidity': latest_data.humidity if latest_data else 0,
-                    'light_level': latest_data.light_level if latest_data else 0,
-                    'alert_status': latest_data.alert_status if latest_data else False,
-                    'timestamp': to_local_timestamp(latest_data.timestamp) if latest_data else None
-                } if latest_data else None
-            })
+        result.append({
+            'device_id': slave.device_id,
+            'name': slave.name,
+            'location': slave.location,
+            'master_id': slave.master_id,
+            'status': slave.status,
+            'last_seen': to_local_timestamp(slave.last_seen) if slave.last_seen else None,
+            'is_online': True,
+            'latest_data': {
+                'flame': latest_data.flame_value,
+                'smoke': latest_data.smoke_value,
+                'temperature': latest_data.temperature,
+                'humidity': latest_data.humidity,
+                'light_level': latest_data.light_level,
+                'alert_status': latest_data.alert_status,
+                'timestamp': to_local_timestamp(latest_data.timestamp)
+            }
+        })
+    return result
 
+@app.route('/api/slaves')
+@polled_on(READINGS, DEVICES)
+def get_slave_devices():
+    """Get all slave devices"""
+    try:
+        result = online_slave_entries()
         logger.info(f"返回 {len(result)} 个在线从机设备")
         return jsonify(result)
     except Exception as e:
@@ -1143,8 +1419,9 @@ def get_slave_data(slave_id):
     try:
         limit = int(request.args.get('limit', 20))
 
-        data = SensorData.query.filter_by(device_id=slave_id)\
-                            .order_by(SensorData.timestamp.desc()).limit(limit).all()
+        with read_session() as session:
+            data = session.query(SensorData).filter_by(device_id=slave_id)\
+                                            .order_by(SensorData.timestamp.desc()).limit(limit).all()
 
         result = []
         for item in data:
@@ -1187,20 +1464,25 @@ def get_slave_status(slave_id):
 
 @app.route('/api/sensor/history')
 def get_sensor_history():
-    """Get sensor data history for miniprogram"""
+    """Get sensor data history for miniprogram, newest first, one page per request (cursor / limit)"""
     try:
         # 获取查询参数
-        limit = int(request.args.get('limit', 100))  # 默认获取最近100条记录
         device_id = request.args.get('device_id')  # 可选的设备ID过滤
+        try:
+            cursor = decode_cursor(request.args.get('cursor'))
+            limit = page_size(request.args.get('limit'), 100, app.config['PAGE_MAX_ROWS'])  # 默认获取最近100条记录
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         # 构建查询
-        query = SensorData.query
+        with read_session() as session:
+            query = session.query(SensorData)
 
-        if device_id:
-            query = query.filter_by(device_id=device_id)
+            if device_id:
+                query = query.filter_by(device_id=device_id)
 
-        # 按时间倒序排列，获取最新的数据
-        history = query.order_by(SensorData.timestamp.desc()).limit(limit).all()
+            # 按时间倒序排列，获取最新的数据（cursor 指定时从上一页末尾继续）
+            history, next_cursor = keyset_page(query, SensorData.timestamp, SensorData.id, cursor, limit)
 
         result = []
         for record in history:
@@ -1214,10 +1496,10 @@ def get_sensor_history():
                 'humidity': record.humidity,
                 'light': record.light_level,
                 'alert': record.alert_status,
-                'timestamp': record.timestamp.isoformat()
+                'timestamp': iso_ms(record.timestamp)
             })
 
-        return jsonify(result)
+        return paged_response(result, next_cursor)
 
     except Exception as e:
         logger.error(f"Error getting sensor history: {e}")
@@ -1226,13 +1508,12 @@ def get_sensor_history():
 def get_slave_status(slave_id):
     """Get current status of specific slave"""
     try:
-        device = DeviceInfo.query.filter_by(device_id=slave_id, device_type='slave').first()
+        device = fleet_snapshots.current().get(slave_id, device_type='slave')
         if not device:
             return jsonify({'error': 'Slave not found'}), 404
 
-        # Get latest sensor data
-        latest_data = SensorData.query.filter_by(device_id=slave_id)\
-                                .order_by(SensorData.timestamp.desc()).first()
+        # Latest sensor data (from the same snapshot)
+        latest_data = device if device.has_reading else None
 
         # Calculate current status
         status = 'offline'
@@ -1312,8 +1593,8 @@ def test_data():
 
         # Process test data
         with app.app_context():
-            process_sensor_data(test_master_data)
-            process_sensor_data(test_slave_data)
+            process_sensor_data(test_master_data, 'test_data')
+            process_sensor_data(test_slave_data, 'test_data')
 
         return jsonify({
             'status': 'success',
@@ -1324,6 +1605,33 @@ def test_data():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def build_dashboard_history(devices_data, start_time, end_time, hours, resolution, max_points, method):
+    """组合历史曲线接口的返回数据（附加设备登记信息）"""
+    result = {
+        'time_range': {
+            'start': iso_ms(start_time),
+            'end': iso_ms(end_time),
+            'hours': hours
+        },
+        'resolution': resolution,
+        'downsample': {'method': method, 'max_points': max_points},
+        'devices': []
+    }
+
+    for device_id, device_data in devices_data.items():
+        device = device_registry.get(device_id)
+        result['devices'].append({
+            'device_id': device_id,
+            'device_type': device_data['device_type'],
+            'location': device.location if device else '未知位置',
+            'status': device.status if device else 'offline',
+            'last_update': device.last_seen.isoformat() if device and device.last_seen else None,
+            'data_points': len(device_data['data']),
+            'source_points': device_data['source_points'],  # 降采样前的点数
+            'data': device_data['data']
+        })
+    return result
+
 @app.route('/api/history/dashboard')
 def get_dashboard_history():
     """Get historical data for dashboard with master/slave filtering"""
@@ -1333,81 +1641,66 @@ def get_dashboard_history():
         device_type = request.args.get('device_type', 'all')  # all, master, slave
         device_id = request.args.get('device_id')  # 特定设备ID
 
-        # 计算时间范围
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(hours=hours)
-
-        # 构建查询
-        query = SensorData.query.filter(
-            SensorData.timestamp >= start_time,
-            SensorData.timestamp <= end_time
-        )
-
-        # 按设备类型过滤
-        if device_type != 'all':
-            query = query.filter_by(device_type=device_type)
-
-        # 按设备ID过滤
-        if device_id:
-            query = query.filter_by(device_id=device_id)
-
-        # 按时间排序
-        history = query.order_by(SensorData.timestamp.asc()).all()
-
-        # 按设备分组数据
+        resolution = request.args.get('resolution', 'auto')  # auto, raw, 1m, 1h, 1d
+        # 每个设备的最大点数（超过时在服务端降采样，返回大小与窗口长度无关）
+        max_points = int(request.args.get('max_points', request.args.get('points', app.config['HISTORY_MAX_POINTS'])))
+        method = request.args.get('downsample', app.config['HISTORY_DOWNSAMPLE'])  # lttb, minmax, none
+        if max_points < 3 or method not in downsample.METHODS:
+            return jsonify({'error': f"max_points 至少为3，downsample 可选: {', '.join(downsample.METHODS)}"}), 400
+
+        # 计算时间范围（毫秒时间戳）
+        end_time = now_ms()
+        start_time = end_time - hours * 3600 * 1000
+
+        # 默认从汇总表读取：选择不粗于目标间隔的分辨率，再降采样到 max_points
+        if resolution == 'auto':
+            resolution = sensor_rollups.choose_resolution(start_time, end_time, max_points)
+        if resolution != 'raw':
+            devices_data = sensor_rollups.series(
+                start_time, end_time, resolution,
+                device_id=device_id,
+                device_type=device_type if device_type != 'all' else None
+            )
+            # 汇总点超过上限时降采样（自动选择的分辨率通常都会超过）
+            for device_data in devices_data.values():
+                device_data['source_points'] = len(device_data['data'])
+                device_data['data'] = downsample.downsample_points(
+                    device_data['data'], ('flame', 'smoke', 'temperature', 'humidity', 'light'), max_points, method)
+            return jsonify(build_dashboard_history(devices_data, start_time, end_time, hours, resolution,
+                                                   max_points, method))
+
+        # 原始数据（从列式时序存储按设备读取时间窗口内的块）
         devices_data = {}
-        for record in history:
-            if record.device_id not in devices_data:
-                devices_data[record.device_id] = {
-                    'device_id': record.device_id,
-                    'device_type': record.device_type,
-                    'data': []
-                }
-
-            devices_data[record.device_id]['data'].append({
-                'timestamp': record.timestamp.isoformat(),
-                'flame': record.flame_value,
-                'smoke': record.smoke_value,
-                'temperature': record.temperature,
-                'humidity': record.humidity,
-                'light': record.light_level,
-                'alert': record.alert_status
-            })
-
-        # 获取设备信息
-        devices_info = {}
-        for device_id in devices_data.keys():
-            device = DeviceInfo.query.filter_by(device_id=device_id).first()
-            if device:
-                devices_info[device_id] = {
-                    'location': device.location,
-                    'status': device.status,
-                    'last_update': device.last_seen.isoformat() if device.last_seen else None
-                }
-
-        # 组合结果
-        result = {
-            'time_range': {
-                'start': start_time.isoformat(),
-                'end': end_time.isoformat(),
-                'hours': hours
-            },
-            'devices': []
-        }
-
-        for device_id, device_data in devices_data.items():
-            device_info = devices_info.get(device_id, {})
-            result['devices'].append({
-                'device_id': device_id,
-                'device_type': device_data['device_type'],
-                'location': device_info.get('location', '未知位置'),
-                'status': device_info.get('status', 'offline'),
-                'last_update': device_info.get('last_update'),
-                'data_points': len(device_data['data']),
-                'data': device_data['data']
-            })
+        for series_device_id, series_device_type in sensor_series.devices(
+                device_type if device_type != 'all' else None):
+            if device_id and series_device_id != device_id:
+                continue
+            series = sensor_series.scan(series_device_id, start_time, end_time)
+            source_points = len(series['timestamp'])
+            if not source_points:
+                continue
+            series = downsample.downsample_series(
+                series, ('flame_value', 'smoke_value', 'temperature', 'humidity', 'light_level'), max_points, method)
+
+            columns = [column_values(series, name) for name in
+                       ('timestamp', 'flame_value', 'smoke_value', 'temperature', 'humidity',
+                        'light_level', 'alert_status')]
+            devices_data[series_device_id] = {
+                'device_id': series_device_id,
+                'device_type': series_device_type,
+                'source_points': source_points,
+                'data': [{
+                    'timestamp': iso_ms(timestamp),
+                    'flame': flame,
+                    'smoke': smoke,
+                    'temperature': temperature,
+                    'humidity': humidity,
+                    'light': light,
+                    'alert': alert
+                } for timestamp, flame, smoke, temperature, humidity, light, alert in zip(*columns)]
+            }
 
-        return jsonify(result)
+        return jsonify(build_dashboard_history(devices_data, start_time, end_time, hours, 'raw', max_points, method))
 
     except Exception as e:
         logger.error(f"Error getting dashboard history: {e}")
@@ -1415,28 +1708,21 @@ def get_dashboard_history():
 
 @app.route('/api/history/summary')
 def get_history_summary():
-    """Get historical data summary statistics"""
+    """Get historical data summary statistics (from the rollup tables)"""
     try:
         # 获取查询参数
         hours = int(request.args.get('hours', 24))
         device_type = request.args.get('device_type', 'all')
 
-        # 计算时间范围
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(hours=hours)
-
-        # 构建查询
-        query = SensorData.query.filter(
-            SensorData.timestamp >= start_time,
-            SensorData.timestamp <= end_time
-        )
-
-        if device_type != 'all':
-            query = query.filter_by(device_type=device_type)
+        # 计算时间范围（毫秒时间戳）
+        end_time = now_ms()
+        start_time = end_time - hours * 3600 * 1000
 
-        history = query.all()
+        # 一条SQL得到每个设备的汇总行和全部设备的合计行
+        summaries, total = sensor_rollups.summarize(start_time, end_time,
+                                                    device_type=device_type if device_type != 'all' else None)
 
-        if not history:
+        if total is None:
             return jsonify({
                 'total_records': 0,
                 'devices': [],
@@ -1449,59 +1735,38 @@ def get_history_summary():
                 }
             })
 
-        # 计算统计信息
-        temps = [h.temperature for h in history if h.temperature is not None]
-        smokes = [h.smoke_value for h in history if h.smoke_value is not None]
-        flames = [h.flame_value for h in history if h.flame_value is not None]
-        alerts = [h for h in history if h.alert_status in ['warning', 'alarm']]
-
-        # 按设备分组统计
-        device_stats = {}
-        for record in history:
-            if record.device_id not in device_stats:
-                device_stats[record.device_id] = {
-                    'device_id': record.device_id,
-                    'device_type': record.device_type,
-                    'data_count': 0,
-                    'alert_count': 0,
-                    'avg_temp': 0,
-                    'max_temp': 0,
-                    'avg_smoke': 0,
-                    'last_update': None
-                }
-
-            stats = device_stats[record.device_id]
-            stats['data_count'] += 1
-
-            if record.alert_status in ['warning', 'alarm']:
-                stats['alert_count'] += 1
-
-            if record.temperature:
-                stats['avg_temp'] = (stats['avg_temp'] * (stats['data_count'] - 1) + record.temperature) / stats['data_count']
-                stats['max_temp'] = max(stats['max_temp'], record.temperature)
-
-            if record.smoke_value:
-                stats['avg_smoke'] = (stats['avg_smoke'] * (stats['data_count'] - 1) + record.smoke_value) / stats['data_count']
+        # 按设备统计
+        device_stats = []
+        for device_id, summary in summaries.items():
+            temperature = SensorRollups.metric_stats(summary, 'temperature')
+            smoke = SensorRollups.metric_stats(summary, 'smoke')
+            device_stats.append({
+                'device_id': device_id,
+                'device_type': summary['device_type'],
+                'data_count': summary['count'],
+                'alert_count': summary['alert_count'],
+                'avg_temp': temperature['avg'] or 0,
+                'max_temp': temperature['max'] or 0,
+                'avg_smoke': smoke['avg'] or 0,
+                'last_update': iso_ms(summary['last_timestamp'])
+            })
 
-            # stats['last_update'] stores string, but we need to compare with datetime
-            current_last_update_str = stats['last_update']
-            if not current_last_update_str or record.timestamp > datetime.fromisoformat(current_last_update_str):
-                stats['last_update'] = record.timestamp.isoformat()
+        overall = {metric: SensorRollups.metric_stats(total, metric) for metric in ('temperature', 'smoke', 'flame')}
 
         result = {
             'time_range': {
-                'start': start_time.isoformat(),
-                'end': end_time.isoformat(),
+                'start': iso_ms(start_time),
+                'end': iso_ms(end_time),
                 'hours': hours
             },
-            'total_records': len(history),
-            'devices': list(device_stats.values()),
+            'total_records': total['count'],
+            'devices': device_stats,
             'statistics': {
-                'avg_temperature': sum(temps) / len(temps) if temps else 0,
-                'avg_smoke': sum(smokes) / len(smokes) if smokes else 0,
-                'avg_flame': sum(flames) / len(flames) if flames else 0,
-                'max_temperature': max(temps) if temps else 0,
-                'alert_count': len(alerts)
+                'avg_temperature': overall['temperature']['avg'] or 0,
+                'avg_smoke': overall['smoke']['avg'] or 0,
+                'avg_flame': overall['flame']['avg'] or 0,
+                'max_temperature': overall['temperature']['max'] or 0,
+                'alert_count': total['alert_count']
             }
         }
 
@@ -1511,9 +1776,49 @@ def get_history_summary():
         logger.error(f"Error getting history summary: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/export/<dataset>')
+def export_history(dataset):
+    """Stream sensor data or alert history as NDJSON / CSV, or download a Parquet file
+
+    Query parameters: format (ndjson|csv|parquet), start, end, device_id, columns (comma separated)
+    """
+    try:
+        fmt = request.args.get('format', 'ndjson')
+        try:
+            if fmt not in export.FORMATS:
+                raise ValueError(f"不支持的导出格式: {fmt}")
+            columns = export.parse_columns(dataset, request.args.get('columns'))
+            start = export.parse_time(request.args.get('start'))
+            end = export.parse_time(request.args.get('end'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        mimetype, extension = export.FORMATS[fmt]
+        filename = f"{dataset}_{datetime.utcnow():%Y%m%d%H%M%S}.{extension}"
+        batches = export.iter_batches(db_file, dataset, columns, start, end, request.args.get('device_id'))
+
+        if fmt == 'parquet':
+            # Parquet的元数据在文件末尾，先写入临时文件（超过阈值落盘）再发送
+            output = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+            try:
+                export.write_parquet(batches, output, dataset, columns)
+            except RuntimeError as e:
+                output.close()
+                return jsonify({'error': str(e)}), 501
+            output.seek(0)
+            return send_file(output, mimetype=mimetype, as_attachment=True, download_name=filename)
+
+        chunks = export.iter_ndjson(batches) if fmt == 'ndjson' else export.iter_csv(batches)
+        return Response(stream_with_context(chunks), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    except Exception as e:
+        logger.error(f"Error exporting {dataset}: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # ========== 智能分析API端点 ==========
 
 @app.route('/api/intelligence/analysis/<device_id>')
+@polled_on(READINGS)
 def get_device_intelligence_analysis(device_id):
     """获取设备智能分析数据"""
     try:
@@ -1543,11 +1848,12 @@ def get_device_intelligence_analysis(device_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/intelligence/analysis')
+@polled_on(READINGS)
 def get_all_devices_intelligence_analysis():
     """获取所有设备的智能分析汇总"""
     try:
         # 获取所有设备
-        devices = DeviceInfo.query.all()
+        devices = device_registry.all()
 
         analysis_results = []
 
@@ -1609,6 +1915,7 @@ def get_all_devices_intelligence_analysis():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/intelligence/trends/<device_id>')
+@polled_on(READINGS)
 def get_device_trends(device_id):
     """获取设备传感器数据趋势分析"""
     try:
@@ -1645,6 +1952,7 @@ def get_device_trends(device_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/intelligence/ai-suggestions/<device_id>')
+@polled_on(READINGS)
 def get_ai_suggestions(device_id):
     """获取AI智能维护建议"""
     try:
@@ -1661,6 +1969,7 @@ def get_ai_suggestions(device_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/intelligence/safety-index')
+@polled_on(READINGS)
 def get_overall_safety_index():
     """获取整体环境安全指数"""
     try:
@@ -1676,6 +1985,7 @@ def get_overall_safety_index():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/intelligence/health-score/<device_id>')
+@polled_on(READINGS)
 def get_device_health_score(device_id):
     """获取设备健康评分"""
     try:
@@ -1687,11 +1997,12 @@ def get_device_health_score(device_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/intelligence/statistics')
+@polled_on(READINGS)
 def get_system_statistics():
     """获取系统智能统计信息"""
     try:
         # 获取所有设备
-        devices = DeviceInfo.query.all()
+        devices = device_registry.all()
 
         if not devices:
             return jsonify({
@@ -1759,11 +2070,12 @@ def get_system_statistics():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/intelligence/recommendations')
+@polled_on(READINGS)
 def get_system_recommendations():
     """获取系统智能建议"""
     try:
         # 获取所有设备的分析
-        devices = DeviceInfo.query.all()
+        devices = device_registry.all()
 
         all_recommendations = []
 
@@ -1828,7 +2140,7 @@ def get_ai_decision_statistics():
         ai_stats = ai_decision_engine.get_decision_statistics(hours)
 
         # 获取设备列表和各自的传感器健康度
-        devices = DeviceInfo.query.all()
+        devices = device_registry.all()
         device_health = {}
 
         for device in devices:
@@ -1857,6 +2169,7 @@ def get_ai_decision_statistics():
 
         return jsonify({
             'ai_decision_stats': ai_stats,
+            'decision_pool': decision_pool.get_stats(),
             'device_health': device_health,
             'system_health': {
                 'overall_score': round(overall_health, 2),
@@ -1976,6 +2289,44 @@ def analyze_device_ai_decision(device_id):
         logger.error(f"Error analyzing device AI decision for {device_id}: {e}")
         return jsonify({'error': str(e)}), 500
 
+# ========== 设备状态WebSocket事件 ==========
+
+@socketio.on('connect')
+def handle_connect():
+    """客户端连接时推送一次完整设备快照，之后只推送变化设备的增量"""
+    emit('devices_snapshot', device_state.snapshot())
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    state_channels.unsubscribe(request.sid)
+
+# ========== 状态通道WebSocket事件 ==========
+
+def connection_status():
+    """connection 状态通道：服务器与MQTT连接状态"""
+    return {
+        'mqtt': {
+            'connected': mqtt_client.is_connected(),
+            'broker': app.config['MQTT_BROKER_URL'],
+            'port': app.config['MQTT_BROKER_PORT']
+        },
+        'server': {
+            'role': ROLE,
+            'online_devices': len(device_state.snapshot(device_type=None))
+        }
+    }
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """订阅状态通道：{'channels': [...]}，每个通道立即收到一次 state_snapshot"""
+    names = (data or {}).get('channels') or state_channels.names
+    subscribed = state_channels.subscribe(request.sid, names)
+    return {'subscribed': subscribed}
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    state_channels.unsubscribe(request.sid, (data or {}).get('channels') or state_channels.names)
+
 # ========== 智能分析WebSocket事件 ==========
 
 @socketio.on('request_intelligence_update')
@@ -2009,21 +2360,80 @@ def handle_intelligence_update_request(data):
 
 # Scheduled cleanup of expired data
 def cleanup_old_data():
-    """Clean up data older than 30 days"""
+    """Drop expired sensor partitions and prune old alerts"""
     while True:
         try:
-            with app.app_context():
-                cutoff_time = datetime.utcnow() - timedelta(days=30)
-                old_data = SensorData.query.filter(SensorData.timestamp < cutoff_time).delete()
-                db.session.commit()
-                logger.info(f"Cleaned up {old_data} expired records")
+            now = now_ms()
+            day_ms = 86400 * 1000
+            dropped = sensor_partitions.drop_before(now - app.config['SENSOR_RETENTION_DAYS'] * day_ms)
+            logger.info(f"Dropped {len(dropped)} expired sensor data partitions: {', '.join(dropped) or '-'}")
+
+            # 报警记录数据量小，分批删除，避免长时间占用写锁
+            alert_cutoff = now - app.config['ALERT_RETENTION_DAYS'] * day_ms
+            pruned = 0
+            while True:
+                with storage.write() as conn:
+                    deleted = conn.exec_driver_sql(
+                        "DELETE FROM alert_history WHERE id IN "
+                        "(SELECT id FROM alert_history WHERE timestamp < ? LIMIT ?)",
+                        (alert_cutoff, app.config['ALERT_PRUNE_BATCH'])
+                    ).rowcount
+                pruned += deleted
+                if deleted < app.config['ALERT_PRUNE_BATCH']:
+                    break
+            logger.info(f"Cleaned up {pruned} expired alert records")
+
+            rollup_cutoffs = {resolution: now - days * day_ms if days else None
+                              for resolution, days in app.config['ROLLUP_RETENTION_DAYS'].items()}
+            logger.info(f"Cleaned up {sensor_rollups.prune(rollup_cutoffs)} expired rollup buckets")
+
+            series_cutoff = now - app.config['SENSOR_SERIES_RETENTION_DAYS'] * day_ms
+            logger.info(f"Dropped {sensor_series.drop_before(series_cutoff)} expired time-series chunks")
+            data_version.bump()
         except Exception as e:
             logger.error(f"Error cleaning up data: {e}")
         time.sleep(86400)  # Execute once daily
 
-# Start cleanup thread
-cleanup_thread = threading.Thread(target=cleanup_old_data, daemon=True)
-cleanup_thread.start()
+# Start cleanup thread (once per deployment, in the process serving the front end)
+if ROLE != ROLE_INGEST:
+    cleanup_thread = threading.Thread(target=cleanup_old_data, daemon=True)
+    cleanup_thread.start()
+
+    # State channels are served by the process the browsers connect to
+    state_channels.start()
+    atexit.register(state_channels.stop)
+
+if INGESTS_DATA:
+    # Start sensor write buffer, flush remaining rows on shutdown
+    ingest_buffer.start()
+    atexit.register(ingest_buffer.stop)
+
+    # Start device registry write-back
+    device_registry.start(flush_device_rows)
+    atexit.register(device_registry.stop)
+
+# Send the last pending WebSocket frame on shutdown
+atexit.register(broadcaster.stop)
+
+if INGESTS_DATA:
+    # atexit runs in reverse order: pending AI decisions fall back first, so their results still
+    # patch rows held in the write buffer and reach the broadcaster before those are stopped
+    atexit.register(decision_pool.stop)
+
+# 连接MQTT broker（所有处理组件就绪后再开始接收消息）
+# 开发模式的自动重载会启动两个进程，只在实际服务的子进程中连接，避免两个客户端使用同一ID互相踢下线
+RELOADER_PARENT = __name__ == '__main__' and not getattr(sys, 'frozen', False) \
+    and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+if RELOADER_PARENT:
+    logger.info("自动重载监视进程，不连接MQTT")
+else:
+    try:
+        logger.info("正在连接MQTT broker...")
+        mqtt_client.connect(app.config['MQTT_BROKER_URL'], app.config['MQTT_BROKER_PORT'], 60)
+        mqtt_client.loop_start()
+        logger.info("MQTT客户端启动")
+    except Exception as e:
+        logger.error(f"MQTT连接失败: {e}")
 
 if __name__ == '__main__':
     logger.info("Starting ESP32 Dormitory Fire Alarm System Web Server...")
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebSocket推送合并器 - 按帧批量广播
+==================================
+
+功能:
+1. MQTT线程只登记待推送的事件，不直接向所有客户端emit
+2. 同一设备同一事件在一帧内只保留最新一条（按设备限速）
+3. 每帧把所有事件合并成一个 update_batch 事件发送：{事件名: [数据, ...]}
+4. 报警事件不参与合并，立即单独发送
+5. 统计每次发送的耗时；每个事件的序列化耗时按 1/N 的发送次数抽样统计（额外序列化一次，不影响其余发送）
+"""
+
+import json
+import threading
+import time
+import logging
+
+from log_pipeline import sampled
+
+logger = logging.getLogger(__name__)
+
+BATCH_EVENT = 'update_batch'
+
+
+class SocketBroadcaster:
+    """Socket.IO 合并广播器"""
+
+    def __init__(self, socketio, frame_interval=0.2, batch_event=BATCH_EVENT, serialize_sample=100):
+        """
+        Args:
+            socketio: Flask-SocketIO 实例
+            frame_interval: 帧间隔（秒），同一设备在一帧内最多推送一次
+            batch_event: 批量事件名称
+            serialize_sample: 每N次发送抽样统计一次各事件的序列化耗时（0表示不统计）
+        """
+        self.socketio = socketio
+        self.frame_interval = frame_interval
+        self.batch_event = batch_event
+        self.serialize_sample = serialize_sample
+        self._sends = 0
+
+        self._pending = {}  # (event, key) -> payload，按登记顺序保存
+        self._sequence = 0  # 不合并的事件使用递增序号作为key
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        # 运行统计
+        self.event_stats = {}
+        self.stats = {
+            'frames_sent': 0,
+            'urgent_sent': 0,
+            'send_errors': 0,
+            'last_frame_size': 0,
+            'last_send_ms': 0.0,
+            'max_send_ms': 0.0,
+            'total_send_ms': 0.0
+        }
+
+    def start(self):
+        """启动帧发送线程"""
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._frame_loop, name='socket-broadcaster', daemon=True)
+        self._thread.start()
+        logger.info(f"WebSocket合并推送启动: 帧间隔 {int(self.frame_interval * 1000)} 毫秒")
+
+    def stop(self):
+        """停止发送线程并发出最后一帧"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(self.frame_interval + 5)
+            self._thread = None
+        self.flush()
+
+    def publish(self, event, payload, key=None):
+        """登记一条待推送的事件
+
+        Args:
+            event: 事件名称
+            payload: 事件数据
+            key: 合并键（通常为设备ID），同一帧内相同key只保留最新数据；为None时不合并
+        """
+        with self._lock:
+            stats = self._event_stats(event)
+            stats['published'] += 1
+            if key is None:
+                self._sequence += 1
+                key = ('#', self._sequence)
+            elif (event, key) in self._pending:
+                stats['coalesced'] += 1
+                # 删除后重新插入，保证批次内按最近更新的顺序排列
+                del self._pending[(event, key)]
+            self._pending[(event, key)] = payload
+
+    def urgent(self, event, payload):
+        """立即发送事件（报警等），不参与合并"""
+        with self._lock:
+            self._event_stats(event)['published'] += 1
+        if self._send(event, {event: [payload]}, payload):
+            with self._lock:
+                self.stats['urgent_sent'] += 1
+
+    def flush(self):
+        """立即发送当前帧，返回本帧包含的事件条数"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending = self._pending
+            self._pending = {}
+
+        batch = {}
+        for (event, _), payload in pending.items():
+            batch.setdefault(event, []).append(payload)
+
+        if self._send(self.batch_event, batch, batch):
+            with self._lock:
+                self.stats['frames_sent'] += 1
+                self.stats['last_frame_size'] = len(pending)
+        return len(pending)
+
+    def _frame_loop(self):
+        while not self._stop_event.wait(self.frame_interval):
+            self.flush()
+
+    def _send(self, event, groups, data):
+        """发送计时（抽样时另外统计各事件的序列化耗时），groups为 {事件名: [数据]}"""
+        with self._lock:
+            self._sends += 1
+            sampled_send = bool(self.serialize_sample) and (self._sends - 1) % self.serialize_sample == 0
+        serialize_ms = {}
+        if sampled_send:
+            for name, payloads in groups.items():
+                started = time.perf_counter()
+                try:
+                    json.dumps(payloads, ensure_ascii=False, default=str)
+                except (TypeError, ValueError) as e:
+                    logger.warning(f"推送事件 {name} 序列化检查失败: {e}")
+                serialize_ms[name] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        try:
+            self.socketio.emit(event, data)
+        except Exception as e:
+            logger.error(f"WebSocket推送失败({event}): {e}", extra=sampled(('broadcast_error', event)))
+            with self._lock:
+                self.stats['send_errors'] += 1
+            return False
+        send_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            for name, payloads in groups.items():
+                stats = self._event_stats(name)
+                stats['sent'] += len(payloads)
+                if name in serialize_ms:
+                    stats['serialize_samples'] += 1
+                    stats['total_serialize_ms'] += serialize_ms[name]
+                    stats['max_serialize_ms'] = max(stats['max_serialize_ms'], serialize_ms[name])
+            self.stats['last_send_ms'] = round(send_ms, 3)
+            self.stats['max_send_ms'] = round(max(self.stats['max_send_ms'], send_ms), 3)
+            self.stats['total_send_ms'] += send_ms
+        return True
+
+    def _event_stats(self, event):
+        stats = self.event_stats.get(event)
+        if stats is None:
+            stats = self.event_stats[event] = {
+                'published': 0,
+                'coalesced': 0,
+                'sent': 0,
+                'serialize_samples': 0,
+                'total_serialize_ms': 0.0,
+                'max_serialize_ms': 0.0
+            }
+        return stats
+
+    def get_stats(self):
+        """获取推送运行统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            events = {name: dict(value) for name, value in self.event_stats.items()}
+            stats['pending'] = len(self._pending)
+
+        sends = stats['frames_sent'] + stats['urgent_sent']
+        stats['avg_send_ms'] = round(stats.pop('total_send_ms') / sends, 3) if sends else 0
+        for value in events.values():
+            total = value.pop('total_serialize_ms')
+            value['avg_serialize_ms'] = round(total / value['serialize_samples'], 4) if value['serialize_samples'] else 0
+            value['max_serialize_ms'] = round(value['max_serialize_ms'], 4)
+        stats['events'] = events
+        stats['frame_interval_ms'] = int(self.frame_interval * 1000)
+        stats['batch_event'] = self.batch_event
+        stats['serialize_sample'] = self.serialize_sample
+        return stats
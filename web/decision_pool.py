@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI决策工作池 - 将远程AI调用移出MQTT网络线程
+=============================================
+
+功能:
+1. 有界任务队列 + 固定数量的决策工作线程
+2. 每个决策带截止时间，超时后回退到硬件阈值判断
+3. 队列已满时立即回退，不阻塞消息接收
+4. 决策完成后通过回调写回数据库并推送前端
+"""
+
+import queue
+import threading
+import time
+import logging
+
+from ai_alarm_decision import ai_decision_engine
+from log_pipeline import sampled
+
+logger = logging.getLogger(__name__)
+
+
+class DecisionJob:
+    """一次待执行的AI决策"""
+
+    __slots__ = ('device_id', 'sensor_data', 'hardware_result', 'context',
+                 'callback', 'submitted_at', 'deadline')
+
+    def __init__(self, device_id, sensor_data, hardware_result, context, callback, deadline):
+        self.device_id = device_id
+        self.sensor_data = sensor_data
+        self.hardware_result = hardware_result
+        self.context = context
+        self.callback = callback
+        self.submitted_at = time.time()
+        self.deadline = self.submitted_at + deadline
+
+
+def hardware_fallback_decision(device_id, hardware_result, reason):
+    """AI无法按时给出结论时，沿用硬件阈值判断"""
+    return {
+        'device_id': device_id,
+        'final_result': hardware_result,
+        'hardware_result': hardware_result,
+        'confidence': 0.5,
+        'intervention': False,
+        'fallback': True,
+        'reasoning': f'AI决策未完成({reason})，沿用硬件判断'
+    }
+
+
+class AlarmDecisionPool:
+    """AI报警决策工作池"""
+
+    def __init__(self, engine=None, workers=2, queue_size=64, deadline=8.0):
+        self.engine = engine or ai_decision_engine
+        self.workers = workers
+        self.deadline = deadline  # 单个决策的截止时间（秒）
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._running = False
+        self._lock = threading.Lock()
+
+        # 运行统计
+        self.stats = {
+            'submitted': 0,
+            'completed': 0,
+            'fallback_queue_full': 0,
+            'fallback_expired': 0,
+            'fallback_error': 0,
+            'last_decision_seconds': 0.0
+        }
+
+    def start(self):
+        """启动工作线程"""
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.workers):
+            worker = threading.Thread(target=self._worker_loop, name=f'ai-decision-{i}', daemon=True)
+            worker.start()
+            self._threads.append(worker)
+        logger.info(f"AI决策工作池启动: {self.workers} 个线程, 队列上限 {self.jobs.maxsize}, 截止时间 {self.deadline}s")
+
+    def stop(self, timeout=5.0):
+        """停止工作线程，未处理的任务按硬件判断回退"""
+        self._running = False
+
+        # 清空队列中尚未开始的任务
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            self.jobs.task_done()
+            if job is not None:
+                self._finish(job, hardware_fallback_decision(job.device_id, job.hardware_result, '服务停止'))
+
+        for _ in self._threads:
+            self.jobs.put(None)
+        for worker in self._threads:
+            worker.join(timeout)
+        self._threads = []
+
+    def submit(self, device_id, sensor_data, hardware_result, callback, context=None):
+        """提交决策任务，立即返回
+
+        Args:
+            device_id: 设备ID
+            sensor_data: 传感器数据字典
+            hardware_result: 硬件阈值判断结果
+            callback: 决策完成后的回调 callback(decision, context)
+            context: 透传给回调的上下文（如记录ID）
+
+        Returns:
+            bool: 是否成功入队；队列已满时直接以硬件判断回调
+        """
+        job = DecisionJob(device_id, sensor_data, hardware_result, context, callback, self.deadline)
+        self._count('submitted')
+        try:
+            self.jobs.put_nowait(job)
+            return True
+        except queue.Full:
+            logger.warning(f"AI决策队列已满，设备 {device_id} 沿用硬件判断", extra=sampled('ai_queue_full'))
+            self._count('fallback_queue_full')
+            self._finish(job, hardware_fallback_decision(device_id, hardware_result, '队列已满'))
+            return False
+
+    def _worker_loop(self):
+        while self._running:
+            job = self.jobs.get()
+            if job is None:
+                break
+            try:
+                self._run_job(job)
+            finally:
+                self.jobs.task_done()
+
+    def _run_job(self, job):
+        remaining = job.deadline - time.time()
+        if remaining <= 0:
+            self._count('fallback_expired')
+            self._finish(job, hardware_fallback_decision(job.device_id, job.hardware_result, '排队超时'))
+            return
+
+        started = time.time()
+        try:
+            decision = self.engine.make_decision(job.device_id, job.sensor_data, job.hardware_result,
+                                                 timeout=remaining)
+            self._count('completed')
+        except Exception as e:
+            # 远程AI超时/调用失败也在这里回退，失败的调用不参与加权判断
+            logger.error(f"AI决策执行失败: {e}", extra=sampled('ai_decision_error'))
+            self._count('fallback_error')
+            decision = hardware_fallback_decision(job.device_id, job.hardware_result, '执行异常')
+
+        with self._lock:
+            self.stats['last_decision_seconds'] = round(time.time() - started, 3)
+        self._finish(job, decision)
+
+    def _finish(self, job, decision):
+        try:
+            job.callback(decision, job.context)
+        except Exception as e:
+            logger.error(f"AI决策回调失败: {e}")
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get_stats(self):
+        """获取工作池运行统计"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update({
+            'workers': self.workers,
+            'queue_depth': self.jobs.qsize(),
+            'queue_capacity': self.jobs.maxsize,
+            'deadline_seconds': self.deadline
+        })
+        return stats
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备最新读数表 - "当前值"查询不再排序历史数据
+============================================
+
+功能:
+1. device_latest 表每个设备一行，保存最新一条传感器读数
+2. 入库时在同一写事务中UPSERT，只有更新的时间戳才会覆盖（多个接收进程乱序写入也保持单调）
+3. 设备列表、从机实时数据、从机状态等接口读这张表，开销只与设备数有关
+4. AI复核修改报警状态时同步更新
+"""
+
+import logging
+
+from storage import execute, executemany
+from timeutil import to_ms
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'device_latest'
+COLUMNS = ('device_id', 'device_type', 'flame_value', 'smoke_value', 'temperature',
+           'humidity', 'light_level', 'alert_status', 'timestamp')
+
+UPSERT_SQL = (
+    f"INSERT INTO {TABLE_NAME} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)}) "
+    f"ON CONFLICT (device_id) DO UPDATE SET "
+    + ', '.join(f"{column} = excluded.{column}" for column in COLUMNS[1:])
+    + f" WHERE excluded.timestamp >= {TABLE_NAME}.timestamp"
+)
+
+
+def create_table(conn):
+    """创建最新读数表（数据库迁移时调用）"""
+    execute(conn, f"CREATE TABLE IF NOT EXISTS {TABLE_NAME} ("
+                  f"device_id VARCHAR(50) NOT NULL PRIMARY KEY, device_type VARCHAR(20), "
+                  f"flame_value INTEGER, smoke_value INTEGER, temperature FLOAT, humidity FLOAT, "
+                  f"light_level FLOAT, alert_status BOOLEAN, timestamp INTEGER)")
+
+
+def drop_table(conn):
+    """删除最新读数表（数据库迁移改变表结构时调用）"""
+    execute(conn, f"DROP TABLE IF EXISTS {TABLE_NAME}")
+
+
+def rebuild(conn):
+    """从原始数据重建（每个设备取最新一条）"""
+    execute(conn, f"DELETE FROM {TABLE_NAME}")
+    execute(conn, f"INSERT INTO {TABLE_NAME} ({', '.join(COLUMNS)}) "
+                  f"SELECT {', '.join(f's.{column}' for column in COLUMNS)} FROM sensor_data s "
+                  f"JOIN (SELECT device_id, MAX(timestamp) AS latest FROM sensor_data GROUP BY device_id) m "
+                  f"ON s.device_id = m.device_id AND s.timestamp = m.latest "
+                  f"WHERE true ON CONFLICT (device_id) DO NOTHING")
+
+
+class LatestReadings:
+    """入库时维护 device_latest 表"""
+
+    def __init__(self):
+        self.upserts = 0
+
+    def apply(self, conn, rows):
+        """在入库的写事务中更新每个设备的最新读数"""
+        latest = {}
+        for row in rows:
+            current = latest.get(row['device_id'])
+            if current is None or row['timestamp'] >= current['timestamp']:
+                latest[row['device_id']] = row
+
+        executemany(conn, UPSERT_SQL, [
+            tuple(row[column] for column in COLUMNS) for row in latest.values()
+        ])
+        self.upserts += len(latest)
+
+    def set_alert_status(self, conn, device_id, timestamp, alert_status):
+        """AI复核修改报警状态后，若该记录仍是设备的最新读数则同步修改"""
+        execute(conn, f"UPDATE {TABLE_NAME} SET alert_status = ? WHERE device_id = ? AND timestamp = ?",
+                (bool(alert_status), device_id, to_ms(timestamp)))
+
+    def get_stats(self):
+        return {'upserts': self.upserts}
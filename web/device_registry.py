@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备注册表 - 进程内设备元数据缓存
+=================================
+
+功能:
+1. 启动时从 device_info 表一次性加载全部设备
+2. 数据接收时只在内存中更新 last_seen/status/device_type
+3. 后台线程定期把变更过的设备批量写回数据库
+4. 设备相关的查询接口直接读取内存，不再逐条查询数据库
+"""
+
+import threading
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceRecord:
+    """设备信息快照（字段与 DeviceInfo 模型保持一致）"""
+
+    __slots__ = ('device_id', 'name', 'location', 'ip_address', 'device_type', 'master_id',
+                 'last_seen', 'status', 'config', 'created_at')
+
+    def __init__(self, device_id, name, location=None, ip_address=None, device_type='master',
+                 master_id=None, last_seen=None, status='online', config=None, created_at=None):
+        self.device_id = device_id
+        self.name = name
+        self.location = location
+        self.ip_address = ip_address
+        self.device_type = device_type
+        self.master_id = master_id
+        self.last_seen = last_seen
+        self.status = status
+        self.config = config
+        self.created_at = created_at or datetime.utcnow()
+
+    @classmethod
+    def from_model(cls, device):
+        return cls(**{field: getattr(device, field) for field in cls.__slots__})
+
+    def copy(self):
+        return DeviceRecord(**self.to_row())
+
+    def to_row(self):
+        """转换为 device_info 表的行字典"""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class DeviceRegistry:
+    """进程内设备注册表"""
+
+    def __init__(self, flush_interval=5.0):
+        self.flush_interval = flush_interval
+        self._devices = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._writer = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.stats = {
+            'loaded': 0,
+            'registered': 0,
+            'flush_count': 0,
+            'rows_written': 0,
+            'flush_errors': 0
+        }
+
+    def load(self, devices):
+        """从 DeviceInfo 查询结果加载注册表（启动时调用一次）"""
+        with self._lock:
+            self._devices = {device.device_id: DeviceRecord.from_model(device) for device in devices}
+            self._dirty.clear()
+            self.stats['loaded'] = len(self._devices)
+        logger.info(f"设备注册表加载完成: {len(self._devices)} 个设备")
+
+    def touch(self, device_id, device_type, seen_at, name=None, location=None, master_id=None):
+        """数据接收时更新设备状态，首次出现的设备自动登记
+
+        Returns:
+            bool: 是否为新登记的设备
+        """
+        with self._lock:
+            record = self._devices.get(device_id)
+            is_new = record is None
+            if is_new:
+                record = DeviceRecord(
+                    device_id=device_id,
+                    name=name or f"ESP32-{device_id}",
+                    location=location or 'Dormitory',
+                    device_type=device_type,
+                    master_id=master_id,
+                    created_at=seen_at
+                )
+                self._devices[device_id] = record
+                self.stats['registered'] += 1
+            record.last_seen = seen_at
+            record.status = 'online'
+            record.device_type = device_type
+            self._dirty.add(device_id)
+        return is_new
+
+    def get(self, device_id, device_type=None):
+        """获取单个设备快照，不存在（或类型不符）时返回None"""
+        with self._lock:
+            record = self._devices.get(device_id)
+            if record is None or (device_type and record.device_type != device_type):
+                return None
+            return record.copy()
+
+    def all(self, device_type=None):
+        """获取全部设备快照，可按设备类型过滤"""
+        with self._lock:
+            return [record.copy() for record in self._devices.values()
+                    if device_type is None or record.device_type == device_type]
+
+    def start(self, writer):
+        """启动定期写回线程
+
+        Args:
+            writer: 批量写入函数 writer(rows)，rows为 device_info 行字典列表
+        """
+        self._writer = writer
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name='device-registry-flush', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止写回线程并写入剩余变更"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(self.flush_interval + 5)
+            self._thread = None
+        self.flush()
+
+    def flush(self):
+        """把变更过的设备批量写回数据库"""
+        if not self._writer:
+            return 0
+        with self._lock:
+            if not self._dirty:
+                return 0
+            rows = [self._devices[device_id].to_row() for device_id in self._dirty]
+            dirty = self._dirty
+            self._dirty = set()
+
+        try:
+            self._writer(rows)
+        except Exception as e:
+            logger.error(f"设备注册表写回失败({len(rows)}个设备): {e}")
+            with self._lock:
+                self._dirty |= dirty
+                self.stats['flush_errors'] += 1
+            return 0
+
+        with self._lock:
+            self.stats['flush_count'] += 1
+            self.stats['rows_written'] += len(rows)
+        return len(rows)
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def get_stats(self):
+        """获取注册表运行统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['devices'] = len(self._devices)
+            stats['dirty'] = len(self._dirty)
+        stats['flush_interval_seconds'] = self.flush_interval
+        return stats
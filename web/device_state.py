@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备实时状态视图 - 每个设备的最新读数与报警状态
+===============================================
+
+功能:
+1. 在内存中维护每个设备的最新读数、计算后的状态（警报/警告/正常）和在线标识
+2. 数据接收时O(1)更新，返回该设备的增量结果用于推送
+3. 提供与 /api/devices 相同格式的完整快照（客户端连接时推送）
+4. 更新时间为UTC毫秒整数（与 sensor_data.timestamp 一致），在线判断是整数比较
+"""
+
+import threading
+import logging
+
+from timeutil import now_ms
+
+logger = logging.getLogger(__name__)
+
+# 数据超时时间（秒）- 超过这个时间没有新数据认为设备离线
+DATA_TIMEOUT = 300  # 5分钟
+
+
+def compute_master_status(flame_value, smoke_level, temperature, light_level):
+    """主机报警逻辑 - 与fire_alarm_oled.py保持一致"""
+    if (flame_value < 500 or       # 火焰传感器值低表示检测到火焰
+        smoke_level < 1000 or      # MQ2烟雾传感器值低表示烟雾浓度高
+        temperature > 40 or        # 温度过高
+        light_level > 130):        # 光照过强
+        return "警报"
+    if (flame_value < 1000 or      # 火焰传感器值偏低
+        smoke_level < 1300 or      # 烟雾浓度中等
+        temperature > 35 or        # 温度偏高
+        light_level > 120):        # 光照偏强
+        return "警告"
+    return "正常"
+
+
+def compute_slave_status(flame_value, smoke_value):
+    """从机报警逻辑（简化版，只有火焰和烟雾）"""
+    if flame_value < 500 or smoke_value < 1000:
+        return "警报"
+    if flame_value < 1000 or smoke_value < 1300:
+        return "警告"
+    return "正常"
+
+
+class DeviceState:
+    """单个设备的最新状态"""
+
+    __slots__ = ('device_id', 'device_type', 'location', 'flame', 'smoke', 'temperature',
+                 'humidity', 'light_level', 'alert', 'status', 'updated_at')
+
+    def __init__(self, device_id, device_type, location, flame, smoke, temperature,
+                 humidity, light_level, alert, updated_at):
+        self.device_id = device_id
+        self.device_type = device_type
+        self.location = location
+        self.flame = flame
+        self.smoke = smoke
+        self.temperature = temperature
+        self.humidity = humidity
+        self.light_level = light_level
+        self.alert = alert
+        self.updated_at = updated_at
+
+        if device_type == 'slave':
+            self.status = compute_slave_status(flame or 1200, smoke or 1800)
+        else:
+            self.status = compute_master_status(flame or 1200, smoke or 0, temperature or 0, light_level or 0)
+
+    def is_online(self, now):
+        return now - self.updated_at < DATA_TIMEOUT * 1000
+
+    def to_dict(self):
+        """转换为 /api/devices 的设备条目格式"""
+        temperature = self.temperature or 0
+        smoke_level = self.smoke or 0
+        return {
+            'device_id': self.device_id,
+            'location': self.location or self.device_id,
+            'temperature': round(float(temperature), 1),
+            'humidity': round(float(self.humidity), 1) if self.humidity else 0,
+            'smoke_level': round(smoke_level, 1),
+            'flame': round(self.flame or 1200, 0),
+            'light_level': round(float(self.light_level), 1) if self.light_level else 0,
+            'status': self.status,
+            'alert': bool(self.alert),  # 最终报警状态（AI复核后回写）
+            'last_update': self.updated_at / 1000,
+            'is_online': True
+        }
+
+
+class DeviceStateView:
+    """设备最新状态的物化视图"""
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+        self.stale_updates = 0  # 被丢弃的乱序数据条数
+
+    def load(self, latest_rows, locations):
+        """启动时用每个设备的最新一条记录初始化
+
+        Args:
+            latest_rows: 每个设备最新的 SensorData 记录
+            locations: 设备ID到位置的映射
+        """
+        with self._lock:
+            for row in latest_rows:
+                self._states[row.device_id] = DeviceState(
+                    row.device_id, row.device_type, locations.get(row.device_id),
+                    row.flame_value, row.smoke_value, row.temperature,
+                    row.humidity, row.light_level, row.alert_status, row.timestamp
+                )
+        logger.info(f"设备状态视图加载完成: {len(self._states)} 个设备")
+
+    def update(self, device_id, device_type, location, flame, smoke, temperature,
+               humidity, light_level, alert, updated_at):
+        """数据接收时更新单个设备，返回新的设备状态
+
+        多个接收进程的数据可能乱序到达，早于当前状态的数据不会覆盖，此时返回None
+        """
+        state = DeviceState(device_id, device_type, location, flame, smoke, temperature,
+                            humidity, light_level, alert, updated_at)
+        with self._lock:
+            current = self._states.get(device_id)
+            if current is not None and current.updated_at > updated_at:
+                self.stale_updates += 1
+                return None
+            self._states[device_id] = state
+        return state
+
+    def get(self, device_id):
+        with self._lock:
+            return self._states.get(device_id)
+
+    def snapshot(self, device_type='master', now=None):
+        """获取所有在线设备的状态列表（/api/devices 格式）"""
+        now = now or now_ms()
+        with self._lock:
+            states = list(self._states.values())
+        return [state.to_dict() for state in states
+                if (device_type is None or state.device_type == device_type) and state.is_online(now)]
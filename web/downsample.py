@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+曲线降采样 - 历史曲线接口在服务端把点数压到 max_points 以内
+===========================================================
+
+功能:
+1. LTTB（Largest-Triangle-Three-Buckets）：每个桶保留与前一个选中点、下一桶均值构成三角形面积最大的点，
+   保留峰值和拐点；多条曲线（火焰/烟雾/温度/湿度/光照）各自归一化后面积相加，所有曲线共用同一组时间点
+2. min/max：按时间等分桶，每个桶保留每条曲线的最小值和最大值所在的点（完全向量化）
+3. 首尾两点始终保留，点数不超过 max_points 时原样返回
+4. 基准测试：python downsample.py --benchmark 对比不同窗口长度下的耗时和JSON大小
+
+说明:
+    输入为按时间排序的 NumPy 数组（见 tsengine.py 的列数组），返回选中点的下标，调用方按下标取各列。
+    缺失值（NaN）不参与选点。
+"""
+
+import sys
+import json
+import time
+import argparse
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('lttb', 'minmax', 'none')
+
+
+def _normalized(columns):
+    """各列缩放到 [0, 1] 并组成 (n, k) 数组，缺失值保持NaN"""
+    matrix = np.column_stack([np.asarray(values, dtype=np.float64) for values in columns])
+    # fmin/fmax 忽略NaN，整列缺失时结果为NaN
+    low = np.fmin.reduce(matrix, axis=0)
+    high = np.fmax.reduce(matrix, axis=0)
+    span = np.where(high > low, high - low, 1.0)
+    matrix -= np.nan_to_num(low)
+    matrix /= span
+    return matrix
+
+
+def lttb_indices(x, columns, max_points):
+    """LTTB 选点，返回升序下标数组
+
+    Args:
+        x: 时间（毫秒）数组
+        columns: 与 x 等长的数值数组列表
+    """
+    count = len(x)
+    if max_points >= count or max_points < 3:
+        return np.arange(count)
+
+    x = np.asarray(x, dtype=np.float64)
+    ys = np.nan_to_num(_normalized(columns), nan=0.0)
+    # 首尾各单独一个点，中间 max_points - 2 个桶
+    edges = np.linspace(1, count - 1, max_points - 1).astype(np.int64)
+    sizes = np.diff(edges)
+
+    # 每个桶的均值用前缀和一次算出
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    y_sums = np.vstack((np.zeros((1, ys.shape[1])), np.cumsum(ys, axis=0)))
+    x_means = (x_sums[edges[1:]] - x_sums[edges[:-1]]) / sizes
+    y_means = (y_sums[edges[1:]] - y_sums[edges[:-1]]) / sizes[:, None]
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, count - 1
+    anchor = 0
+    last_bucket = max_points - 3
+    for bucket in range(max_points - 2):
+        lower, upper = edges[bucket], edges[bucket + 1]
+        if bucket < last_bucket:
+            next_x, next_y = x_means[bucket + 1], y_means[bucket + 1]
+        else:
+            next_x, next_y = x[-1], ys[-1]
+        anchor_x, anchor_y = x[anchor], ys[anchor]
+        # 三角形面积（省略1/2），各曲线相加
+        areas = np.abs((anchor_x - next_x) * (ys[lower:upper] - anchor_y)
+                       - (anchor_x - x[lower:upper, None]) * (next_y - anchor_y)).sum(axis=1)
+        anchor = lower + int(np.argmax(areas))
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def minmax_indices(x, columns, max_points):
+    """按时间等分桶，保留每条曲线在每个桶中的最小值和最大值，返回升序下标数组"""
+    count = len(x)
+    if max_points >= count or max_points < 3:
+        return np.arange(count)
+
+    x = np.asarray(x, dtype=np.float64)
+    buckets = max(1, (max_points - 2) // (2 * len(columns)))
+    # 时间已排序，每个桶是连续的一段，用 reduceat 按段求最小/最大值
+    starts = np.unique(np.searchsorted(x, np.linspace(x[0], x[-1], buckets + 1)[:-1], side='left'))
+    sizes = np.diff(np.append(starts, count))
+    segment = np.repeat(np.arange(len(starts)), sizes)
+
+    picked = [np.array([0, count - 1])]
+    for values in columns:
+        column = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(column)
+        for key in (np.where(missing, np.inf, column), np.where(missing, np.inf, -column)):
+            extreme = np.minimum.reduceat(key, starts)
+            hits = np.flatnonzero((key == extreme[segment]) & ~missing)
+            # 每段取第一个达到极值的点
+            _, first = np.unique(segment[hits], return_index=True)
+            picked.append(hits[first])
+    return np.unique(np.concatenate(picked))
+
+
+def select(x, columns, max_points, method='lttb'):
+    """按方法选点，返回升序下标数组"""
+    if method not in METHODS:
+        raise ValueError(f"不支持的降采样方法: {method}（可选: {', '.join(METHODS)}）")
+    if method == 'none' or not len(x):
+        return np.arange(len(x))
+    if method == 'minmax':
+        return minmax_indices(x, columns, max_points)
+    return lttb_indices(x, columns, max_points)
+
+
+def downsample_series(series, value_names, max_points, method='lttb'):
+    """对列数组字典降采样（所有列取同一组下标）"""
+    indices = select(series['timestamp'], [series[name] for name in value_names], max_points, method)
+    if len(indices) == len(series['timestamp']):
+        return series
+    return {name: values[indices] for name, values in series.items()}
+
+
+def downsample_points(points, value_names, max_points, method='lttb'):
+    """对已按时间排序的点字典列表降采样（汇总点间隔相等，用序号作为时间）"""
+    if method == 'none' or len(points) <= max_points:
+        return points
+    columns = [[np.nan if point.get(name) is None else point[name] for point in points] for name in value_names]
+    indices = select(np.arange(len(points)), columns, max_points, method)
+    return [points[index] for index in indices]
+
+
+# ---------- 基准测试 ----------
+
+def _synthetic(count, interval_ms=1500, seed=7):
+    rng = np.random.default_rng(seed)
+    timestamps = np.arange(count, dtype=np.int64) * interval_ms
+    phase = np.linspace(0, 40 * np.pi, count)
+    series = {
+        'timestamp': timestamps,
+        'flame_value': (1500 + 300 * np.sin(phase) + rng.normal(0, 30, count)).astype(np.int64),
+        'smoke_value': (1800 + 150 * np.cos(phase / 3) + rng.normal(0, 20, count)).astype(np.int64),
+        'temperature': 25 + 3 * np.sin(phase / 7) + rng.normal(0, 0.2, count),
+        'humidity': 50 + 10 * np.cos(phase / 11) + rng.normal(0, 0.5, count),
+        'light_level': 30 + 20 * np.sin(phase / 5) + rng.normal(0, 1, count),
+    }
+    # 一次短暂的火焰/烟雾尖峰，降采样后应当保留
+    spike = count // 3
+    series['flame_value'][spike:spike + 3] = 100
+    series['smoke_value'][spike:spike + 3] = 600
+    return series
+
+
+def benchmark(max_points=500):
+    """不同窗口长度（1.5秒采样）下的降采样耗时和JSON大小"""
+    value_names = ('flame_value', 'smoke_value', 'temperature', 'humidity', 'light_level')
+    print(f"max_points={max_points}，每点5条曲线")
+    for label, hours in (('1小时', 1), ('24小时', 24), ('7天', 168), ('30天', 720)):
+        count = hours * 3600 * 1000 // 1500
+        series = _synthetic(count)
+        raw_bytes = len(json.dumps({name: values.tolist() for name, values in series.items()}))
+        line = f"  {label:5s} {count:8d} 点  原始 {raw_bytes / 1024:9.1f} KB"
+        for method in ('lttb', 'minmax'):
+            started = time.perf_counter()
+            reduced = downsample_series(series, value_names, max_points, method)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            size = len(json.dumps({name: values.tolist() for name, values in reduced.items()}))
+            kept_spike = bool((reduced['flame_value'] == 100).any())
+            line += (f" | {method} {len(reduced['timestamp']):4d} 点 {size / 1024:6.1f} KB "
+                     f"{elapsed_ms:7.2f} ms 尖峰{'保留' if kept_spike else '丢失'}")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='历史曲线降采样')
+    parser.add_argument('--benchmark', action='store_true', help='不同窗口长度下的耗时与返回大小')
+    parser.add_argument('--max-points', type=int, default=500, help='每个设备的最大点数')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.benchmark:
+        benchmark(args.max_points)
+        return 0
+    parser.print_help()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
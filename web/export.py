@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史数据导出 - 传感器数据与报警记录的流式导出（NDJSON / CSV / Parquet）
+=====================================================================
+
+功能:
+1. 按 (timestamp, id) 键集分批读取，每批短暂借用一个只读连接，内存占用只与批大小有关，
+   慢速下载不会长期占用连接池或阻止WAL检查点
+2. NDJSON / CSV 以生成器逐行输出，供 Flask 流式响应或命令行写文件
+3. Parquet 按批写入行组（需要 pyarrow，未安装时给出提示）
+4. 支持按设备、时间范围、列过滤
+
+用法:
+    python export.py --db instance/fire_alarm.db --dataset sensor --format csv --start 2025-10-01 --output oct.csv
+    python export.py --db instance/fire_alarm.db --dataset alerts --format ndjson --device esp32_fire_alarm_01
+    python export.py --db instance/fire_alarm.db --format parquet --columns device_id,smoke_value,timestamp --output smoke.parquet
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import argparse
+import logging
+from datetime import datetime
+
+from storage import get_storage
+from timeutil import to_ms, iso_ms
+
+logger = logging.getLogger(__name__)
+
+# 数据集 -> (表/视图名, 可导出的列)
+DATASETS = {
+    'sensor': ('sensor_data', ('id', 'device_id', 'device_type', 'flame_value', 'smoke_value', 'temperature',
+                               'humidity', 'light_level', 'alert_status', 'timestamp')),
+    'alerts': ('alert_history', ('id', 'device_id', 'alert_type', 'severity', 'flame_value', 'smoke_value',
+                                 'temperature', 'humidity', 'light_level', 'location', 'timestamp',
+                                 'resolved', 'resolved_time')),
+}
+TIME_COLUMNS = ('timestamp', 'resolved_time')  # 毫秒整数，导出时转换
+BOOL_COLUMNS = ('alert_status', 'resolved')
+INTEGER_COLUMNS = ('id', 'flame_value', 'smoke_value')
+FLOAT_COLUMNS = ('temperature', 'humidity', 'light_level')
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+BATCH_ROWS = 2000
+
+
+def parse_columns(dataset, columns=None):
+    """校验列名，返回导出列（未指定时导出全部列）"""
+    if dataset not in DATASETS:
+        raise ValueError(f"不支持的数据集: {dataset}")
+    available = DATASETS[dataset][1]
+    if not columns:
+        return list(available)
+    if isinstance(columns, str):
+        columns = [name.strip() for name in columns.split(',') if name.strip()]
+    unknown = [name for name in columns if name not in available]
+    if unknown:
+        raise ValueError(f"未知的列: {', '.join(unknown)}（可选: {', '.join(available)}）")
+    return list(columns)
+
+
+def parse_time(value):
+    """解析时间参数：ISO字符串（可带Z/时区，无时区视为UTC）、毫秒时间戳，或None"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float, datetime)):
+        return to_ms(value)
+    if value.isdigit():
+        return int(value)
+    return to_ms(datetime.fromisoformat(value.replace('Z', '+00:00')))
+
+
+def iter_batches(db_path, dataset='sensor', columns=None, start=None, end=None, device_id=None,
+                 batch_rows=BATCH_ROWS):
+    """按时间正序分批读取，产出 (列名, 行元组列表)
+
+    每批为一个独立查询：WHERE (timestamp, id) > 上一批最后一行，因此不持有长时间的读事务。
+    """
+    table, _ = DATASETS[dataset]
+    columns = parse_columns(dataset, columns)
+    select_columns = columns + [name for name in ('timestamp', 'id') if name not in columns]
+    timestamp_index, id_index = select_columns.index('timestamp'), select_columns.index('id')
+
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("timestamp >= ?")
+        params.append(parse_time(start))
+    if end is not None:
+        conditions.append("timestamp <= ?")
+        params.append(parse_time(end))
+    if device_id:
+        conditions.append("device_id = ?")
+        params.append(device_id)
+
+    storage = get_storage(db_path)
+    last = None
+    while True:
+        where = list(conditions)
+        if last is not None:
+            where.append("(timestamp, id) > (?, ?)")
+        sql = (f"SELECT {', '.join(select_columns)} FROM {table}"
+               + (f" WHERE {' AND '.join(where)}" if where else '')
+               + " ORDER BY timestamp, id LIMIT ?")
+        with storage.read() as conn:
+            rows = conn.execute(sql, params + (list(last) if last else []) + [batch_rows]).fetchall()
+        if not rows:
+            return
+        last = (rows[-1][timestamp_index], rows[-1][id_index])
+        yield columns, [row[:len(columns)] for row in rows]
+        if len(rows) < batch_rows:
+            return
+
+
+def _export_value(name, value):
+    if value is None:
+        return None
+    if name in TIME_COLUMNS:
+        return iso_ms(value)
+    if name in BOOL_COLUMNS:
+        return bool(value)
+    return value
+
+
+def iter_ndjson(batches):
+    """每行一个JSON对象"""
+    for columns, rows in batches:
+        yield ''.join(
+            json.dumps({name: _export_value(name, value) for name, value in zip(columns, row)},
+                       ensure_ascii=False) + '\n'
+            for row in rows
+        )
+
+
+def iter_csv(batches):
+    """首行为列名的CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    for columns, rows in batches:
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        for row in rows:
+            writer.writerow([_export_value(name, value) for name, value in zip(columns, row)])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _arrow_type(pa, name):
+    if name in TIME_COLUMNS:
+        return pa.timestamp('ms')  # 毫秒整数可直接作为Arrow时间戳
+    if name in BOOL_COLUMNS:
+        return pa.bool_()
+    if name in INTEGER_COLUMNS:
+        return pa.int64()
+    if name in FLOAT_COLUMNS:
+        return pa.float64()
+    return pa.string()
+
+
+def write_parquet(batches, destination, dataset='sensor', columns=None):
+    """按批写入Parquet行组，返回写入的行数
+
+    Args:
+        destination: 文件路径或可写的二进制文件对象
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('导出Parquet需要安装 pyarrow（pip install pyarrow）')
+
+    columns = parse_columns(dataset, columns)
+    schema = pa.schema([(name, _arrow_type(pa, name)) for name in columns])
+    written = 0
+    with pq.ParquetWriter(destination, schema) as writer:
+        for batch_columns, rows in batches:
+            arrays = []
+            for index, name in enumerate(batch_columns):
+                values = [row[index] for row in rows]
+                if name in BOOL_COLUMNS:
+                    values = [None if value is None else bool(value) for value in values]
+                arrays.append(pa.array(values, type=schema.field(name).type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            written += len(rows)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='火灾报警系统历史数据导出')
+    parser.add_argument('--db', required=True, help='数据库文件路径')
+    parser.add_argument('--dataset', choices=list(DATASETS), default='sensor', help='导出传感器数据或报警记录')
+    parser.add_argument('--format', choices=list(FORMATS), default='ndjson', help='导出格式')
+    parser.add_argument('--start', help='开始时间（ISO格式，无时区视为UTC）')
+    parser.add_argument('--end', help='结束时间（ISO格式，无时区视为UTC）')
+    parser.add_argument('--device', help='只导出指定设备')
+    parser.add_argument('--columns', help='逗号分隔的列名，默认全部列')
+    parser.add_argument('--output', help='输出文件，默认写到标准输出（Parquet必须指定）')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not os.path.exists(args.db):
+        parser.error(f"数据库文件不存在: {args.db}")
+    try:
+        columns = parse_columns(args.dataset, args.columns)
+        start, end = parse_time(args.start), parse_time(args.end)
+    except ValueError as e:
+        parser.error(str(e))
+
+    batches = iter_batches(args.db, args.dataset, columns, start, end, args.device)
+    if args.format == 'parquet':
+        if not args.output:
+            parser.error('导出Parquet需要通过 --output 指定文件')
+        written = write_parquet(batches, args.output, args.dataset, columns)
+        logger.info(f"已导出 {written} 行到 {args.output}")
+        return 0
+
+    chunks = iter_ndjson(batches) if args.format == 'ndjson' else iter_csv(batches)
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+设备快照 - 一次查询得到全部设备的登记信息与最新读数
+===================================================
+
+功能:
+1. 一条SQL把 device_info 与 device_latest 联接（两边缺失的设备都保留），设备数量增加时查询次数不变
+2. 结果封装为不可变的 FleetSnapshot（元组 + 只读映射），设备列表、从机实时数据、从机状态、报警历史等接口共用
+3. 快照按 FLEET_SNAPSHOT_TTL 缓存，同一时刻只有一个线程重建，其他线程等待后直接使用新快照
+4. 设备登记信息写回数据库后可以立即失效（invalidate）
+5. 名称/位置/状态/最后在线时间以进程内设备注册表为准（device_info 每隔几秒才写回一次），
+   注册表和 device_info 中都没有的设备使用与注册表相同的默认值
+
+说明:
+    last_seen 在 device_info 中是文本时间，查询时转换为毫秒整数；快照中的时间字段都是UTC毫秒。
+"""
+
+import time
+import threading
+import logging
+from collections import namedtuple
+from types import MappingProxyType
+
+from timeutil import now_ms, to_ms, text_to_ms_sql
+import device_latest
+
+logger = logging.getLogger(__name__)
+
+READING_FIELDS = ('flame_value', 'smoke_value', 'temperature', 'humidity', 'light_level', 'alert_status',
+                  'timestamp')
+METADATA_FIELDS = ('name', 'location', 'device_type', 'master_id', 'status', 'last_seen')
+
+# 未登记设备的默认值（与 DeviceRegistry.touch 自动登记时一致）
+DEFAULT_LOCATION = 'Dormitory'
+DEFAULT_STATUS = 'online'
+
+
+class FleetDevice(namedtuple('FleetDevice', ('device_id', 'name', 'location', 'device_type', 'master_id',
+                                             'status', 'last_seen') + READING_FIELDS)):
+    """一个设备的登记信息和最新读数（没有读数时读数字段为None）"""
+
+    __slots__ = ()
+
+    @property
+    def has_reading(self):
+        return self.timestamp is not None
+
+
+SNAPSHOT_SQL = (
+    f"SELECT l.device_id, i.name, i.location, COALESCE(i.device_type, l.device_type), i.master_id, i.status, "
+    f"{text_to_ms_sql('i.last_seen')}, {', '.join(f'l.{field}' for field in READING_FIELDS)} "
+    f"FROM {device_latest.TABLE_NAME} l LEFT JOIN device_info i ON i.device_id = l.device_id "
+    f"UNION ALL "
+    f"SELECT i.device_id, i.name, i.location, i.device_type, i.master_id, i.status, "
+    f"{text_to_ms_sql('i.last_seen')}, {', '.join('NULL' for _ in READING_FIELDS)} "
+    f"FROM device_info i WHERE NOT EXISTS "
+    f"(SELECT 1 FROM {device_latest.TABLE_NAME} l WHERE l.device_id = i.device_id) "
+    f"ORDER BY 1"
+)
+
+
+class FleetSnapshot:
+    """某一时刻全部设备的只读快照"""
+
+    __slots__ = ('devices', 'built_at', '_by_id')
+
+    def __init__(self, devices, built_at):
+        self.devices = tuple(devices)
+        self.built_at = built_at
+        self._by_id = MappingProxyType({device.device_id: device for device in self.devices})
+
+    def get(self, device_id, device_type=None):
+        device = self._by_id.get(device_id)
+        if device is None or (device_type and device.device_type != device_type):
+            return None
+        return device
+
+    def of_type(self, device_type=None):
+        """按设备ID排序的设备列表，device_type 为None时返回全部"""
+        return [device for device in self.devices if device_type is None or device.device_type == device_type]
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __iter__(self):
+        return iter(self.devices)
+
+
+def _registry_metadata(record):
+    return {'name': record.name, 'location': record.location, 'device_type': record.device_type,
+            'master_id': record.master_id, 'status': record.status, 'last_seen': to_ms(record.last_seen)}
+
+
+def merge_devices(rows, records=()):
+    """合并查询结果与注册表记录，返回按设备ID排序的 FleetDevice 列表
+
+    Args:
+        rows: SNAPSHOT_SQL 的结果行
+        records: 设备注册表的 DeviceRecord 列表，登记信息覆盖 device_info 中的值
+    """
+    devices = {row[0]: FleetDevice(*row) for row in rows}
+    for record in records:
+        device = devices.get(record.device_id)
+        metadata = _registry_metadata(record)
+        devices[record.device_id] = device._replace(**metadata) if device is not None else \
+            FleetDevice(record.device_id, **metadata, **dict.fromkeys(READING_FIELDS))
+
+    result = []
+    for device_id in sorted(devices):
+        device = devices[device_id]
+        if device.name is None:
+            # 有读数但从未登记（升级前的数据）
+            device = device._replace(name=f"ESP32-{device_id}", location=device.location or DEFAULT_LOCATION,
+                                     status=device.status or DEFAULT_STATUS,
+                                     last_seen=device.last_seen or device.timestamp)
+        if device.alert_status is not None:
+            device = device._replace(alert_status=bool(device.alert_status))
+        result.append(device)
+    return result
+
+
+class FleetSnapshotService:
+    """构建并缓存设备快照"""
+
+    def __init__(self, storage, ttl=1.0, registry=None):
+        """
+        Args:
+            storage: SQLiteStorage 实例
+            ttl: 快照缓存时间（秒），0 表示每次都重新查询
+            registry: DeviceRegistry 实例（可选），其登记信息覆盖 device_info 中尚未写回的值
+        """
+        self.storage = storage
+        self.ttl = ttl
+        self.registry = registry
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.hits = 0
+        self.last_build_ms = 0.0
+
+    def current(self):
+        """返回未过期的快照，过期时重建（一次查询）"""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and now_ms() - snapshot.built_at < self.ttl * 1000:
+                self.hits += 1
+                return snapshot
+            snapshot = self._snapshot = self._build()
+            return snapshot
+
+    def _build(self):
+        started = time.perf_counter()
+        with self.storage.read() as conn:
+            rows = conn.execute(SNAPSHOT_SQL).fetchall()
+        records = self.registry.all() if self.registry is not None else ()
+        snapshot = FleetSnapshot(merge_devices(rows, records), now_ms())
+        self.builds += 1
+        self.last_build_ms = (time.perf_counter() - started) * 1000
+        return snapshot
+
+    def invalidate(self):
+        """丢弃缓存的快照，下次读取时重建"""
+        with self._lock:
+            self._snapshot = None
+
+    def get_stats(self):
+        snapshot = self._snapshot
+        return {
+            'devices': len(snapshot) if snapshot is not None else 0,
+            'age_ms': now_ms() - snapshot.built_at if snapshot is not None else None,
+            'ttl': self.ttl,
+            'builds': self.builds,
+            'hits': self.hits,
+            'last_build_ms': round(self.last_build_ms, 3)
+        }
+
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+轮询接口的HTTP缓存 - 数据版本号 + ETag/304 + 服务端响应缓存
+==========================================================
+
+功能:
+1. DataVersion：进程内的数据版本号，按资源分别递增：传感器读数（同时记录每个设备的版本）、
+   报警记录、设备登记信息；入库、AI回写、报警记录、设备信息写回时只递增变化的资源
+2. 被轮询的接口带 ETag（由 接口路径 + 查询参数 + 所依赖资源的数据版本 + 时间段 计算），
+   只看单个设备的接口（路径或查询参数中的 device_id）只依赖该设备的读数版本，其他设备持续入库时仍返回304；
+   客户端带 If-None-Match 且数据未变化时直接返回 304，不执行接口函数，也不访问数据库
+3. 服务端响应缓存按 (接口路径, 查询参数, 数据版本, 时间段) 保存最近的 200 响应（LRU），
+   多个标签页/多个客户端在同一版本内轮询时只计算一次
+4. 响应带 Cache-Control: no-cache，浏览器每次都会带 If-None-Match 重新验证，前端代码不需要修改
+
+说明:
+    版本号包含进程启动时间，重启后不会与旧的 ETag 冲突；多个Web进程各自维护版本号，
+    请求落到另一个进程时只是少一次304。
+    在线状态等随时间变化的字段不依赖数据版本，因此 ETag 还包含 max_age 秒的时间段，
+    数据不变时每个时间段最多重新计算一次。
+"""
+
+import time
+import hashlib
+import threading
+import logging
+from functools import wraps
+from collections import OrderedDict
+
+from flask import request, make_response, Response
+
+logger = logging.getLogger(__name__)
+
+
+# 数据资源
+READINGS = 'readings'  # 传感器读数（按设备）
+ALERTS = 'alerts'      # 报警记录
+DEVICES = 'devices'    # 设备登记信息（名称、位置、新登记的设备；在线时间随读数变化）
+RESOURCES = (READINGS, ALERTS, DEVICES)
+
+
+class DataVersion:
+    """进程内数据版本号（全局计数 + 每个资源/每个设备最后一次变化时的计数）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._epoch = format(time.time_ns() // 1_000_000, 'x')  # 进程启动标识
+        self._counter = 0
+        self._resources = dict.fromkeys(RESOURCES, 0)
+        self._devices = {}  # 设备ID -> 该设备读数最后一次变化时的计数
+        self._all_changed = 0  # 最后一次不指定资源的变化
+
+    def bump(self, *resources, devices=()):
+        """数据发生变化后调用
+
+        Args:
+            resources: 发生变化的资源，不指定时全部资源（包括所有设备的读数）都视为变化
+            devices: 读数发生变化的设备ID
+        """
+        with self._lock:
+            self._counter += 1
+            if not resources:
+                self._all_changed = self._counter
+            for resource in resources or RESOURCES:
+                self._resources[resource] = self._counter
+            for device_id in devices:
+                self._devices[device_id] = self._counter
+
+    def value_of(self, resources=None, device_id=None):
+        """接口依赖的资源的版本（resources 为None时为全部资源），device_id 指定时读数只看该设备"""
+        with self._lock:
+            parts = []
+            for resource in resources or RESOURCES:
+                if resource == READINGS and device_id is not None:
+                    parts.append(max(self._devices.get(device_id, 0), self._all_changed))
+                else:
+                    parts.append(self._resources[resource])
+        return f"{self._epoch}." + '.'.join(str(part) for part in parts)
+
+    @property
+    def value(self):
+        return f"{self._epoch}.{self._counter}"
+
+    @property
+    def counter(self):
+        return self._counter
+
+
+class HttpCache:
+    """按数据版本缓存GET接口的响应"""
+
+    def __init__(self, version, max_entries=256):
+        """
+        Args:
+            version: DataVersion 实例
+            max_entries: 服务端响应缓存的最大条数
+        """
+        self.version = version
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'not_modified': 0,  # 304
+            'cache_hits': 0,    # 服务端缓存命中
+            'misses': 0,        # 执行接口函数
+            'stored': 0,
+            'evicted': 0
+        }
+
+    def _lookup(self, key):
+        """查找缓存的响应，同时统计命中/未命中"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats['cache_hits'] += 1
+            else:
+                self.stats['misses'] += 1
+            return entry
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self.stats['stored'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evicted'] += 1
+
+    def cached(self, max_age=30, resources=None, device_arg='device_id'):
+        """接口装饰器（放在 @app.route 下面）
+
+        Args:
+            max_age: 时间段长度（秒），数据版本不变时响应最多复用这么久
+            resources: 接口依赖的数据资源（None 表示全部）
+            device_arg: 路径或查询参数中的设备ID参数名，请求带该参数时读数只看这个设备的版本
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+
+                query = tuple(sorted(request.args.items(multi=True)))
+                device_id = (request.view_args or {}).get(device_arg) or request.args.get(device_arg)
+                version = self.version.value_of(resources, device_id)
+                key = (request.path, query, version, int(time.time() // max_age))
+                etag = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=12).hexdigest()
+
+                if etag in request.if_none_match:
+                    self._count('not_modified')
+                    response = Response(status=304)
+                else:
+                    entry = self._lookup(key)
+                    if entry is not None:
+                        body, status, headers = entry
+                        response = Response(body, status=status, headers=headers)
+                    else:
+                        response = make_response(view(*args, **kwargs))
+                        if response.status_code != 200 or response.is_streamed:
+                            return response
+                        self._store(key, (response.get_data(), response.status_code,
+                                          [(name, value) for name, value in response.headers
+                                           if name.lower() != 'content-length']))
+
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            return wrapper
+        return decorator
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            entries = len(self._entries)
+            stats = dict(self.stats)
+        requests_total = stats['not_modified'] + stats['cache_hits'] + stats['misses']
+        return dict(stats,
+                    entries=entries,
+                    max_entries=self.max_entries,
+                    data_version=self.version.value,
+                    hit_rate=round((requests_total - stats['misses']) / requests_total, 3)
+                    if requests_total else 0.0)
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端数据接收压测工具 - MQTT → 数据库 → Socket.IO
+==================================================
+
+功能:
+1. 模拟N台主机和从机按固定间隔上报数据（主机数据取值与 fire_alarm_simulation_simple.py 的
+   SensorSimulator 正常模式一致、字段与主机固件一致；从机数据格式与 驱动/子机/main.py 一致）
+2. 通过本地MQTT broker发布（--broker），或直接调用 on_message 跳过网络（--direct）
+3. 在同一进程内加载 app.py，挂接 Socket.IO 测试客户端，记录每条数据经过各阶段的时间
+4. 输出吞吐量、各阶段 p50/p95/p99 延迟，并按设备数量递增找出饱和点
+
+阶段:
+    broker   发布 -> on_message 收到
+    process  on_message -> 放入写缓冲（解析、规整、状态更新）
+    db       放入写缓冲 -> 批量提交完成
+    emit     放入写缓冲 -> 所在帧通过 Socket.IO 发出（同帧内被合并的数据不计）
+    e2e_db   发布 -> 数据库提交
+    e2e_emit 发布 -> Socket.IO 发出
+
+用法:
+    python ingest_benchmark.py --direct --devices 10,50,100 --duration 15
+    python ingest_benchmark.py --broker 127.0.0.1 --port 1883 --devices 10,50,100,200 --interval 1.5
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import argparse
+import tempfile
+import threading
+import logging
+from collections import defaultdict, deque
+from datetime import datetime
+
+from timeutil import to_ms
+
+STAGES = ('broker', 'process', 'db', 'emit', 'e2e_db', 'e2e_emit')
+
+
+class VirtualMaster:
+    """虚拟主机：SensorSimulator 正常模式的取值，主机固件的上报字段"""
+
+    def __init__(self, index):
+        self.device_id = f"bench_master_{index:04d}"
+        self.topic = f"esp32/{self.device_id}/data/json"
+        self.data_count = 0
+
+    def payload(self):
+        self.data_count += 1
+        smoke = random.randint(20, 60)
+        return {
+            'device_id': self.device_id,
+            'flame': max(1000, min(2000, 1500 + random.randint(-200, 200))),
+            'smoke': max(0, 2000 - smoke),  # MQ2模拟值格式
+            'temperature': random.randint(24, 28),
+            'humidity': max(30, min(80, 50 + random.randint(-10, 10))),
+            'light': round(random.uniform(10, 60), 1),
+            'status': 'normal',
+            'timestamp': time.time(),
+            'data_count': self.data_count
+        }
+
+
+class VirtualSlave:
+    """虚拟从机：驱动/子机/main.py 的上报格式"""
+
+    def __init__(self, index):
+        self.device_id = f"bench_slave_{index:04d}"
+        self.topic = f"esp32/{self.device_id}/data/json"
+        self.sequence = 0
+
+    def payload(self):
+        self.sequence += 1
+        flame = random.randint(1300, 2000)
+        smoke = random.randint(1500, 2200)
+        return {
+            'type': 'sensor_data',
+            'slave_id': self.device_id,
+            'timestamp': time.time(),
+            'sensors': {
+                'flame': {'analog': flame, 'digital': 1, 'status': 'normal'},
+                'mq2_smoke': {'analog': smoke, 'digital': 1, 'status': 'normal'}
+            },
+            'overall_status': 'normal',
+            'sequence': self.sequence
+        }
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+class StageRecorder:
+    """按数据关联各阶段时间点"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.sent = {}                       # 原始载荷 -> (设备ID, 发布时间)
+            self.received = defaultdict(deque)   # 设备ID -> [(发布时间, 收到时间)]
+            self.pending_db = {}                 # (设备ID, 记录时间) -> (发布时间, 入缓冲时间)
+            self.pending_emit = {}
+            self.latencies = {stage: [] for stage in STAGES}
+            self.counts = defaultdict(int)
+
+    def published(self, payload, device_id):
+        with self._lock:
+            self.sent[payload] = (device_id, time.perf_counter())
+            self.counts['published'] += 1
+
+    def on_received(self, payload):
+        now = time.perf_counter()
+        with self._lock:
+            entry = self.sent.pop(payload, None)
+            if entry is None:
+                return
+            device_id, sent_at = entry
+            self.received[device_id].append((sent_at, now))
+            self.latencies['broker'].append(now - sent_at)
+            self.counts['received'] += 1
+
+    def on_buffered(self, row):
+        now = time.perf_counter()
+        with self._lock:
+            queue = self.received.get(row['device_id'])
+            if not queue:
+                return
+            sent_at, received_at = queue.popleft()
+            key = (row['device_id'], row['timestamp'])
+            self.pending_db[key] = self.pending_emit[key] = (sent_at, now)
+            self.latencies['process'].append(now - received_at)
+            self.counts['buffered'] += 1
+
+    def on_committed(self, rows):
+        now = time.perf_counter()
+        with self._lock:
+            for row in rows:
+                entry = self.pending_db.pop((row['device_id'], row['timestamp']), None)
+                if entry is None:
+                    continue
+                sent_at, buffered_at = entry
+                self.latencies['db'].append(now - buffered_at)
+                self.latencies['e2e_db'].append(now - sent_at)
+                self.counts['committed'] += 1
+
+    def on_emitted(self, payloads):
+        now = time.perf_counter()
+        with self._lock:
+            for payload in payloads:
+                key = (payload['device_id'], to_ms(datetime.fromisoformat(payload['timestamp'])))
+                entry = self.pending_emit.pop(key, None)
+                if entry is None:
+                    continue
+                sent_at, buffered_at = entry
+                self.latencies['emit'].append(now - buffered_at)
+                self.latencies['e2e_emit'].append(now - sent_at)
+                self.counts['emitted'] += 1
+
+    def summary(self):
+        with self._lock:
+            latencies = {stage: list(values) for stage, values in self.latencies.items()}
+            counts = dict(self.counts)
+        stages = {}
+        for stage, values in latencies.items():
+            stages[stage] = {
+                'count': len(values),
+                'p50_ms': _ms(percentile(values, 50)),
+                'p95_ms': _ms(percentile(values, 95)),
+                'p99_ms': _ms(percentile(values, 99)),
+                'max_ms': _ms(max(values) if values else None)
+            }
+        return counts, stages
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+class TimingEmitter:
+    """包装 socketio，记录帧发出时间"""
+
+    def __init__(self, target, recorder, batch_event):
+        self.target = target
+        self.recorder = recorder
+        self.batch_event = batch_event
+
+    def emit(self, event, data, *args, **kwargs):
+        self.target.emit(event, data, *args, **kwargs)
+        if event == self.batch_event:
+            self.recorder.on_emitted(data.get('sensor_data', []))
+
+
+class FakeMessage:
+    """直接调用 on_message 时使用的消息对象"""
+
+    __slots__ = ('topic', 'payload')
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def load_app(args, recorder):
+    """在临时数据目录中加载 app.py 并挂接计时"""
+    os.environ['FIRE_ALARM_DATA_DIR'] = args.data_dir or tempfile.mkdtemp(prefix='fire_alarm_bench_')
+    os.environ['FIRE_ALARM_ROLE'] = 'all'
+    os.environ['FIRE_ALARM_MQTT_CLIENT_ID'] = f"fire_alarm_benchmark_{os.getpid()}"
+    os.environ['FIRE_ALARM_MQTT_BROKER'] = args.broker or '127.0.0.1'
+    os.environ['FIRE_ALARM_MQTT_PORT'] = str(args.port)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    import app as server
+    logging.getLogger().setLevel(logging.WARNING)
+
+    original_on_message = server.on_message
+
+    def timed_on_message(client, userdata, msg):
+        recorder.on_received(msg.payload)
+        original_on_message(client, userdata, msg)
+
+    server.mqtt_client.on_message = timed_on_message
+
+    buffer = server.ingest_buffer
+    original_append = buffer.append
+    original_flush = buffer.flush_handler
+
+    def timed_append(row):
+        recorder.on_buffered(row)
+        original_append(row)
+
+    def timed_flush(rows):
+        original_flush(rows)
+        recorder.on_committed(rows)
+
+    buffer.append = timed_append
+    buffer.flush_handler = timed_flush
+    server.broadcaster.socketio = TimingEmitter(server.broadcaster.socketio, recorder,
+                                                server.broadcaster.batch_event)
+    return server, timed_on_message
+
+
+def make_publisher(args, server, on_message):
+    """返回 publish(topic, payload_bytes)"""
+    if args.direct:
+        return lambda topic, payload: on_message(None, None, FakeMessage(topic, payload))
+
+    import paho.mqtt.client as mqtt
+    client = mqtt.Client(client_id=f"fire_alarm_bench_pub_{os.getpid()}")
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+
+    deadline = time.time() + 10
+    while not server.mqtt_client.is_connected() and time.time() < deadline:
+        time.sleep(0.1)
+    if not server.mqtt_client.is_connected():
+        raise RuntimeError(f"服务端未能连接到broker {args.broker}:{args.port}")
+    time.sleep(0.5)  # 等待订阅完成
+    return lambda topic, payload: client.publish(topic, payload, qos=0)
+
+
+def run_step(args, server, recorder, publish, masters):
+    """以指定设备数量运行一轮，返回结果字典"""
+    devices = [VirtualMaster(i) for i in range(masters)]
+    devices += [VirtualSlave(i) for i in range(masters * args.slaves_per_master)]
+    offered_rate = len(devices) / args.interval
+
+    recorder.reset()
+    started = time.perf_counter()
+    # 设备的首次上报均匀分布在一个间隔内
+    schedule = [(started + args.interval * i / len(devices), i) for i in range(len(devices))]
+    heapq.heapify(schedule)
+    max_lag = 0.0
+
+    end = started + args.duration
+    while schedule:
+        due, index = heapq.heappop(schedule)
+        if due >= end:
+            break
+        now = time.perf_counter()
+        if due > now:
+            time.sleep(due - now)
+        else:
+            max_lag = max(max_lag, now - due)
+        device = devices[index]
+        payload = json.dumps(device.payload()).encode()
+        recorder.published(payload, device.device_id)
+        publish(device.topic, payload)
+        heapq.heappush(schedule, (due + args.interval, index))
+    publish_seconds = time.perf_counter() - started
+
+    # 等待剩余数据入库和推送
+    drain_deadline = time.time() + args.drain
+    while time.time() < drain_deadline:
+        server.ingest_buffer.flush()
+        server.broadcaster.flush()
+        counts, _ = recorder.summary()
+        if counts.get('committed', 0) >= counts.get('published', 0):
+            break
+        time.sleep(0.2)
+
+    counts, stages = recorder.summary()
+    committed = counts.get('committed', 0)
+    achieved_rate = committed / publish_seconds if publish_seconds else 0
+    return {
+        'masters': masters,
+        'slaves': masters * args.slaves_per_master,
+        'devices': len(devices),
+        'offered_per_sec': round(offered_rate, 1),
+        'achieved_per_sec': round(achieved_rate, 1),
+        'published': counts.get('published', 0),
+        'committed': committed,
+        'emitted': counts.get('emitted', 0),
+        'coalesced': counts.get('buffered', 0) - counts.get('emitted', 0),
+        'lost': counts.get('published', 0) - committed,
+        'max_publish_lag_ms': round(max_lag * 1000, 1),
+        'stages': stages
+    }
+
+
+def is_saturated(result, slo_ms):
+    """达到饱和：吞吐低于发送速率95%，或端到端入库p99超出SLO，或有数据丢失"""
+    p99 = result['stages']['e2e_db']['p99_ms']
+    return (result['achieved_per_sec'] < 0.95 * result['offered_per_sec']
+            or (p99 is not None and p99 > slo_ms)
+            or result['lost'] > 0)
+
+
+def print_result(result):
+    print(f"\n== {result['masters']} 主机 + {result['slaves']} 从机 "
+          f"(发送 {result['offered_per_sec']}/s, 入库 {result['achieved_per_sec']}/s) ==")
+    print(f"   发布 {result['published']}  入库 {result['committed']}  推送 {result['emitted']}  "
+          f"帧内合并 {result['coalesced']}  丢失 {result['lost']}  最大发送滞后 {result['max_publish_lag_ms']}ms")
+    print(f"   {'阶段':<10}{'数量':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for stage in STAGES:
+        stats = result['stages'][stage]
+        cells = ''.join(f"{'-' if stats[k] is None else stats[k]:>10}" for k in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+        print(f"   {stage:<10}{stats['count']:>8}{cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='火灾报警系统端到端数据接收压测')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--broker', help='本地MQTT broker地址（如 127.0.0.1）')
+    mode.add_argument('--direct', action='store_true', help='不经过broker，直接调用 on_message')
+    parser.add_argument('--port', type=int, default=1883, help='MQTT broker端口')
+    parser.add_argument('--devices', default='10,50,100,200', help='每轮的主机数量，逗号分隔')
+    parser.add_argument('--slaves-per-master', type=int, default=1, help='每台主机对应的从机数量')
+    parser.add_argument('--interval', type=float, default=1.5, help='每台设备的上报间隔（秒），默认与模拟器一致')
+    parser.add_argument('--duration', type=float, default=20.0, help='每轮发送时长（秒）')
+    parser.add_argument('--drain', type=float, default=10.0, help='每轮结束后等待入库的最长时间（秒）')
+    parser.add_argument('--clients', type=int, default=1, help='挂接的 Socket.IO 测试客户端数量')
+    parser.add_argument('--slo-ms', type=float, default=1000.0, help='端到端入库 p99 延迟上限（毫秒）')
+    parser.add_argument('--data-dir', help='数据库目录（默认使用临时目录）')
+    parser.add_argument('--json', help='把结果写入JSON文件')
+    parser.add_argument('--keep-going', action='store_true', help='达到饱和后继续运行剩余轮次')
+    args = parser.parse_args()
+
+    recorder = StageRecorder()
+    server, on_message = load_app(args, recorder)
+    publish = make_publisher(args, server, on_message)
+
+    # Socket.IO 测试客户端：后台线程定期取走收到的事件，统计帧数
+    clients = [server.socketio.test_client(server.app) for _ in range(args.clients)]
+    frames = defaultdict(int)
+    stop_event = threading.Event()
+
+    def drain_clients():
+        while not stop_event.wait(0.5):
+            for client in clients:
+                for packet in client.get_received():
+                    frames[packet['name']] += 1
+
+    threading.Thread(target=drain_clients, daemon=True).start()
+
+    results = []
+    saturation = None
+    for masters in [int(value) for value in args.devices.split(',') if value.strip()]:
+        result = run_step(args, server, recorder, publish, masters)
+        results.append(result)
+        print_result(result)
+        if saturation is None and is_saturated(result, args.slo_ms):
+            saturation = result['devices']
+            print(f"   >>> 达到饱和: {result['devices']} 台设备")
+            if not args.keep_going:
+                break
+
+    stop_event.set()
+    print(f"\n饱和点: {f'{saturation} 台设备' if saturation else '未达到（可增加设备数量）'}")
+    print(f"Socket.IO 客户端收到的事件: {dict(frames)}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'mode': 'direct' if args.direct else f"broker {args.broker}:{args.port}",
+                'interval': args.interval,
+                'duration': args.duration,
+                'clients': args.clients,
+                'slo_ms': args.slo_ms,
+                'saturation_devices': saturation,
+                'steps': results,
+                'server_stats': {
+                    'write_buffer': server.ingest_buffer.get_stats(),
+                    'broadcaster': server.broadcaster.get_stats(),
+                    'dedup': server.sequence_dedup.get_stats()
+                }
+            }, f, ensure_ascii=False, indent=2, default=str)
+        print(f"结果已写入 {args.json}")
+
+    server.ingest_buffer.stop()
+    server.broadcaster.stop()
+
+
+if __name__ == '__main__':
+    main()
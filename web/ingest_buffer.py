@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传感器数据写缓冲 - 批量入库（组提交）
+=====================================
+
+功能:
+1. MQTT线程只把规整后的读数放入内存缓冲，立即返回
+2. 后台线程按条数或时间（如200条/250毫秒）触发一次批量写入
+3. 一个批次只开一个事务，多行INSERT一次提交
+4. 统计队列深度、刷新延迟，退出时把剩余数据写完
+5. 批次写入失败时区分原因：数据库被锁/暂时不可用时整批放回队首稍后重试；
+   其他错误（某条数据违反约束等）对半拆分重写，单独写入仍失败的数据移入隔离区并计数，不阻塞其他数据
+"""
+
+import sqlite3
+import threading
+import time
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# 可重试的 SQLite 错误（数据库被锁、忙、暂时无法打开或读写文件）
+RETRYABLE_MESSAGES = ('locked', 'busy', 'unable to open', 'disk i/o')
+
+
+def is_retryable(error):
+    """写入错误是否为暂时性的（稍后整批重试），否则认为是数据本身的问题"""
+    while error is not None:
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return True
+        if isinstance(error, sqlite3.OperationalError):
+            return any(message in str(error).lower() for message in RETRYABLE_MESSAGES)
+        # SQLAlchemy 把驱动的异常保存在 orig 中
+        error = getattr(error, 'orig', None) or error.__cause__
+    return False
+
+
+class SensorIngestBuffer:
+    """写后批量入库缓冲"""
+
+    def __init__(self, flush_handler, max_rows=200, max_delay=0.25, capacity=20000, quarantine_size=100,
+                 retryable=is_retryable):
+        """
+        Args:
+            flush_handler: 批量写入函数 flush_handler(rows)，rows为字典列表，一次调用在一个事务中完成
+            max_rows: 达到该条数立即刷新
+            max_delay: 最早一条数据等待的最长时间（秒）
+            capacity: 缓冲上限，数据库长时间不可用时丢弃最旧的数据
+            quarantine_size: 隔离区保留的最近无法写入的数据条数
+            retryable: 判断写入错误是否可整批重试的函数
+        """
+        self.flush_handler = flush_handler
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.capacity = capacity
+        self.retryable = retryable
+        self.quarantine = deque(maxlen=quarantine_size)  # (数据, 错误信息, 时间)
+
+        self._rows = deque()
+        self._first_at = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # 刷新进行中时持有，保证补丁与写入不交错
+        self._thread = None
+        self._running = False
+
+        # 运行统计
+        self.stats = {
+            'rows_received': 0,
+            'rows_flushed': 0,
+            'rows_dropped': 0,
+            'rows_rejected': 0,  # 单独写入仍失败、移入隔离区的数据
+            'flush_count': 0,
+            'flush_errors': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+
+    def start(self):
+        """启动后台刷新线程"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._flush_loop, name='sensor-ingest-flush', daemon=True)
+        self._thread.start()
+        logger.info(f"传感器写缓冲启动: 批量 {self.max_rows} 条 / {int(self.max_delay * 1000)} 毫秒")
+
+    def stop(self, timeout=10.0):
+        """停止刷新线程并写入剩余数据"""
+        if not self._running:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        # 线程退出后再兜底刷新一次
+        self.flush()
+        logger.info(f"传感器写缓冲已停止，累计写入 {self.stats['rows_flushed']} 条")
+
+    def append(self, row):
+        """追加一条待写入的读数（MQTT线程调用，不做任何IO）"""
+        with self._cond:
+            if len(self._rows) >= self.capacity:
+                self._rows.popleft()
+                self.stats['rows_dropped'] += 1
+            was_empty = not self._rows
+            if was_empty:
+                self._first_at = time.monotonic()
+            self._rows.append(row)
+            self.stats['rows_received'] += 1
+            # 首条数据唤醒刷新线程开始计时，攒满一批时立即刷新
+            if was_empty or len(self._rows) >= self.max_rows:
+                self._cond.notify()
+
+    def patch(self, predicate, changes):
+        """修改尚未写入的读数
+
+        Args:
+            predicate: 判断函数 predicate(row) -> bool
+            changes: 需要更新的字段字典
+
+        Returns:
+            bool: 是否在缓冲中找到并修改；返回False时数据已落库
+        """
+        with self._flush_lock:
+            with self._cond:
+                for row in reversed(self._rows):
+                    if predicate(row):
+                        row.update(changes)
+                        return True
+        return False
+
+    def flush(self):
+        """立即把缓冲中的数据写入数据库，返回写入条数（失败返回None）"""
+        with self._flush_lock:
+            with self._cond:
+                if not self._rows:
+                    return 0
+                batch = list(self._rows)
+                self._rows.clear()
+                self._first_at = None
+            return self._write_batch(batch)
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if len(self._rows) >= self.max_rows:
+                        break
+                    if self._rows:
+                        remaining = self.max_delay - (time.monotonic() - self._first_at)
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if not self._running:
+                    return
+            if self.flush() is None:
+                time.sleep(1.0)  # 数据库不可用时退避，避免空转重试
+
+    def _write_batch(self, batch):
+        """写入一个批次，返回写入条数；遇到可重试的错误时未写入的数据放回队首，返回None"""
+        started = time.perf_counter()
+        try:
+            self.flush_handler(batch)
+            written, pending = len(batch), []
+        except Exception as e:
+            with self._cond:
+                self.stats['flush_errors'] += 1
+            if self.retryable(e):
+                logger.error(f"批量写入失败({len(batch)}条)，稍后重试: {e}")
+                written, pending = 0, batch
+            else:
+                logger.warning(f"批量写入失败({len(batch)}条)，拆分重写以隔离错误数据: {e}")
+                written, pending = self._write_halves(batch, e)
+
+        if pending:
+            self._requeue(pending)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._cond:
+            self.stats['rows_flushed'] += written
+            if written:
+                self.stats['flush_count'] += 1
+                self.stats['last_batch_size'] = written
+                self.stats['last_flush_ms'] = round(elapsed_ms, 2)
+                self.stats['max_flush_ms'] = round(max(self.stats['max_flush_ms'], elapsed_ms), 2)
+                self.stats['total_flush_ms'] += elapsed_ms
+        return None if pending else written
+
+    def _write_split(self, rows):
+        """写入失败批次的一部分：失败时继续对半拆分，单条仍失败时移入隔离区
+
+        Returns:
+            (写入条数, 因可重试的错误而未写入的数据)
+        """
+        try:
+            self.flush_handler(rows)
+            return len(rows), []
+        except Exception as e:
+            if self.retryable(e):
+                return 0, rows
+            return self._write_halves(rows, e)
+
+    def _write_halves(self, rows, error):
+        """分成两半分别写入（error 为整体写入时的错误，只剩一条时该条移入隔离区）"""
+        if len(rows) == 1:
+            self._reject(rows[0], error)
+            return 0, []
+        middle = len(rows) // 2
+        written, pending = self._write_split(rows[:middle])
+        if pending:
+            return written, pending + rows[middle:]
+        more, pending = self._write_split(rows[middle:])
+        return written + more, pending
+
+    def _reject(self, row, error):
+        logger.error(f"数据无法写入，已移入隔离区: {error} - {row}")
+        with self._cond:
+            self.quarantine.append((row, str(error), time.time()))
+            self.stats['rows_rejected'] += 1
+
+    def _requeue(self, rows):
+        with self._cond:
+            # 放回队首等待下次刷新，超出容量的部分丢弃最旧数据
+            self._rows.extendleft(reversed(rows))
+            while len(self._rows) > self.capacity:
+                self._rows.popleft()
+                self.stats['rows_dropped'] += 1
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+
+    def get_stats(self):
+        """获取缓冲运行统计"""
+        with self._cond:
+            stats = dict(self.stats)
+            stats['queue_depth'] = len(self._rows)
+            stats['quarantined'] = len(self.quarantine)
+            stats['oldest_pending_ms'] = round((time.monotonic() - self._first_at) * 1000, 1) if self._first_at else 0
+        stats['avg_flush_ms'] = round(stats.pop('total_flush_ms') / stats['flush_count'], 2) if stats['flush_count'] else 0
+        stats.update({
+            'max_rows': self.max_rows,
+            'max_delay_ms': int(self.max_delay * 1000),
+            'capacity': self.capacity
+        })
+        return stats
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据去重与丢包统计 - 配合 QoS 1 至少一次投递
+============================================
+
+功能:
+1. QoS 1 + 持久会话下broker可能重复投递，按设备维护有界的 (sequence/timestamp) 窗口去重
+2. 从机数据带递增的 sequence：统计序号缺口（丢包）、迟到补齐和设备重启导致的序号回绕
+3. 主机数据没有序号：按设备时间戳 + 读数指纹去重，不统计缺口
+4. 按设备输出接收/重复/缺口/丢包率，用实际数据评估链路丢包
+"""
+
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceWindow:
+    """单个设备的去重窗口与计数"""
+
+    __slots__ = ('seen', 'highest', 'highest_timestamp', 'received', 'duplicates', 'gaps', 'late', 'resets')
+
+    def __init__(self):
+        self.seen = OrderedDict()  # sequence 或 (timestamp, 指纹) -> 设备时间戳
+        self.highest = None        # 已接收的最大序号
+        self.highest_timestamp = None
+        self.received = 0
+        self.duplicates = 0
+        self.gaps = 0              # 尚未补齐的序号缺口
+        self.late = 0              # 迟到后补齐的序号
+        self.resets = 0            # 序号重新开始（设备重启）
+
+    def to_dict(self):
+        expected = self.received + self.gaps
+        return {
+            'received': self.received,
+            'duplicates': self.duplicates,
+            'gaps': self.gaps,
+            'late': self.late,
+            'resets': self.resets,
+            'last_sequence': self.highest,
+            'loss_rate': round(self.gaps / expected, 4) if expected else 0.0
+        }
+
+
+class SequenceDeduplicator:
+    """按设备的有界去重窗口"""
+
+    def __init__(self, window=256, max_devices=4096):
+        """
+        Args:
+            window: 每个设备记住的最近消息数
+            max_devices: 最多跟踪的设备数，超出时淘汰最久未上报的设备
+        """
+        self.window = window
+        self.max_devices = max_devices
+        self._devices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def accept(self, device_id, sequence=None, timestamp=None, fingerprint=None):
+        """判断一条读数是否为首次到达
+
+        Args:
+            device_id: 设备ID
+            sequence: 设备递增序号（从机数据），为None时按时间戳去重
+            timestamp: 设备端时间戳，用于区分重复投递与设备重启后的同一序号
+            fingerprint: 没有序号时与时间戳一起作为去重键（如读数元组）
+
+        Returns:
+            bool: True 表示需要处理；False 表示重复投递，应丢弃
+        """
+        if sequence is None and timestamp is None:
+            return True
+
+        with self._lock:
+            window = self._devices.get(device_id)
+            if window is None:
+                window = self._devices[device_id] = DeviceWindow()
+                if len(self._devices) > self.max_devices:
+                    self._devices.popitem(last=False)
+            else:
+                self._devices.move_to_end(device_id)
+
+            if sequence is None:
+                key = (timestamp, fingerprint)
+                if key in window.seen:
+                    window.duplicates += 1
+                    return False
+            else:
+                key = sequence
+                if not self._check_sequence(window, sequence, timestamp):
+                    return False
+
+            window.received += 1
+            window.seen[key] = timestamp
+            while len(window.seen) > self.window:
+                window.seen.popitem(last=False)
+            return True
+
+    def _check_sequence(self, window, sequence, timestamp):
+        if sequence in window.seen:
+            if window.seen[sequence] == timestamp:
+                window.duplicates += 1
+                return False
+            # 同一序号但时间戳不同：设备重启后序号重新开始
+            self._reset(window, sequence, timestamp)
+            return True
+
+        if window.highest is None:
+            self._advance(window, sequence, timestamp)
+        elif sequence > window.highest:
+            window.gaps += sequence - window.highest - 1
+            self._advance(window, sequence, timestamp)
+        elif window.gaps and window.highest - sequence <= self.window and \
+                (timestamp is None or window.highest_timestamp is None or timestamp <= window.highest_timestamp):
+            # 窗口内的迟到数据（比最大序号的数据更早），补齐之前记为缺口的序号
+            window.late += 1
+            window.gaps -= 1
+        else:
+            # 小于已知最大序号且不是迟到数据：设备重启或计数回绕
+            self._reset(window, sequence, timestamp)
+        return True
+
+    def _advance(self, window, sequence, timestamp):
+        window.highest = sequence
+        window.highest_timestamp = timestamp
+
+    def _reset(self, window, sequence, timestamp):
+        window.resets += 1
+        window.seen.clear()
+        self._advance(window, sequence, timestamp)
+
+    def get_stats(self):
+        """获取去重与丢包统计（总计 + 按设备）"""
+        with self._lock:
+            devices = {device_id: window.to_dict() for device_id, window in self._devices.items()}
+
+        totals = {'received': 0, 'duplicates': 0, 'gaps': 0, 'late': 0, 'resets': 0}
+        for stats in devices.values():
+            for key in totals:
+                totals[key] += stats[key]
+        expected = totals['received'] + totals['gaps']
+        totals['loss_rate'] = round(totals['gaps'] / expected, 4) if expected else 0.0
+        totals['window'] = self.window
+        totals['devices'] = devices
+        return totals
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据接收工作进程 - MQTT共享订阅水平扩展
+=======================================
+
+功能:
+1. 以 ingest 角色运行：通过 $share/<组名>/esp32/+/... 共享订阅，多个进程分担同一broker的设备消息
+2. 工作进程负责解析、入库、AI复核；处理结果不直接推送浏览器，而是发布到内部主题
+3. Web进程（web 角色）只订阅内部主题，更新内存中的设备状态并转发给WebSocket客户端，不做任何数据接收
+4. 每个工作进程在单个MQTT网络线程中顺序处理消息，同一设备在同一进程内保持顺序；
+   跨进程时由Web进程按接收时间单调更新设备状态，旧数据不会覆盖新状态
+
+部署:
+    FIRE_ALARM_ROLE=web python app.py                # 前端与查询接口
+    FIRE_ALARM_WORKER_ID=1 python ingest_worker.py   # 可启动多个，共享订阅分担负载
+    FIRE_ALARM_WORKER_ID=2 python ingest_worker.py   # 每个工作进程使用不同ID（持久会话的客户端ID）
+
+说明:
+    Mosquitto 对共享订阅按消息轮询分发；需要严格的设备亲和时可使用支持按主题哈希分发的broker
+    （如 EMQX 的 hash_topic 策略，主题中包含设备ID）。
+"""
+
+import os
+import json
+import signal
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 运行角色
+ROLE_ALL = 'all'        # 单进程：接收 + 前端（默认，与原有部署一致）
+ROLE_WEB = 'web'        # 只提供前端和查询接口，从内部主题获取实时数据
+ROLE_INGEST = 'ingest'  # 只负责数据接收
+ROLES = (ROLE_ALL, ROLE_WEB, ROLE_INGEST)
+
+# 设备上报主题
+DEVICE_TOPICS = ('esp32/+/data/json', 'esp32/+/alert/#', 'esp32/+/status/#', 'esp32/+/control')
+
+# 工作进程 -> Web进程的内部事件主题
+INTERNAL_TOPIC_PREFIX = 'fire_alarm/internal/events'
+
+# 工作进程附加在批量事件中的设备状态（Web进程消费后不会转发给浏览器）
+DEVICE_STATE_EVENT = 'device_state'
+
+
+def get_role():
+    """读取运行角色（环境变量 FIRE_ALARM_ROLE）"""
+    role = os.environ.get('FIRE_ALARM_ROLE', ROLE_ALL).strip().lower()
+    if role not in ROLES:
+        logger.warning(f"未知的运行角色 {role}，按 {ROLE_ALL} 运行")
+        return ROLE_ALL
+    return role
+
+
+def shared_topic(topic, group):
+    """生成共享订阅主题 $share/<group>/<topic>"""
+    return f"$share/{group}/{topic}"
+
+
+def subscription_topics(role, group):
+    """按角色返回需要订阅的主题列表"""
+    if role == ROLE_WEB:
+        return [f"{INTERNAL_TOPIC_PREFIX}/#"]
+    if role == ROLE_INGEST:
+        return [shared_topic(topic, group) for topic in DEVICE_TOPICS]
+    return list(DEVICE_TOPICS)
+
+
+def is_internal_topic(topic):
+    return topic.startswith(INTERNAL_TOPIC_PREFIX + '/')
+
+
+def decode_internal_event(topic, payload):
+    """解析内部事件，返回 (事件名, 数据)"""
+    return topic[len(INTERNAL_TOPIC_PREFIX) + 1:], json.loads(payload)
+
+
+class MqttEventEmitter:
+    """替代 socketio 的事件发送端：把推送事件发布到内部主题
+
+    与 SocketBroadcaster 配合使用，工作进程中按帧合并后的批量事件经MQTT转交Web进程。
+    """
+
+    def __init__(self, client, prefix=INTERNAL_TOPIC_PREFIX, qos=0):
+        self.client = client
+        self.prefix = prefix
+        self.qos = qos
+
+    def emit(self, event, data):
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+        result = self.client.publish(f"{self.prefix}/{event}", payload, qos=self.qos)
+        if result.rc != 0:
+            raise RuntimeError(f"内部事件发布失败，返回码: {result.rc}")
+
+
+def main():
+    """以 ingest 角色启动工作进程，直到收到退出信号"""
+    os.environ['FIRE_ALARM_ROLE'] = ROLE_INGEST
+
+    import app  # noqa: F401  导入即完成数据库、写缓冲、MQTT共享订阅等初始化
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+
+    logger.info(f"数据接收工作进程已启动 (PID {os.getpid()})，按 Ctrl+C 退出")
+    stop_event.wait()
+    logger.info("数据接收工作进程退出，写入剩余数据...")
+    # 写缓冲、设备注册表等通过 atexit 在进程退出时刷新
+
+
+if __name__ == '__main__':
+    main()
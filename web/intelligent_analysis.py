@@ -14,7 +14,6 @@
 """
 
 from ai import new
-import sqlite3
 import json
 import numpy as np
 from datetime import datetime, timedelta
@@ -22,6 +21,9 @@ import statistics
 import math
 import logging
 import os
+from storage import get_storage
+from timeutil import now_ms
+from tsengine import TableSeriesReader, column_values
 
 logger = logging.getLogger(__name__)
 
@@ -39,51 +41,31 @@ class IntelligentAnalyzer:
     def __init__(self, db_path=None):
         self.db_path = db_path or _default_db_path()
         self.device_health_cache = {}
+        self.series = None  # 传感器时序读取接口（tsengine.SeriesReader），未设置时直接读 sensor_data
+
+    @property
+    def series_reader(self):
+        if self.series is None:
+            self.series = TableSeriesReader(get_storage(self.db_path))
+        return self.series
+
+    def _recent_rows(self, device_id, limit=20):
+        """设备最近 limit 条读数 (flame, smoke, temperature, humidity, light_level, timestamp)，按时间倒序"""
+        series = self.series_reader.recent(device_id, limit)
+        columns = [column_values(series, name) for name in
+                   ('flame_value', 'smoke_value', 'temperature', 'humidity', 'light_level', 'timestamp')]
+        return list(zip(*columns))[::-1]
 
     def get_sensor_data_analysis(self, device_id=None, hours=24):
         """获取传感器数据分析 - 使用每个设备的前20条数据"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            if device_id:
-                # 查询指定设备的前20条数据
-                cursor.execute("""
-                    SELECT device_id, flame_value, smoke_value, temperature, humidity, light_level, timestamp
-                    FROM sensor_data
-                    WHERE device_id = ?
-                    ORDER BY timestamp DESC
-                    LIMIT 20
-                """, (device_id,))
-            else:
-                # 查询所有设备的数据，每个设备取前20条
-                cursor.execute("""
-                    SELECT device_id, flame_value, smoke_value, temperature, humidity, light_level, timestamp
-                    FROM sensor_data
-                    ORDER BY device_id, timestamp DESC
-                """)
-
-            data = cursor.fetchall()
-            conn.close()
+            # 指定设备取前20条数据，否则每个设备各取前20条
+            device_ids = [device_id] if device_id else [row[0] for row in self.series_reader.devices()]
+            data = [(row_device,) + row for row_device in device_ids for row in self._recent_rows(row_device)]
 
             if not data:
                 return {"error": "没有足够的数据进行分析"}
 
-            # 如果是查询所有设备，需要按设备分组，每个设备取前20条
-            if not device_id:
-                device_data = {}
-                for row in data:
-                    device_id_row = row[0]
-                    if device_id_row not in device_data:
-                        device_data[device_id_row] = []
-                    if len(device_data[device_id_row]) < 20:  # 每个设备最多20条
-                        device_data[device_id_row].append(row)
-
-                # 合并所有设备的数据
-                data = []
-                for device_rows in device_data.values():
-                    data.extend(device_rows)
-
             # 转换为字典格式
             sensor_readings = {
                 'flame': [],  # 注意：数据库中是flame_value，但分析中保持为flame
@@ -286,20 +268,8 @@ class IntelligentAnalyzer:
                 if datetime.now().timestamp() - cache_time < 300:  # 5分钟缓存
                     return self.device_health_cache[cache_key]['score']
 
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
             # 获取设备的前20条数据
-            cursor.execute("""
-                SELECT flame_value, smoke_value, temperature, humidity, light_level, timestamp
-                FROM sensor_data
-                WHERE device_id = ?
-                ORDER BY timestamp DESC
-                LIMIT 20
-            """, (device_id,))
-
-            data = cursor.fetchall()
-            conn.close()
+            data = self._recent_rows(device_id)
 
             if len(data) < 5:
                 return {"score": 85, "status": "insufficient_data", "factors": []}
@@ -345,16 +315,8 @@ class IntelligentAnalyzer:
         if len(timestamps) < 2:
             return {'score': 60, 'status': 'poor', 'message': '时间戳数据异常'}
 
-        # 计算平均间隔
-        intervals = []
-        for i in range(1, len(timestamps)):
-            try:
-                t1 = datetime.fromisoformat(timestamps[i])
-                t2 = datetime.fromisoformat(timestamps[i-1])
-                interval = (t2 - t1).total_seconds()
-                intervals.append(interval)
-            except:
-                continue
+        # 计算平均间隔（时间戳为毫秒整数，按时间倒序）
+        intervals = [(timestamps[i - 1] - timestamps[i]) / 1000 for i in range(1, len(timestamps))]
 
         if not intervals:
             return {'score': 60, 'status': 'poor', 'message': '时间格式错误'}
@@ -413,18 +375,8 @@ class IntelligentAnalyzer:
     def _check_communication_reliability(self, device_id):
         """检查通信可靠性"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
             # 检查最近24小时的数据点数量
-            time_threshold = datetime.now() - timedelta(hours=24)
-            cursor.execute("""
-                SELECT COUNT(*) FROM sensor_data
-                WHERE device_id = ? AND timestamp > ?
-            """, (device_id, time_threshold))
-
-            count = cursor.fetchone()[0]
-            conn.close()
+            count = self.series_reader.count(device_id, start=now_ms() - 24 * 3600 * 1000)
 
             # 理想情况下24小时应有4320个数据点（每10秒一个）
             expected_count = 8640  # 每10秒一个
@@ -784,47 +736,13 @@ class IntelligentAnalyzer:
     def get_environmental_safety_index(self, device_id=None):
         """计算环境安全指数"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            if device_id:
-                # 获取指定设备的前20条数据
-                cursor.execute("""
-                    SELECT flame_value, smoke_value, temperature, humidity, light_level, timestamp
-                    FROM sensor_data
-                    WHERE device_id = ?
-                    ORDER BY timestamp DESC
-                    LIMIT 20
-                """, (device_id,))
-            else:
-                # 获取所有设备的数据，每个设备取前20条，需要包含设备ID
-                cursor.execute("""
-                    SELECT device_id, flame_value, smoke_value, temperature, humidity, light_level, timestamp
-                    FROM sensor_data
-                    ORDER BY device_id, timestamp DESC
-                """)
-
-            data = cursor.fetchall()
-            conn.close()
+            # 指定设备取前20条数据，否则合并每个设备的前20条
+            device_ids = [device_id] if device_id else [row[0] for row in self.series_reader.devices()]
+            data = [row for row_device in device_ids for row in self._recent_rows(row_device)]
 
             if len(data) < 5:
                 return {"error": "数据不足，无法计算安全指数"}
 
-            # 如果是查询所有设备，需要按设备分组，每个设备取前20条
-            if not device_id:
-                device_data = {}
-                for row in data:
-                    device_id_row = row[0]
-                    if device_id_row not in device_data:
-                        device_data[device_id_row] = []
-                    if len(device_data[device_id_row]) < 20:  # 每个设备最多20条
-                        device_data[device_id_row].append(row[1:])  # 去掉设备ID，只保留传感器数据
-
-                # 合并所有设备的数据用于环境安全指数计算
-                data = []
-                for device_rows in device_data.values():
-                    data.extend(device_rows)
-
             # 计算各项安全指标
             safety_factors = {
                 'fire_risk': self._calculate_fire_risk(data),
@@ -1029,11 +947,7 @@ class IntelligentAnalyzer:
 
             # 如果没有设备数据，尝试从数据库获取设备列表
             if not device_ids:
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                cursor.execute("SELECT DISTINCT device_id FROM sensor_data ORDER BY device_id")
-                device_ids = [row[0] for row in cursor.fetchall()]
-                conn.close()
+                device_ids = [row[0] for row in self.series_reader.devices()]
 
             # 获取每个设备的健康度评分
             for device_id in device_ids:
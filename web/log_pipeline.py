@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步日志管道 - 数据接收热路径的日志处理
+=======================================
+
+功能:
+1. 日志记录只放入有界队列，格式化与输出由独立线程完成（QueueHandler/QueueListener）
+2. 按设备/主题对重复日志采样限速，被省略的条数附加在下一条输出中
+3. 队列已满时丢弃日志并计数，不阻塞MQTT线程
+4. 每个设备保留最近N条原始载荷的环形缓冲，供管理接口按需导出
+"""
+
+import queue
+import threading
+import time
+import logging
+import logging.handlers
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FORMAT = logging.BASIC_FORMAT
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列已满时直接丢弃的 QueueHandler"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """按采样键限速的日志过滤器
+
+    带有 extra={'sample_key': ...} 的日志在每个时间窗口内最多输出 max_per_window 条，
+    其余被省略并计数，窗口结束后的第一条日志会附加省略条数。未指定采样键的日志不受影响。
+    """
+
+    def __init__(self, window=10.0, max_per_window=1, max_keys=4096):
+        super().__init__()
+        self.window = window
+        self.max_per_window = max_per_window
+        self.max_keys = max_keys
+        self._windows = OrderedDict()  # sample_key -> [窗口开始时间, 已输出条数, 省略条数]
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record):
+        key = getattr(record, 'sample_key', None)
+        if key is None:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                skipped = state[2] if state else 0
+                self._windows[key] = [now, 1, 0]
+                self._windows.move_to_end(key)
+                if len(self._windows) > self.max_keys:
+                    self._windows.popitem(last=False)
+            elif state[1] < self.max_per_window:
+                state[1] += 1
+                skipped = 0
+            else:
+                state[2] += 1
+                self.suppressed += 1
+                return False
+
+        if skipped:
+            record.msg = f"{record.getMessage()} (前{self.window:g}秒内省略 {skipped} 条同类日志)"
+            record.args = None
+        return True
+
+
+class PayloadRing:
+    """每个设备最近N条原始载荷的环形缓冲"""
+
+    def __init__(self, per_device=50, max_devices=512):
+        self.per_device = per_device
+        self.max_devices = max_devices
+        self._payloads = OrderedDict()  # device_id -> deque[(接收时间, 主题, 原始载荷)]
+        self._lock = threading.Lock()
+
+    def record(self, device_id, topic, payload):
+        """记录一条原始载荷（不做解析和格式化）"""
+        with self._lock:
+            ring = self._payloads.get(device_id)
+            if ring is None:
+                ring = self._payloads[device_id] = deque(maxlen=self.per_device)
+                if len(self._payloads) > self.max_devices:
+                    self._payloads.popitem(last=False)
+            else:
+                self._payloads.move_to_end(device_id)
+            ring.append((time.time(), topic, payload))
+
+    def dump(self, device_id=None, limit=None):
+        """导出缓冲内容：{设备ID: [{received_at, topic, payload}, ...]}"""
+        with self._lock:
+            if device_id is not None:
+                items = [(device_id, list(self._payloads.get(device_id, ())))]
+            else:
+                items = [(key, list(ring)) for key, ring in self._payloads.items()]
+
+        result = {}
+        for key, entries in items:
+            if limit:
+                entries = entries[-limit:]
+            result[key] = [
+                {'received_at': received_at, 'topic': topic, 'payload': payload}
+                for received_at, topic, payload in entries
+            ]
+        return result
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'devices': len(self._payloads),
+                'payloads': sum(len(ring) for ring in self._payloads.values()),
+                'per_device': self.per_device,
+                'max_devices': self.max_devices
+            }
+
+
+class LogPipeline:
+    """异步日志管道：替代 logging.basicConfig 的同步输出"""
+
+    def __init__(self, level=logging.INFO, queue_size=10000, sample_window=10.0,
+                 sample_max=1, fmt=DEFAULT_FORMAT):
+        self.level = level
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.queue_handler = DroppingQueueHandler(self.queue)
+        self.sampler = SamplingFilter(window=sample_window, max_per_window=sample_max)
+        self.queue_handler.addFilter(self.sampler)
+
+        output = logging.StreamHandler()
+        output.setFormatter(logging.Formatter(fmt))
+        self.listener = logging.handlers.QueueListener(self.queue, output, respect_handler_level=True)
+        self._started = False
+
+    def start(self):
+        """把根日志器的输出切换到队列，并启动输出线程"""
+        if self._started:
+            return
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(self.level)
+        self.listener.start()
+        self._started = True
+
+    def stop(self):
+        """停止输出线程（会先输出队列中剩余的日志）"""
+        if not self._started:
+            return
+        self.listener.stop()
+        self._started = False
+
+    def get_stats(self):
+        """获取日志管道运行统计"""
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'dropped': self.queue_handler.dropped,
+            'suppressed': self.sampler.suppressed,
+            'sample_window_seconds': self.sampler.window,
+            'sample_max_per_window': self.sampler.max_per_window
+        }
+
+
+def sampled(key):
+    """生成采样限速用的 extra 参数，例如 logger.info(msg, extra=sampled(('ai', device_id)))"""
+    return {'sample_key': key}
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据库结构迁移 - 基于 PRAGMA user_version 的版本化升级
+=====================================================
+
+功能:
+1. 按版本号顺序执行迁移，已升级的数据库只执行新增部分（原地升级现有 fire_alarm.db）
+2. 每个版本在一个事务中执行并更新 user_version，失败时回滚，不会留下半升级状态
+3. 为按设备+时间查询的访问路径创建复合索引（sensor_data / alert_history）
+4. sensor_data 转换为按时间分区的表 + 视图（见 partitions.py），并建立按设备的汇总表（见 rollups.py）
+5. 时间列由文本转换为UTC毫秒整数（见 timeutil.py），派生表随之重建
+6. 建立按设备压缩分块的时序存储（见 tsengine.py）
+7. sensor_data 分区改为窄行（设备键、整数测量值），重写后 VACUUM 回收空间
+8. 报告模式：在数据库副本上对比升级前后的文件大小、查询计划、耗时和每次查询读取的页数
+
+用法:
+    python migrations.py --db instance/fire_alarm.db             # 升级数据库
+    python migrations.py --db instance/fire_alarm.db --report    # 在副本上对比升级前后（不修改原文件）
+    python migrations.py --report --seed 200000                  # 生成测试数据后对比
+"""
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import random
+import argparse
+import tempfile
+import logging
+from datetime import datetime, timedelta
+
+from partitions import partition_legacy_table, convert_partition_timestamps, narrow_partitions
+from timeutil import to_ms, text_to_ms_sql
+import rollups
+import device_latest
+import tsengine
+
+logger = logging.getLogger(__name__)
+
+# 迁移列表：(版本号, 说明, 步骤列表)，只能追加，不能修改已发布的版本
+# 步骤为SQL语句，或接收 (连接, 迁移选项) 的函数
+MIGRATIONS = [
+    (1, '按设备+时间的复合索引', [
+        # 按设备取最新数据 / 按设备查时间范围（ORDER BY timestamp DESC 直接走索引）
+        "CREATE INDEX IF NOT EXISTS ix_sensor_data_device_time ON sensor_data (device_id, timestamp)",
+        # 全部设备按时间范围查询、最近数据、过期数据清理
+        "CREATE INDEX IF NOT EXISTS ix_sensor_data_time ON sensor_data (timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_alert_history_device_time ON alert_history (device_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_alert_history_time ON alert_history (timestamp)",
+        # 更新查询优化器的统计信息
+        "ANALYZE",
+    ]),
+    (2, 'sensor_data 按时间分区', [
+        lambda conn, options: partition_legacy_table(conn, options.get('partition_period', 'day')),
+    ]),
+    (3, '按设备的 1分钟/1小时/1天 汇总表（从现有数据重建）', [
+        lambda conn, options: rollups.create_tables(conn),
+        lambda conn, options: rollups.rebuild(conn),
+    ]),
+    (4, '设备最新读数表 device_latest', [
+        lambda conn, options: device_latest.create_table(conn),
+        lambda conn, options: device_latest.rebuild(conn),
+    ]),
+    (5, '时间列改为UTC毫秒整数（sensor_data / alert_history / 汇总表 / device_latest）', [
+        lambda conn, options: convert_partition_timestamps(conn),
+        lambda conn, options: convert_alert_history_timestamps(conn),
+        lambda conn, options: rollups.drop_tables(conn),
+        lambda conn, options: rollups.create_tables(conn),
+        lambda conn, options: rollups.rebuild(conn),
+        lambda conn, options: device_latest.drop_table(conn),
+        lambda conn, options: device_latest.create_table(conn),
+        lambda conn, options: device_latest.rebuild(conn),
+        "ANALYZE",
+    ]),
+    (6, '按设备压缩分块的时序存储 sensor_series_chunks（从现有数据重建）', [
+        lambda conn, options: tsengine.create_table(conn),
+        lambda conn, options: tsengine.rebuild(conn),
+    ]),
+    (7, 'sensor_data 分区改为窄行（设备键表 sensor_devices、测量值按比例存为整数）', [
+        lambda conn, options: narrow_partitions(conn),
+        "ANALYZE",
+    ]),
+    # 窄行按0.1存储温度/湿度/光照，v7 之前写入的汇总值与最新读数仍是原始精度；
+    # 时序分块的保留期长于原始数据，不重建（差异不超过0.05）
+    (8, '按窄行精度重建汇总表与设备最新读数', [
+        lambda conn, options: rollups.rebuild(conn),
+        lambda conn, options: device_latest.rebuild(conn),
+    ]),
+]
+
+# 迁移后需要 VACUUM 回收空间的版本（VACUUM 不能在事务中执行，在全部迁移完成后执行一次）
+VACUUM_VERSIONS = {7}
+
+# alert_history 的列定义（与 app.py 中 AlertHistory 模型一致）
+ALERT_HISTORY_COLUMNS = (
+    ('id', 'INTEGER NOT NULL PRIMARY KEY'),
+    ('device_id', 'VARCHAR(50) NOT NULL'),
+    ('alert_type', 'VARCHAR(20) NOT NULL'),
+    ('severity', 'VARCHAR(10) NOT NULL'),
+    ('flame_value', 'INTEGER'),
+    ('smoke_value', 'INTEGER'),
+    ('temperature', 'FLOAT'),
+    ('humidity', 'FLOAT'),
+    ('light_level', 'FLOAT'),
+    ('location', 'VARCHAR(100)'),
+    ('timestamp', 'BIGINT'),
+    ('resolved', 'BOOLEAN'),
+    ('resolved_time', 'BIGINT'),
+)
+
+# 报告中对比的典型查询（与各接口/分析模块的访问路径一致）
+REPORT_QUERIES = [
+    ('设备最新一条 (get_slave_devices / slave status)',
+     "SELECT * FROM sensor_data WHERE device_id = :device_id ORDER BY timestamp DESC LIMIT 1"),
+    ('设备最近20条 (IntelligentAnalyzer / get_slave_data)',
+     "SELECT flame_value, smoke_value, temperature, humidity, light_level, timestamp FROM sensor_data "
+     "WHERE device_id = :device_id ORDER BY timestamp DESC LIMIT 20"),
+    ('设备24小时数据量 (get_device_health_score)',
+     "SELECT COUNT(*) FROM sensor_data WHERE device_id = :device_id AND timestamp > :since"),
+    ('每个设备最新时间 (设备状态初始化)',
+     "SELECT device_id, MAX(timestamp) FROM sensor_data GROUP BY device_id"),
+    ('全部设备最近数据 (/api/data/recent)',
+     "SELECT * FROM sensor_data ORDER BY timestamp DESC LIMIT 20"),
+    ('时间范围 (/api/history/summary)',
+     "SELECT COUNT(*) FROM sensor_data WHERE timestamp >= :since"),
+    ('设备最近报警 (_get_recent_alarms)',
+     "SELECT severity, timestamp FROM alert_history WHERE device_id = :device_id AND timestamp > :since "
+     "ORDER BY timestamp DESC"),
+]
+
+
+def convert_alert_history_timestamps(conn):
+    """重建 alert_history，timestamp / resolved_time 转换为毫秒整数"""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'alert_history'").fetchone()
+    if not exists:
+        return
+    column_list = ', '.join(name for name, _ in ALERT_HISTORY_COLUMNS)
+    select_list = ', '.join(text_to_ms_sql(name) if name in ('timestamp', 'resolved_time') else name
+                            for name, _ in ALERT_HISTORY_COLUMNS)
+    conn.execute("ALTER TABLE alert_history RENAME TO alert_history_old")
+    conn.execute("DROP INDEX IF EXISTS ix_alert_history_device_time")
+    conn.execute("DROP INDEX IF EXISTS ix_alert_history_time")
+    conn.execute(f"CREATE TABLE alert_history ("
+                 f"{', '.join(f'{name} {definition}' for name, definition in ALERT_HISTORY_COLUMNS)})")
+    conn.execute(f"INSERT INTO alert_history ({column_list}) SELECT {select_list} FROM alert_history_old")
+    conn.execute("DROP TABLE alert_history_old")
+    conn.execute("CREATE INDEX ix_alert_history_device_time ON alert_history (device_id, timestamp)")
+    conn.execute("CREATE INDEX ix_alert_history_time ON alert_history (timestamp)")
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def run_migrations(db_path, **options):
+    """把数据库升级到最新版本，返回 (升级前版本, 升级后版本)
+
+    Args:
+        options: 传给函数步骤的迁移选项（如 partition_period）
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        before = get_version(conn)
+        applied = set()
+        for version, description, statements in MIGRATIONS:
+            if version <= before:
+                continue
+            started = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in statements:
+                    if callable(statement):
+                        statement(conn, options)
+                    else:
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.add(version)
+            logger.info(f"数据库迁移 v{version} 完成: {description} ({time.time() - started:.2f}s)")
+        if applied & VACUUM_VERSIONS:
+            started = time.time()
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            logger.info(f"数据库 VACUUM 完成 ({time.time() - started:.2f}s)")
+        return before, get_version(conn)
+    finally:
+        conn.close()
+
+
+def seed_database(db_path, rows, devices=20):
+    """生成测试数据（表结构与升级前的 fire_alarm.db 一致，时间为文本，用于验证迁移）"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS sensor_data (
+            id INTEGER PRIMARY KEY, device_id VARCHAR(50) NOT NULL, device_type VARCHAR(20),
+            flame_value INTEGER NOT NULL, smoke_value INTEGER NOT NULL, temperature FLOAT,
+            humidity FLOAT, light_level FLOAT, alert_status BOOLEAN, timestamp DATETIME);
+        CREATE TABLE IF NOT EXISTS alert_history (
+            id INTEGER PRIMARY KEY, device_id VARCHAR(50) NOT NULL, alert_type VARCHAR(20) NOT NULL,
+            severity VARCHAR(10) NOT NULL, flame_value INTEGER, smoke_value INTEGER, temperature FLOAT,
+            humidity FLOAT, light_level FLOAT, location VARCHAR(100), timestamp DATETIME,
+            resolved BOOLEAN, resolved_time DATETIME);
+    """)
+    now = datetime.utcnow()
+    span = timedelta(days=30).total_seconds()
+    sensor_rows = []
+    for i in range(rows):
+        device = f"esp32_device_{i % devices:03d}"
+        at = now - timedelta(seconds=span * (rows - i) / rows)
+        sensor_rows.append((device, 'master', random.randint(1000, 2000), random.randint(1500, 2000),
+                            random.uniform(20, 30), random.uniform(40, 60), random.uniform(10, 60),
+                            False, at.strftime('%Y-%m-%d %H:%M:%S.%f')))
+    conn.executemany("INSERT INTO sensor_data (device_id, device_type, flame_value, smoke_value, temperature, "
+                     "humidity, light_level, alert_status, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     sensor_rows)
+    conn.executemany("INSERT INTO alert_history (device_id, alert_type, severity, timestamp, resolved) "
+                     "VALUES (?, 'fire', 'high', ?, 0)",
+                     [(row[0], row[-1]) for row in sensor_rows[::100]])
+    conn.commit()
+    conn.close()
+
+
+def _bytes_read():
+    """本进程累计读取的字节数（Linux /proc/self/io），不可用时返回None"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def pages_read(db_path, sql, params):
+    """在新连接（空页缓存）上执行一次查询，返回从数据库文件读取的页数（无法统计时返回None）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # 先加载表结构
+        before = _bytes_read()
+        conn.execute(sql, params).fetchall()
+        after = _bytes_read()
+    finally:
+        conn.close()
+    if before is None or after is None:
+        return None
+    return (after - before) // page_size
+
+
+def file_size(db_path):
+    """数据库文件（含WAL）字节数"""
+    return sum(os.path.getsize(db_path + suffix) for suffix in ('', '-wal') if os.path.exists(db_path + suffix))
+
+
+def partition_size(db_path):
+    """sensor_data 分区表及其索引占用的字节数（需要 dbstat 虚拟表，不可用时返回None）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COALESCE(SUM(pgsize), 0) FROM dbstat "
+                            "WHERE name LIKE 'sensor_data_%' OR name LIKE 'ix_sensor_data_%'").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
+
+
+def measure_queries(db_path, device_id, repeat=5):
+    """返回每个典型查询的 (查询计划, 平均耗时毫秒, 读取页数)"""
+    conn = sqlite3.connect(db_path)
+    params = {
+        'device_id': device_id,
+        'since': (datetime.utcnow() - timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S.%f')
+    }
+    if get_version(conn) >= 5:
+        params['since'] = to_ms(datetime.utcnow() - timedelta(hours=24))
+    results = []
+    for name, sql in REPORT_QUERIES:
+        plan = ' | '.join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params).fetchall()
+        elapsed_ms = (time.perf_counter() - started) * 1000 / repeat
+        results.append((name, plan, elapsed_ms, pages_read(db_path, sql, params)))
+    conn.close()
+    return results
+
+
+def report(db_path):
+    """在数据库副本上对比升级前后的查询计划和耗时"""
+    work_dir = tempfile.mkdtemp(prefix='fire_alarm_migration_')
+    copy_path = os.path.join(work_dir, 'report.db')
+    shutil.copyfile(db_path, copy_path)
+
+    conn = sqlite3.connect(copy_path)
+    version = get_version(conn)
+    rows = conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+    device = conn.execute("SELECT device_id FROM sensor_data ORDER BY id DESC LIMIT 1").fetchone()
+    conn.close()
+    device_id = device[0] if device else 'esp32_fire_alarm_01'
+
+    print(f"数据库: {db_path}  (sensor_data {rows} 行, 当前版本 v{version}, 最新版本 v{latest_version()})")
+    sizes_before = (file_size(copy_path), partition_size(copy_path))
+    before = measure_queries(copy_path, device_id)
+    run_migrations(copy_path)
+    sizes_after = (file_size(copy_path), partition_size(copy_path))
+    after = measure_queries(copy_path, device_id)
+
+    for label, size_before, size_after in zip(('文件大小', 'sensor_data 分区（含索引）'), sizes_before, sizes_after):
+        if size_before and size_after is not None:
+            print(f"{label}: 升级前 {size_before / 1048576:.2f} MB, 升级后 {size_after / 1048576:.2f} MB "
+                  f"({(1 - size_after / size_before) * 100:.1f}% 减少)")
+    for (name, plan_before, ms_before, pages_before), (_, plan_after, ms_after, pages_after) in zip(before, after):
+        speedup = ms_before / ms_after if ms_after > 0 else float('inf')
+        print(f"\n{name}")
+        print(f"  升级前 {ms_before:9.3f} ms  {pages_before if pages_before is not None else '-':>6} 页  {plan_before}")
+        print(f"  升级后 {ms_after:9.3f} ms  {pages_after if pages_after is not None else '-':>6} 页  {plan_after}")
+        print(f"  加速 {speedup:.1f}x")
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='火灾报警系统数据库迁移')
+    parser.add_argument('--db', help='数据库文件路径')
+    parser.add_argument('--report', action='store_true', help='在副本上对比升级前后的查询计划和耗时')
+    parser.add_argument('--seed', type=int, help='生成指定行数的测试数据库用于报告')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.seed:
+        args.db = args.db or os.path.join(tempfile.mkdtemp(prefix='fire_alarm_seed_'), 'fire_alarm.db')
+        print(f"生成测试数据 {args.seed} 行: {args.db}")
+        seed_database(args.db, args.seed)
+    if not args.db or not os.path.exists(args.db):
+        parser.error('请通过 --db 指定已存在的数据库文件，或使用 --seed 生成测试数据')
+
+    if args.report:
+        report(args.db)
+    else:
+        before, after = run_migrations(args.db)
+        print(f"数据库版本: v{before} -> v{after}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
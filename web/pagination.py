@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+键集分页 - 按 (timestamp, id) 游标分页读取传感器数据
+===================================================
+
+功能:
+1. 查询按 (timestamp DESC, id DESC) 排序，下一页从上一页最后一行之后继续，不使用 OFFSET
+2. 每页多取一行判断是否还有下一页，服务端内存只与页大小有关
+3. 游标为不透明字符串（URL安全），由上一页最后一行的 (timestamp, id) 编码
+4. 页大小有上限，客户端传入更大的 limit 时按上限截断
+"""
+
+import base64
+import binascii
+
+from sqlalchemy import tuple_
+
+CURSOR_VERSION = 'v1'
+
+
+def encode_cursor(timestamp, row_id):
+    """把 (毫秒时间戳, id) 编码为游标字符串"""
+    raw = f"{CURSOR_VERSION}:{int(timestamp)}:{int(row_id)}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (毫秒时间戳, id)；游标为空返回None，格式错误时抛出 ValueError"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        version, timestamp, row_id = raw.split(':')
+        if version != CURSOR_VERSION:
+            raise ValueError(version)
+        return int(timestamp), int(row_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValueError(f"无效的分页游标: {cursor}")
+
+
+def page_size(value, default, maximum):
+    """解析页大小参数，限制在 [1, maximum]"""
+    size = int(value) if value not in (None, '') else default
+    return max(1, min(size, maximum))
+
+
+def keyset_page(query, timestamp_column, id_column, cursor=None, limit=100):
+    """按 (timestamp, id) 倒序读取一页
+
+    Args:
+        query: 已添加过滤条件的查询（不要再排序/限制条数）
+        cursor: decode_cursor() 的结果，None 表示第一页
+
+    Returns:
+        (本页记录列表, 下一页游标或None)
+    """
+    if cursor is not None:
+        query = query.filter(tuple_(timestamp_column, id_column) < tuple_(*cursor))
+    rows = query.order_by(timestamp_column.desc(), id_column.desc()).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key))
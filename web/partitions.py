@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传感器数据按时间分区 - 分区表 + 视图路由
+=======================================
+
+功能:
+1. sensor_data 按天（或按周）存放在独立的分区表 sensor_data_<d|w><YYYYMMDD> 中
+2. sensor_data 本身是所有分区的 UNION ALL 视图，原有ORM查询不需要修改；
+   视图上的 UPDATE/DELETE 由 INSTEAD OF 触发器转发到各分区
+3. 写入按时间戳路由到对应分区，分区不存在时在同一写事务中创建并重建视图
+4. 数据保留通过整表 DROP 过期分区完成，不再执行大范围 DELETE
+5. 时间范围查询可以只联合与时间窗口重叠的分区（range_selectable）
+6. 分区表只保存窄行：设备用 sensor_devices 中的小整数键代替设备ID字符串，设备类型只保存在 sensor_devices，
+   温度/湿度/光照按 SCALES 存为整数；视图联接设备表并换算，对外的列与 SensorData 模型一致
+
+说明:
+    分区名中包含周期和起始日期，分区边界由表名确定，修改分区周期后新旧分区可以共存。
+    每个分区的自增ID从 起始日期序数 * ID_SPACE 开始，多个接收进程并发写入时ID也全局唯一。
+    timestamp 列为UTC毫秒整数（见 timeutil），分区路由与边界比较都是整数运算。
+    v2~v6 的分区为宽行（WIDE_COLUMNS），只在迁移中出现；视图按每个分区的实际列生成，迁移过程中两种分区可以共存。
+"""
+
+import re
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import column, text
+
+from storage import execute, executemany
+from timeutil import EPOCH, MS_PER_DAY, now_ms, to_ms, from_ms, text_to_ms_sql
+
+logger = logging.getLogger(__name__)
+
+VIEW_NAME = 'sensor_data'
+PARTITION_PREFIX = 'sensor_data_'
+PARTITION_PATTERN = re.compile(r'^sensor_data_([dw])(\d{8})$')
+PERIODS = {'day': 'd', 'week': 'w'}
+PERIOD_DAYS = {'d': 1, 'w': 7}
+ID_SPACE = 10 ** 9  # 每个分区可用的ID数量
+DEVICE_TABLE = 'sensor_devices'
+
+# sensor_data 视图的列，与 app.py 中 SensorData 模型一致
+COLUMN_NAMES = ('id', 'device_id', 'device_type', 'flame_value', 'smoke_value', 'temperature',
+                'humidity', 'light_level', 'alert_status', 'timestamp')
+
+# 测量值存储倍数：DHT11 温湿度分辨率 1°C / 1%RH，BH1750 光照 1 lx，保留一位小数
+SCALES = {'temperature': 10, 'humidity': 10, 'light_level': 10}
+
+# 分区表的列定义（窄行）
+COLUMNS = (
+    ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    ('device_key', 'INTEGER NOT NULL'),  # sensor_devices.device_key
+    ('flame_value', 'INTEGER NOT NULL'),
+    ('smoke_value', 'INTEGER NOT NULL'),
+    ('temperature', 'INTEGER'),  # 按 SCALES 换算的整数
+    ('humidity', 'INTEGER'),
+    ('light_level', 'INTEGER'),
+    ('alert_status', 'BOOLEAN'),
+    ('timestamp', 'INTEGER NOT NULL'),  # UTC毫秒
+)
+
+# v2~v6 的分区列定义（宽行，与视图的列相同），只在迁移中使用
+WIDE_COLUMNS = (
+    ('id', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    ('device_id', 'VARCHAR(50) NOT NULL'),
+    ('device_type', 'VARCHAR(20)'),
+    ('flame_value', 'INTEGER NOT NULL'),
+    ('smoke_value', 'INTEGER NOT NULL'),
+    ('temperature', 'FLOAT'),
+    ('humidity', 'FLOAT'),
+    ('light_level', 'FLOAT'),
+    ('alert_status', 'BOOLEAN'),
+    ('timestamp', 'INTEGER NOT NULL'),
+)
+
+
+def scale_value(value, scale):
+    """测量值换算为存储整数（四舍五入，远离零，与SQLite ROUND一致），None保持None"""
+    if value is None:
+        return None
+    return int(value * scale + (0.5 if value >= 0 else -0.5))
+
+
+def partition_start(value, period='day'):
+    """返回时间（毫秒整数或datetime）所在分区的起始日期"""
+    days = to_ms(value) // MS_PER_DAY
+    if PERIODS[period] == 'w':
+        days -= (days + 3) % 7  # 1970-01-01 是星期四，按周一对齐
+    return EPOCH + timedelta(days=days)
+
+
+def partition_name(value, period='day'):
+    return f"{PARTITION_PREFIX}{PERIODS[period]}{partition_start(value, period):%Y%m%d}"
+
+
+def partition_bounds(name):
+    """由分区表名得到 [起始, 结束) 毫秒时间戳"""
+    match = PARTITION_PATTERN.match(name)
+    start = to_ms(datetime.strptime(match.group(2), '%Y%m%d'))
+    return start, start + PERIOD_DAYS[match.group(1)] * MS_PER_DAY
+
+
+def list_partitions(conn):
+    """按起始时间排序的分区表名"""
+    rows = execute(conn, "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?",
+                    (PARTITION_PREFIX + '%',)).fetchall()
+    names = [row[0] for row in rows if PARTITION_PATTERN.match(row[0])]
+    return sorted(names, key=lambda name: (partition_bounds(name), name))
+
+
+def create_device_table(conn):
+    """创建设备键表（数据库迁移时调用）"""
+    execute(conn, f"CREATE TABLE IF NOT EXISTS {DEVICE_TABLE} ("
+                  f"device_key INTEGER PRIMARY KEY, device_id VARCHAR(50) NOT NULL UNIQUE, device_type VARCHAR(20))")
+
+
+def is_narrow(conn, name):
+    """分区是否为窄行（按设备键保存）"""
+    return any(row[1] == 'device_key' for row in execute(conn, f"PRAGMA table_info({name})").fetchall())
+
+
+def partition_select(name, narrow=True):
+    """一个分区按视图列输出的SELECT（窄分区联接设备表并换算测量值）"""
+    if not narrow:
+        return f"SELECT {', '.join(COLUMN_NAMES)} FROM {name}"
+    expressions = []
+    for column_name in COLUMN_NAMES:
+        if column_name in ('device_id', 'device_type'):
+            expressions.append(f"d.{column_name} AS {column_name}")
+        elif column_name in SCALES:
+            expressions.append(f"p.{column_name} / {float(SCALES[column_name])} AS {column_name}")
+        else:
+            expressions.append(f"p.{column_name} AS {column_name}")
+    return (f"SELECT {', '.join(expressions)} FROM {name} p "
+            f"JOIN {DEVICE_TABLE} d ON d.device_key = p.device_key")
+
+
+def create_partition(conn, name, columns=COLUMNS):
+    """创建分区表及索引（已存在时不做任何操作），返回是否新建
+
+    Args:
+        columns: 分区列定义，迁移中创建宽分区时传入 WIDE_COLUMNS
+    """
+    exists = execute(conn, "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    if exists:
+        return False
+
+    definitions = ', '.join(f"{column_name} {definition}" for column_name, definition in columns)
+    narrow = any(column_name == 'device_key' for column_name, _ in columns)
+    execute(conn, f"CREATE TABLE {name} ({definitions})")
+    execute(conn, f"CREATE INDEX ix_{name}_device_time ON {name} ({'device_key' if narrow else 'device_id'}, timestamp)")
+    # 窄分区的时间索引带上设备键：按时间范围联接设备表时不需要回表
+    execute(conn, f"CREATE INDEX ix_{name}_time ON {name} (timestamp{', device_key' if narrow else ''})")
+    # 自增ID从分区起始日期对应的区间开始
+    start, _ = partition_bounds(name)
+    execute(conn, "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+            (name, from_ms(start).toordinal() * ID_SPACE))
+    return True
+
+
+def rebuild_view(conn, partitions=None):
+    """按当前分区重建 sensor_data 视图和转发触发器"""
+    partitions = list_partitions(conn) if partitions is None else partitions
+    narrow = {name: is_narrow(conn, name) for name in partitions}
+
+    execute(conn, f"DROP VIEW IF EXISTS {VIEW_NAME}")
+    if not partitions:
+        return
+    execute(conn, f"CREATE VIEW {VIEW_NAME} AS " +
+             ' UNION ALL '.join(partition_select(name, narrow[name]) for name in partitions))
+
+    wide_assignments = ', '.join(f"{name} = NEW.{name}" for name in COLUMN_NAMES if name != 'id')
+    narrow_assignments = ', '.join(
+        [f"device_key = COALESCE((SELECT device_key FROM {DEVICE_TABLE} WHERE device_id = NEW.device_id), "
+         f"device_key)"] +
+        [f"{name} = CAST(ROUND(NEW.{name} * {SCALES[name]}) AS INTEGER)" if name in SCALES else f"{name} = NEW.{name}"
+         for name in COLUMN_NAMES if name not in ('id', 'device_id', 'device_type')]
+    )
+    updates = ' '.join(f"UPDATE {name} SET {narrow_assignments if narrow[name] else wide_assignments} "
+                       f"WHERE id = OLD.id;" for name in partitions)
+    deletes = ' '.join(f"DELETE FROM {name} WHERE id = OLD.id;" for name in partitions)
+    execute(conn, f"CREATE TRIGGER {VIEW_NAME}_update INSTEAD OF UPDATE ON {VIEW_NAME} BEGIN {updates} END")
+    execute(conn, f"CREATE TRIGGER {VIEW_NAME}_delete INSTEAD OF DELETE ON {VIEW_NAME} BEGIN {deletes} END")
+
+
+def partition_legacy_table(conn, period='day'):
+    """把未分区的 sensor_data 表按时间拆分到分区表，并替换为视图（数据库迁移时调用）"""
+    kind = execute(conn, "SELECT type FROM sqlite_master WHERE name = ?", (VIEW_NAME,)).fetchone()
+    if kind is not None and kind[0] != 'table':
+        return 0
+
+    moved = 0
+    if kind is not None:
+        legacy = f"{VIEW_NAME}_legacy"
+        execute(conn, f"ALTER TABLE {VIEW_NAME} RENAME TO {legacy}")
+        column_list = ', '.join(COLUMN_NAMES)
+        # 未分区的旧表保存的是文本时间，插入分区时转换为毫秒
+        select_list = ', '.join(text_to_ms_sql(name) if name == 'timestamp' else name for name in COLUMN_NAMES)
+
+        # 没有时间戳的记录归入当前分区
+        execute(conn, f"UPDATE {legacy} SET timestamp = ? WHERE timestamp IS NULL",
+                 (f"{datetime.utcnow():%Y-%m-%d %H:%M:%S.%f}",))
+        days = execute(conn, f"SELECT DISTINCT substr(timestamp, 1, 10) FROM {legacy}").fetchall()
+        names = sorted({partition_name(datetime.strptime(day[0], '%Y-%m-%d'), period) for day in days})
+        for name in names:
+            start, end = (f"{from_ms(bound):%Y-%m-%d}" for bound in partition_bounds(name))
+            create_partition(conn, name, WIDE_COLUMNS)
+            cursor = execute(conn, f"INSERT INTO {name} ({column_list}) SELECT {select_list} FROM {legacy} "
+                                    f"WHERE timestamp >= ? AND timestamp < ?", (start, end))
+            moved += cursor.rowcount
+        execute(conn, f"DROP TABLE {legacy}")
+
+    # 保证视图至少包含当前分区
+    create_partition(conn, partition_name(now_ms(), period), WIDE_COLUMNS)
+    rebuild_view(conn)
+    logger.info(f"sensor_data 已转换为按{period}分区，迁移 {moved} 条记录")
+    return moved
+
+
+def _rewrite_partition(conn, name, columns, select_sql):
+    """按新的列定义重建一个分区（视图需已删除），select_sql 中用 {old} 表示旧表，返回复制的记录数"""
+    old = f"{name}_old"
+    execute(conn, f"DROP INDEX IF EXISTS ix_{name}_device_time")
+    execute(conn, f"DROP INDEX IF EXISTS ix_{name}_time")
+    execute(conn, f"ALTER TABLE {name} RENAME TO {old}")
+    seq = execute(conn, "SELECT seq FROM sqlite_sequence WHERE name = ?", (old,)).fetchone()
+    execute(conn, "DELETE FROM sqlite_sequence WHERE name = ?", (old,))
+    create_partition(conn, name, columns)
+    column_list = ', '.join(column_name for column_name, _ in columns)
+    copied = execute(conn, f"INSERT INTO {name} ({column_list}) {select_sql.format(old=old)}").rowcount
+    if seq is not None:
+        execute(conn, "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (seq[0], name))
+    execute(conn, f"DROP TABLE {old}")
+    return copied
+
+
+def convert_partition_timestamps(conn):
+    """把分区表的文本时间列重建为毫秒整数列（数据库迁移时调用），返回转换的记录数"""
+    partitions = list_partitions(conn)
+    select_list = ', '.join(text_to_ms_sql(name) if name == 'timestamp' else name for name in COLUMN_NAMES)
+    converted = 0
+
+    execute(conn, f"DROP VIEW IF EXISTS {VIEW_NAME}")
+    for name in partitions:
+        converted += _rewrite_partition(conn, name, WIDE_COLUMNS, f"SELECT {select_list} FROM {{old}} ORDER BY id")
+    rebuild_view(conn, partitions)
+    logger.info(f"{len(partitions)} 个传感器数据分区的时间列已转换为毫秒整数，共 {converted} 条记录")
+    return converted
+
+
+def narrow_partitions(conn):
+    """把宽分区重写为窄分区（数据库迁移时调用），返回重写的记录数
+
+    设备键按设备ID顺序分配，设备类型取该设备最新一条记录的类型。
+    """
+    create_device_table(conn)
+    partitions = list_partitions(conn)
+    wide = [name for name in partitions if not is_narrow(conn, name)]
+    if not wide:
+        return 0
+
+    execute(conn, f"INSERT OR IGNORE INTO {DEVICE_TABLE} (device_id) "
+                  f"SELECT DISTINCT device_id FROM {VIEW_NAME} ORDER BY device_id")
+    execute(conn, f"UPDATE {DEVICE_TABLE} SET device_type = (SELECT s.device_type FROM {VIEW_NAME} s "
+                  f"WHERE s.device_id = {DEVICE_TABLE}.device_id ORDER BY s.timestamp DESC LIMIT 1)")
+
+    select_list = ', '.join(
+        'd.device_key' if name == 'device_key'
+        else f"CAST(ROUND(o.{name} * {SCALES[name]}) AS INTEGER)" if name in SCALES
+        else f"o.{name}"
+        for name, _ in COLUMNS
+    )
+    narrowed = 0
+    execute(conn, f"DROP VIEW IF EXISTS {VIEW_NAME}")
+    for name in wide:
+        narrowed += _rewrite_partition(conn, name, COLUMNS,
+                                       f"SELECT {select_list} FROM {{old}} o "
+                                       f"JOIN {DEVICE_TABLE} d ON d.device_id = o.device_id ORDER BY o.id")
+    rebuild_view(conn, partitions)
+    logger.info(f"{len(wide)} 个传感器数据分区已改为窄行，共 {narrowed} 条记录")
+    return narrowed
+
+
+class SensorPartitions:
+    """分区路由：写入、按时间范围选择分区、过期分区删除"""
+
+    def __init__(self, storage, period='day'):
+        if period not in PERIODS:
+            raise ValueError(f"不支持的分区周期: {period}")
+        self.storage = storage
+        self.period = period
+        self._known = set()  # 本进程已确认存在的分区
+        self._devices = {}  # 设备ID -> (设备键, 设备类型)，只缓存已提交的值
+        self.created = 0
+        self.dropped = 0
+
+    def write(self, rows, in_transaction=()):
+        """把传感器记录写入各自的分区（一个写事务）
+
+        Args:
+            rows: 包含 COLUMN_NAMES（除id外）字段的字典列表，测量值为原始数值，timestamp 为毫秒整数
+            in_transaction: 在同一事务中执行的回调 callback(conn, rows)，如维护汇总表；
+                rows 为按存储精度换算后的记录副本
+        """
+        # 测量值换算为存储精度；回调收到同样精度的记录副本，汇总表、最新读数、时序分块与原始数据一致
+        rows = [dict(row, **{column: None if row[column] is None
+                             else scale_value(row[column], scale) / scale
+                             for column, scale in SCALES.items()}) for row in rows]
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(partition_name(row['timestamp'], self.period), []).append(row)
+
+        columns = [name for name, _ in COLUMNS[1:]]
+        placeholders = ', '.join('?' for _ in columns)
+        missing = [name for name in grouped if name not in self._known]
+        with self.storage.write() as conn:
+            if missing:
+                created = [name for name in missing if create_partition(conn, name)]
+                if created:
+                    rebuild_view(conn)
+                    logger.info(f"创建传感器数据分区: {', '.join(created)}")
+            keys, registered = self._device_keys(conn, rows)
+            for name, partition_rows in grouped.items():
+                executemany(conn, f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({placeholders})", [
+                    (keys[row['device_id']], row['flame_value'], row['smoke_value'],
+                     scale_value(row['temperature'], SCALES['temperature']),
+                     scale_value(row['humidity'], SCALES['humidity']),
+                     scale_value(row['light_level'], SCALES['light_level']),
+                     row['alert_status'], row['timestamp'])
+                    for row in partition_rows
+                ])
+            for callback in in_transaction:
+                callback(conn, rows)
+        # 事务提交后才缓存为已存在
+        if missing:
+            self.created += len(created)
+            self._known.update(missing)
+        self._devices.update(registered)
+
+    def _device_keys(self, conn, rows):
+        """在写事务中取得各设备的键（新设备或设备类型变化时写入 sensor_devices）
+
+        Returns:
+            (设备ID -> 设备键, 本事务登记的 设备ID -> (设备键, 设备类型))
+        """
+        devices = {row['device_id']: row.get('device_type') for row in rows}
+        keys, registered = {}, {}
+        for device_id, device_type in devices.items():
+            cached = self._devices.get(device_id)
+            if cached is not None and (device_type is None or cached[1] == device_type):
+                keys[device_id] = cached[0]
+                continue
+            execute(conn, f"INSERT INTO {DEVICE_TABLE} (device_id, device_type) VALUES (?, ?) "
+                          f"ON CONFLICT (device_id) DO UPDATE SET "
+                          f"device_type = COALESCE(excluded.device_type, device_type)", (device_id, device_type))
+            key = execute(conn, f"SELECT device_key FROM {DEVICE_TABLE} WHERE device_id = ?",
+                          (device_id,)).fetchone()[0]
+            keys[device_id] = key
+            registered[device_id] = (key, device_type)
+        return keys, registered
+
+    def set_alert_status(self, conn, device_id, timestamp, alert_status):
+        """在写事务中修改一条记录的报警状态，返回修改前的状态（记录不存在时返回None）"""
+        name = partition_name(timestamp, self.period)
+        params = (device_id, to_ms(timestamp))
+        if not execute(conn, "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone():
+            return None  # 分区已过期删除
+        device_key = f"(SELECT device_key FROM {DEVICE_TABLE} WHERE device_id = ?)"
+        row = execute(conn, f"SELECT alert_status FROM {name} WHERE device_key = {device_key} AND timestamp = ?",
+                      params).fetchone()
+        if row is None:
+            return None
+        execute(conn, f"UPDATE {name} SET alert_status = ? WHERE device_key = {device_key} AND timestamp = ?",
+                (bool(alert_status),) + params)
+        return bool(row[0])
+
+    def partitions(self):
+        with self.storage.read() as conn:
+            return list_partitions(conn)
+
+    def partitions_for_range(self, start=None, end=None):
+        """与 [start, end] 时间窗口（毫秒整数或datetime）重叠的分区"""
+        start, end = to_ms(start), to_ms(end)
+        result = []
+        for name in self.partitions():
+            lower, upper = partition_bounds(name)
+            if (end is None or lower <= end) and (start is None or upper > start):
+                result.append(name)
+        return result
+
+    def range_selectable(self, columns, start=None, end=None):
+        """只联合与时间窗口重叠的分区，返回可用于 aliased() 的子查询
+
+        Args:
+            columns: 模型的列（用于保持结果类型，如 SensorData.__table__.columns）
+        """
+        names = self.partitions_for_range(start, end)
+        if not names:
+            names = self.partitions()[-1:]
+        query = text(' UNION ALL '.join(partition_select(name) for name in names))
+        return query.columns(*[column(col.name, col.type) for col in columns]).subquery(f"{VIEW_NAME}_range")
+
+    def drop_before(self, cutoff):
+        """删除结束时间不晚于 cutoff 的分区（只删除整个分区），返回删除的分区名"""
+        cutoff = to_ms(cutoff)
+        with self.storage.write() as conn:
+            partitions = list_partitions(conn)
+            expired = [name for name in partitions if partition_bounds(name)[1] <= cutoff]
+            # 至少保留一个分区，视图不能为空
+            if len(expired) == len(partitions):
+                expired = expired[:-1]
+            if expired:
+                for name in expired:
+                    execute(conn, f"DROP TABLE {name}")
+                rebuild_view(conn, [name for name in partitions if name not in expired])
+        self._known.difference_update(expired)
+        self.dropped += len(expired)
+        return expired
+
+    def get_stats(self):
+        names = self.partitions()
+        return {
+            'period': self.period,
+            'partitions': len(names),
+            'oldest': names[0] if names else None,
+            'newest': names[-1] if names else None,
+            'created': self.created,
+            'dropped': self.dropped
+        }
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传感器数据格式规整 - 表驱动的载荷解析
+=====================================
+
+功能:
+1. 支持三种上报格式：主机数据、从机直连数据、主机转发的从机数据
+2. 每个来源（MQTT主题）的格式（主机/从机直连/转发）只识别一次，缓存对应的字段提取器；
+   光照键名、嵌套字段和从机传感器是否存在每条消息按固定顺序读取，不受首条消息影响
+3. 输出固定字段的 SensorReading（__slots__），后续流程不再逐键探测；火焰/烟雾读数规整为整数
+4. 统计无法识别的格式，每个来源只在首次出现时记录日志
+"""
+
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 格式名称
+SHAPE_MASTER = 'master'
+SHAPE_MASTER_NESTED = 'master_nested'
+SHAPE_SLAVE = 'slave'
+SHAPE_SLAVE_FORWARDED = 'slave_forwarded'
+SHAPE_UNKNOWN = 'unknown'
+
+# 光照传感器的兼容键名（按优先级）
+LIGHT_KEYS = ('light', 'light_level', 'lux', 'illuminance')
+NESTED_LIGHT_KEYS = ('light', 'light_level', 'lux')
+
+# 从机传感器缺失时的默认值（无火焰/无烟雾）
+SLAVE_FLAME_DEFAULT = 1200
+SLAVE_SMOKE_DEFAULT = 1800
+
+# 字段缺失或类型不符时提取器抛出的异常（先重新识别格式，仍失败则丢弃该条数据）
+EXTRACT_ERRORS = (KeyError, TypeError, AttributeError, ValueError, OverflowError)
+
+
+class SensorReading:
+    """规整后的一条传感器读数"""
+
+    __slots__ = ('device_id', 'device_type', 'flame', 'smoke', 'temperature', 'humidity', 'light',
+                 'alert', 'overall_status', 'name', 'location', 'master_id',
+                 'slave_name', 'slave_location', 'sequence', 'device_timestamp', 'shape')
+
+    def __init__(self, device_id, device_type, flame, smoke, temperature, humidity, light,
+                 alert, overall_status, name, location, master_id, slave_name, slave_location,
+                 sequence, device_timestamp, shape):
+        self.device_id = device_id
+        self.device_type = device_type
+        self.flame = flame
+        self.smoke = smoke
+        self.temperature = temperature
+        self.humidity = humidity
+        self.light = light
+        self.alert = alert
+        self.overall_status = overall_status
+        self.name = name
+        self.location = location
+        self.master_id = master_id
+        self.slave_name = slave_name
+        self.slave_location = slave_location
+        self.sequence = sequence                  # 从机递增序号（主机数据没有）
+        self.device_timestamp = device_timestamp  # 设备端时间戳
+        self.shape = shape
+
+    @property
+    def is_slave(self):
+        return self.device_type == 'slave'
+
+
+def _read_light(data):
+    """按固定的键名顺序读取光照数值（顶层优先，其次嵌套的 data 字段）；不存在时返回None"""
+    for key in LIGHT_KEYS:
+        value = data.get(key)
+        if value is not None:
+            return value
+    nested = data.get('data')
+    if isinstance(nested, dict):
+        for key in NESTED_LIGHT_KEYS:
+            value = nested.get(key)
+            if value is not None:
+                return value
+    return None
+
+
+def _analog(value, default):
+    """火焰/烟雾模拟量规整为整数（入库列与时序存储均为整数）：None 取默认值，浮点数和数字字符串四舍五入"""
+    if value is None:
+        return default
+    if isinstance(value, int):
+        return int(value)
+    return int(round(float(value)))
+
+
+def _slave_sensors(data):
+    """返回 sensors 字典中存在的从机传感器 (是否有火焰, 是否有烟雾)"""
+    sensors = data.get('sensors')
+    if not isinstance(sensors, dict):
+        return False, False
+    return 'flame' in sensors, 'mq2_smoke' in sensors
+
+
+def _compile_slave(forwarded):
+    """从机格式：读数在 sensors.flame.analog / sensors.mq2_smoke.analog
+
+    传感器是否存在每条消息单独判断，缺失的传感器读数为0。
+    """
+    shape = SHAPE_SLAVE_FORWARDED if forwarded else SHAPE_SLAVE
+
+    def extract(data):
+        has_flame, has_smoke = _slave_sensors(data)
+        if forwarded:
+            if not (has_flame or has_smoke):
+                raise KeyError('sensors')  # 不再是转发的从机数据，重新识别格式
+            device_id = data.get('device_id', 'unknown')
+        else:
+            device_id = data['slave_id']
+        sensors = data.get('sensors')
+        overall_status = data.get('overall_status')
+        return SensorReading(
+            device_id, 'slave',
+            _analog(sensors['flame'].get('analog'), SLAVE_FLAME_DEFAULT) if has_flame else 0,
+            _analog(sensors['mq2_smoke'].get('analog'), SLAVE_SMOKE_DEFAULT) if has_smoke else 0,
+            data.get('temperature'), data.get('humidity'), _read_light(data),
+            overall_status in ('alarm', 'warning'), overall_status,
+            data.get('name'), data.get('location'), data.get('master_id'),
+            data.get('slave_name'), data.get('slave_location'),
+            data.get('sequence'), data.get('timestamp'), shape
+        )
+    return extract
+
+
+def _compile_master():
+    """主机格式：读数在顶层，部分固件放在嵌套的 data 字段中
+
+    是否嵌套、是否含已知读数字段每条消息单独判断；都没有时按主机格式处理（读数取默认值），
+    但标记为未知格式。
+    """
+
+    def extract(data):
+        has_flame, has_smoke = _slave_sensors(data)
+        if has_flame or has_smoke:
+            raise KeyError('sensors')  # 出现了转发的从机数据，重新识别格式
+        nested = data.get('data')
+        source = nested if isinstance(nested, dict) else data
+        if 'flame' in data or 'smoke' in data:
+            shape = SHAPE_MASTER_NESTED if source is nested else SHAPE_MASTER
+        elif source is nested and ('flame' in nested or 'smoke' in nested):
+            shape = SHAPE_MASTER_NESTED
+        else:
+            shape = SHAPE_UNKNOWN
+        return SensorReading(
+            data.get('device_id', 'unknown'), 'master',
+            _analog(data.get('flame', source.get('flame')), 0),
+            _analog(data.get('smoke', source.get('smoke')), 0),
+            data.get('temperature'), data.get('humidity'), _read_light(data),
+            data.get('alert', source.get('alert', False)), data.get('overall_status'),
+            data.get('name'), data.get('location'), None,
+            None, None, None, data.get('timestamp'), shape
+        )
+    return extract
+
+
+class PayloadNormalizer:
+    """按来源缓存字段提取器的载荷规整器"""
+
+    def __init__(self):
+        self._extractors = {}  # (来源, 是否含slave_id, 是否含sensors) -> 提取器
+        self._lock = threading.Lock()
+        self.stats = {
+            'normalized': 0,
+            'compiled': 0,
+            'unknown_shapes': 0,
+            'errors': 0
+        }
+        self.shape_counts = {}
+        self._unknown_sources = set()
+
+    def normalize(self, source, data):
+        """把一条上报数据规整为 SensorReading
+
+        Args:
+            source: 数据来源（MQTT主题或HTTP等），格式按来源缓存
+            data: 解析后的JSON字典
+
+        Returns:
+            SensorReading: 规整后的读数；无法解析时返回None
+        """
+        if not isinstance(data, dict):
+            self._unknown(source, type(data).__name__)
+            return None
+
+        key = (source, 'slave_id' in data, 'sensors' in data)
+        extractor = self._extractors.get(key)
+        if extractor is None:
+            extractor = self._compile(key, data)
+
+        try:
+            reading = extractor(data)
+        except EXTRACT_ERRORS as e:
+            # 同一来源的格式发生变化，重新识别一次
+            self._extractors.pop(key, None)
+            try:
+                reading = self._compile(key, data)(data)
+            except EXTRACT_ERRORS:
+                with self._lock:
+                    self.stats['errors'] += 1
+                logger.warning(f"传感器数据字段缺失({source}): {e}")
+                return None
+
+        if reading.shape == SHAPE_UNKNOWN:
+            self._unknown(source, sorted(data.keys()))
+        with self._lock:
+            self.stats['normalized'] += 1
+            self.shape_counts[reading.shape] = self.shape_counts.get(reading.shape, 0) + 1
+        return reading
+
+    def _compile(self, key, data):
+        source, has_slave_id, has_sensors = key
+        has_flame, has_smoke = _slave_sensors(data) if has_sensors else (False, False)
+
+        if has_slave_id:
+            extractor = _compile_slave(False)
+            shape = SHAPE_SLAVE
+        elif has_flame or has_smoke:
+            extractor = _compile_slave(True)
+            shape = SHAPE_SLAVE_FORWARDED
+        else:
+            extractor = _compile_master()
+            shape = SHAPE_MASTER
+
+        with self._lock:
+            self._extractors[key] = extractor
+            self.stats['compiled'] += 1
+        logger.info(f"识别数据格式: 来源 {source} -> {shape}")
+        return extractor
+
+    def _unknown(self, source, detail):
+        with self._lock:
+            self.stats['unknown_shapes'] += 1
+            first = source not in self._unknown_sources
+            self._unknown_sources.add(source)
+        if first:
+            logger.warning(f"无法识别的传感器数据格式({source}): {detail}")
+
+    def get_stats(self):
+        """获取规整器运行统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['shapes'] = dict(self.shape_counts)
+            stats['cached_extractors'] = len(self._extractors)
+        return stats
+
+
+payload_normalizer = PayloadNormalizer()
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+传感器数据汇总表 - 按设备的1分钟/1小时/1天聚合
+=============================================
+
+功能:
+1. 每个设备每个时间桶保存 条数、报警条数、最新时间，以及每个指标的 条数/最小/最大/总和/平方和
+2. 入库时在同一写事务中增量更新（UPSERT），历史查询不再读取窗口内的全部原始数据
+3. 从原始数据重建：python rollups.py --db instance/fire_alarm.db --backfill
+4. 按时间窗口和点数上限自动选择分辨率；统计摘要按 天/小时/分钟 拼接窗口，两端不足1分钟的部分读原始数据
+5. 时间桶 bucket 为桶起始的UTC毫秒整数（timestamp - timestamp % 桶长），分桶与范围比较都是整数运算
+6. 统计摘要一条SQL得到每个设备的汇总行和合计行
+"""
+
+import os
+import sys
+import math
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+from storage import execute, executemany, get_storage
+from partitions import VIEW_NAME, list_partitions, partition_bounds
+from timeutil import to_ms, iso_ms, floor_ms
+
+logger = logging.getLogger(__name__)
+
+# 分辨率 -> 时间桶秒数（由细到粗）
+RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+
+# 时间桶毫秒数与SQL分桶表达式
+BUCKET_MS = {resolution: seconds * 1000 for resolution, seconds in RESOLUTIONS.items()}
+BUCKET_SQL = {resolution: f"timestamp - timestamp % {ms}" for resolution, ms in BUCKET_MS.items()}
+
+# 汇总指标：(接口字段名, 原始数据列名)
+METRICS = (
+    ('flame', 'flame_value'),
+    ('smoke', 'smoke_value'),
+    ('temperature', 'temperature'),
+    ('humidity', 'humidity'),
+    ('light', 'light_level'),
+)
+METRIC_FIELDS = ('count', 'min', 'max', 'sum', 'sumsq')
+
+COLUMNS = ['device_id', 'bucket', 'device_type', 'count', 'alert_count', 'last_timestamp'] + \
+          [f"{metric}_{field}" for metric, _ in METRICS for field in METRIC_FIELDS]
+
+# 由原始数据计算各指标的汇总列（顺序与 COLUMNS 中的指标列一致）
+RAW_METRIC_EXPRESSIONS = [expression for _, column in METRICS for expression in (
+    f"COUNT({column})", f"MIN({column})", f"MAX({column})", f"COALESCE(SUM({column}), 0)",
+    f"COALESCE(SUM({column} * {column}), 0)")]
+RAW_METRICS_SQL = ', '.join(RAW_METRIC_EXPRESSIONS)
+# 按设备聚合原始数据，列名与汇总表一致（bucket 为NULL）
+RAW_ROLLUP_SQL = ', '.join(f"{expression} AS {column}" for expression, column in zip(
+    ['device_id', 'NULL', 'MAX(device_type)', 'COUNT(*)', 'COALESCE(SUM(alert_status), 0)', 'MAX(timestamp)'] +
+    RAW_METRIC_EXPRESSIONS, COLUMNS))
+
+
+def table_name(resolution):
+    return f"sensor_rollup_{resolution}"
+
+
+def create_tables(conn):
+    """创建汇总表（数据库迁移时调用）"""
+    metric_columns = ', '.join(
+        f"{metric}_count INTEGER NOT NULL DEFAULT 0, {metric}_min FLOAT, {metric}_max FLOAT, "
+        f"{metric}_sum FLOAT NOT NULL DEFAULT 0, {metric}_sumsq FLOAT NOT NULL DEFAULT 0"
+        for metric, _ in METRICS
+    )
+    for resolution in RESOLUTIONS:
+        name = table_name(resolution)
+        execute(conn, f"CREATE TABLE IF NOT EXISTS {name} ("
+                      f"device_id VARCHAR(50) NOT NULL, bucket INTEGER NOT NULL, device_type VARCHAR(20), "
+                      f"count INTEGER NOT NULL DEFAULT 0, alert_count INTEGER NOT NULL DEFAULT 0, "
+                      f"last_timestamp INTEGER, {metric_columns}, "
+                      f"PRIMARY KEY (device_id, bucket)) WITHOUT ROWID")
+        execute(conn, f"CREATE INDEX IF NOT EXISTS ix_{name}_bucket ON {name} (bucket)")
+
+
+def drop_tables(conn):
+    """删除汇总表（数据库迁移改变表结构时调用）"""
+    for resolution in RESOLUTIONS:
+        execute(conn, f"DROP TABLE IF EXISTS {table_name(resolution)}")
+
+
+def rebuild(conn, start=None, end=None):
+    """按原始数据重建 [start, end) 范围内的汇总（按分区执行，start/end 为分区对齐的毫秒时间戳）
+
+    Returns:
+        int: 读取的原始数据分区数
+    """
+    start, end = to_ms(start), to_ms(end)
+    rebuilt = 0
+    for partition in list_partitions(conn):
+        lower, upper = partition_bounds(partition)
+        if (start is not None and upper <= start) or (end is not None and lower >= end):
+            continue
+        bounds = (lower, upper)
+        for resolution in RESOLUTIONS:
+            name = table_name(resolution)
+            # 周/天分区边界与 1m/1h/1d 时间桶对齐，先删除再整体重算
+            execute(conn, f"DELETE FROM {name} WHERE bucket >= ? AND bucket < ?", bounds)
+            execute(conn, f"INSERT INTO {name} ({', '.join(COLUMNS)}) "
+                          f"SELECT device_id, {BUCKET_SQL[resolution]} AS rollup_bucket, MAX(device_type), COUNT(*), "
+                          f"COALESCE(SUM(alert_status), 0), MAX(timestamp), {RAW_METRICS_SQL} "
+                          f"FROM {VIEW_NAME} WHERE timestamp >= ? AND timestamp < ? "
+                          f"GROUP BY device_id, rollup_bucket", bounds)
+        rebuilt += 1
+    return rebuilt
+
+
+def bucket_start(value, resolution):
+    """时间（毫秒整数）所在时间桶的起始毫秒"""
+    return floor_ms(value, BUCKET_MS[resolution])
+
+
+def _bucket_ceil(value, resolution):
+    start = bucket_start(value, resolution)
+    return start if start == value else start + BUCKET_MS[resolution]
+
+
+def _empty_bucket():
+    bucket = {'device_type': None, 'count': 0, 'alert_count': 0, 'last_timestamp': None}
+    for metric, _ in METRICS:
+        bucket.update({f"{metric}_count": 0, f"{metric}_min": None, f"{metric}_max": None,
+                       f"{metric}_sum": 0.0, f"{metric}_sumsq": 0.0})
+    return bucket
+
+
+def _upsert_sql(resolution):
+    updates = [
+        "device_type = COALESCE(excluded.device_type, device_type)",
+        "count = count + excluded.count",
+        "alert_count = alert_count + excluded.alert_count",
+        "last_timestamp = MAX(last_timestamp, excluded.last_timestamp)",
+    ]
+    for metric, _ in METRICS:
+        # MIN/MAX 任一参数为NULL时结果为NULL，用 COALESCE 取非空的一方
+        updates += [
+            f"{metric}_count = {metric}_count + excluded.{metric}_count",
+            f"{metric}_min = COALESCE(MIN({metric}_min, excluded.{metric}_min), {metric}_min, excluded.{metric}_min)",
+            f"{metric}_max = COALESCE(MAX({metric}_max, excluded.{metric}_max), {metric}_max, excluded.{metric}_max)",
+            f"{metric}_sum = {metric}_sum + excluded.{metric}_sum",
+            f"{metric}_sumsq = {metric}_sumsq + excluded.{metric}_sumsq",
+        ]
+    return (f"INSERT INTO {table_name(resolution)} ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in COLUMNS)}) "
+            f"ON CONFLICT (device_id, bucket) DO UPDATE SET {', '.join(updates)}")
+
+
+class SensorRollups:
+    """汇总表的增量维护与查询"""
+
+    def __init__(self, storage, max_points=500):
+        """
+        Args:
+            storage: SQLiteStorage 实例
+            max_points: 历史曲线每个设备默认的最大点数
+        """
+        self.storage = storage
+        self.max_points = max_points
+        self._upsert = {resolution: _upsert_sql(resolution) for resolution in RESOLUTIONS}
+        self.rows_applied = 0
+        self.buckets_upserted = 0
+
+    def apply(self, conn, rows):
+        """在入库的写事务中把一批原始记录累加到各分辨率的汇总表"""
+        for resolution, bucket_ms in BUCKET_MS.items():
+            buckets = {}
+            for row in rows:
+                timestamp = row['timestamp']
+                key = (row['device_id'], timestamp - timestamp % bucket_ms)
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = _empty_bucket()
+                bucket['device_type'] = row.get('device_type') or bucket['device_type']
+                bucket['count'] += 1
+                bucket['alert_count'] += 1 if row.get('alert_status') else 0
+                if bucket['last_timestamp'] is None or timestamp > bucket['last_timestamp']:
+                    bucket['last_timestamp'] = timestamp
+                for metric, column in METRICS:
+                    value = row.get(column)
+                    if value is None:
+                        continue
+                    bucket[f"{metric}_count"] += 1
+                    bucket[f"{metric}_sum"] += value
+                    bucket[f"{metric}_sumsq"] += value * value
+                    current = bucket[f"{metric}_min"]
+                    bucket[f"{metric}_min"] = value if current is None else min(current, value)
+                    current = bucket[f"{metric}_max"]
+                    bucket[f"{metric}_max"] = value if current is None else max(current, value)
+
+            executemany(conn, self._upsert[resolution], [
+                (device_id, bucket_key) + tuple(bucket[column] for column in COLUMNS[2:])
+                for (device_id, bucket_key), bucket in buckets.items()
+            ])
+            self.buckets_upserted += len(buckets)
+        self.rows_applied += len(rows)
+
+    def adjust_alerts(self, conn, device_id, timestamp, delta):
+        """原始记录的报警状态被修改后（如AI复核），修正对应时间桶的报警条数"""
+        timestamp = to_ms(timestamp)
+        for resolution in RESOLUTIONS:
+            execute(conn, f"UPDATE {table_name(resolution)} SET alert_count = MAX(alert_count + ?, 0) "
+                          f"WHERE device_id = ? AND bucket = ?",
+                    (delta, device_id, bucket_start(timestamp, resolution)))
+
+    def choose_resolution(self, start, end, max_points=None):
+        """选择不粗于目标间隔（窗口长度 / max_points）的最粗分辨率
+
+        汇总点数不少于 max_points，再由调用方降采样到 max_points；
+        目标间隔比1分钟还短时返回最细的1m。
+        """
+        target_ms = (to_ms(end) - to_ms(start)) / (max_points or self.max_points)
+        chosen = '1m'
+        for resolution, bucket_ms in BUCKET_MS.items():
+            if bucket_ms <= target_ms:
+                chosen = resolution
+        return chosen
+
+    def series(self, start, end, resolution, device_id=None, device_type=None):
+        """读取时间窗口内的汇总点，返回 {设备ID: {'device_type': ..., 'data': [点, ...]}}"""
+        start, end = to_ms(start), to_ms(end)
+        sql = (f"SELECT {', '.join(COLUMNS)} FROM {table_name(resolution)} "
+               f"WHERE bucket >= ? AND bucket <= ?")
+        params = [bucket_start(start, resolution), end]
+        if device_id:
+            sql += " AND device_id = ?"
+            params.append(device_id)
+        if device_type:
+            sql += " AND device_type = ?"
+            params.append(device_type)
+        sql += " ORDER BY device_id, bucket"
+
+        with self.storage.read() as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        devices = {}
+        for row in rows:
+            record = dict(zip(COLUMNS, row))
+            device = devices.setdefault(record['device_id'], {'device_type': record['device_type'], 'data': []})
+            point = {
+                'timestamp': iso_ms(record['bucket']),
+                'samples': record['count'],
+                'alert': record['alert_count'] > 0,
+                'alert_count': record['alert_count']
+            }
+            for metric, _ in METRICS:
+                count = record[f"{metric}_count"]
+                point[metric] = record[f"{metric}_sum"] / count if count else None
+                point[f"{metric}_min"] = record[f"{metric}_min"]
+                point[f"{metric}_max"] = record[f"{metric}_max"]
+            device['data'].append(point)
+        return devices
+
+    def summarize(self, start, end, device_type=None):
+        """统计窗口内每个设备的汇总值和全部设备的合计（一条SQL）
+
+        窗口为 [start, end]（含end）。整天部分读1d表，剩余整小时读1h表，不足1小时的整分钟读1m表，
+        两端不足1分钟的部分直接聚合原始数据，结果与按原始数据统计完全一致（起点不必按分钟对齐）。
+        先按设备 GROUP BY，再由每个设备的汇总行得到合计行；原始数据最多读两端各1分钟，
+        执行时间主要与设备数相关，与窗口内的原始数据条数无关。
+
+        Returns:
+            (devices, total)
+            devices: {设备ID: 汇总字典（COLUMNS中除bucket外的字段，数值为窗口内的合计，last_timestamp 为毫秒整数）}
+            total: 全部设备合计（字段同上，device_type 为None），窗口内没有数据时为None
+        """
+        start, end = to_ms(start), to_ms(end)
+        stop = end + 1  # 以下各段均为 [lower, upper)
+        minute_start, minute_end = _bucket_ceil(start, '1m'), bucket_start(stop, '1m')
+        if minute_start >= minute_end:
+            segments = [('raw', start, stop)]
+        else:
+            hour_start, hour_end = _bucket_ceil(minute_start, '1h'), bucket_start(minute_end, '1h')
+            if hour_start >= hour_end:
+                segments = [('1m', minute_start, minute_end)]
+            else:
+                day_start, day_end = _bucket_ceil(hour_start, '1d'), bucket_start(hour_end, '1d')
+                if day_start >= day_end:
+                    segments = [('1h', hour_start, hour_end)]
+                else:
+                    segments = [('1h', hour_start, day_start), ('1d', day_start, day_end), ('1h', day_end, hour_end)]
+                segments = [('1m', minute_start, hour_start)] + segments + [('1m', hour_end, minute_end)]
+            segments = [('raw', start, minute_start)] + segments + [('raw', minute_end, stop)]
+
+        selects = []
+        params = []
+        for source, lower, upper in segments:
+            if lower >= upper:
+                continue
+            if source == 'raw':
+                # 不足1分钟的部分：按设备聚合原始数据，列名与汇总表一致（UNION ALL 的列名取第一个SELECT）
+                sql = f"SELECT {RAW_ROLLUP_SQL} FROM {VIEW_NAME} WHERE timestamp >= ? AND timestamp < ?"
+            else:
+                sql = f"SELECT {', '.join(COLUMNS)} FROM {table_name(source)} WHERE bucket >= ? AND bucket < ?"
+            params += [lower, upper]
+            if device_type:
+                sql += " AND device_type = ?"
+                params.append(device_type)
+            if source == 'raw':
+                sql += " GROUP BY device_id"
+            selects.append(sql)
+
+        fields = [column for column in COLUMNS if column not in ('device_id', 'bucket')]
+        # 汇总值的合并方式：条数/总和相加，最小/最大取最小/最大，最新时间取最大
+        merge = {'device_type': 'MAX', 'count': 'SUM', 'alert_count': 'SUM', 'last_timestamp': 'MAX'}
+        for metric, _ in METRICS:
+            merge.update({f"{metric}_count": 'SUM', f"{metric}_min": 'MIN', f"{metric}_max": 'MAX',
+                          f"{metric}_sum": 'SUM', f"{metric}_sumsq": 'SUM'})
+        per_device = ', '.join(f"{merge[field]}({field}) AS {field}" for field in fields)
+        overall = ', '.join('NULL' if field == 'device_type' else f"{merge[field]}({field})" for field in fields)
+        # 合计行的 device_id 为NULL，排在最前面（窗口内没有数据时合计行的条数为NULL）
+        sql = (f"WITH per_device AS (SELECT device_id, {per_device} FROM ({' UNION ALL '.join(selects)}) "
+               f"GROUP BY device_id) "
+               f"SELECT device_id, {', '.join(fields)} FROM per_device "
+               f"UNION ALL SELECT NULL, {overall} FROM per_device "
+               f"ORDER BY 1")
+
+        with self.storage.read() as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        keys = ['device_id'] + fields
+        devices = {}
+        total = None
+        for row in rows:
+            record = dict(zip(keys, row))
+            if row[0] is not None:
+                devices[row[0]] = record
+            elif record['count']:
+                total = record
+        return devices, total
+
+    @staticmethod
+    def metric_stats(summary, metric):
+        """由汇总值计算均值/标准差"""
+        count = summary[f"{metric}_count"] or 0
+        if not count:
+            return {'count': 0, 'avg': None, 'min': None, 'max': None, 'std': None}
+        mean = summary[f"{metric}_sum"] / count
+        variance = max(summary[f"{metric}_sumsq"] / count - mean * mean, 0.0)
+        return {'count': count, 'avg': mean, 'min': summary[f"{metric}_min"],
+                'max': summary[f"{metric}_max"], 'std': math.sqrt(variance)}
+
+    def prune(self, cutoffs):
+        """删除过期的汇总数据
+
+        Args:
+            cutoffs: {分辨率: 截止时间（datetime或毫秒整数）或None（不删除）}
+        """
+        deleted = 0
+        for resolution, cutoff in cutoffs.items():
+            if cutoff is None:
+                continue
+            with self.storage.write() as conn:
+                deleted += execute(conn, f"DELETE FROM {table_name(resolution)} WHERE bucket < ?",
+                                   (to_ms(cutoff),)).rowcount
+        return deleted
+
+    def backfill(self, start=None, end=None):
+        """从原始数据重建汇总，每个分区一个写事务"""
+        start, end = to_ms(start), to_ms(end)
+        with self.storage.read() as conn:
+            partitions = list_partitions(conn)
+        rebuilt = 0
+        for partition in partitions:
+            lower, upper = partition_bounds(partition)
+            if (start is not None and upper <= start) or (end is not None and lower >= end):
+                continue
+            with self.storage.write() as conn:
+                rebuilt += rebuild(conn, lower, upper)
+            logger.info(f"汇总表已重建: {partition}")
+        return rebuilt
+
+    def get_stats(self):
+        return {
+            'resolutions': list(RESOLUTIONS),
+            'rows_applied': self.rows_applied,
+            'buckets_upserted': self.buckets_upserted,
+            'max_points': self.max_points
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='火灾报警系统传感器汇总表')
+    parser.add_argument('--db', required=True, help='数据库文件路径')
+    parser.add_argument('--backfill', action='store_true', help='从原始数据重建汇总表')
+    parser.add_argument('--days', type=int, help='只重建最近N天')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not os.path.exists(args.db):
+        parser.error(f"数据库文件不存在: {args.db}")
+    if not args.backfill:
+        parser.print_help()
+        return 0
+
+    from migrations import run_migrations
+    run_migrations(args.db)  # 确保汇总表已创建
+
+    rollups = SensorRollups(get_storage(args.db))
+    start = datetime.utcnow() - timedelta(days=args.days) if args.days else None
+    rebuilt = rollups.backfill(start=start)
+    print(f"已重建 {rebuilt} 个分区的汇总数据")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
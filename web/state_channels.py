@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务端状态通道 - 订阅时推送一次快照，之后只推送增量
+===================================================
+
+功能:
+1. 每个通道由服务端计算完整状态 {键: 条目}（设备列表、从机列表、实时曲线、连接状态），前端不再定时轮询HTTP接口
+2. 客户端 emit('subscribe', {'channels': [...]}) 后加入通道房间，立即收到 state_snapshot：{channel, seq, items}
+3. 后台线程按间隔重新计算有订阅者的通道，与上次的状态比较，只把变化的条目以
+   state_patch：{channel, seq, upsert, remove} 推送给该通道的房间
+4. 数据版本号变化（入库、设备信息写回等）或调用 touch() 后，通道在下一次检查时重新计算
+5. seq 每次推送增量加1，客户端发现序号不连续时重新订阅即可取得新的快照
+
+说明:
+    同一通道的快照与增量在通道锁内发送，客户端收到快照后只会收到序号更大的增量。
+    没有订阅者的通道不重新计算（keep_warm 的通道除外，例如需要持续采样的实时曲线），
+    第一个订阅者加入时先重新计算一次。
+"""
+
+import time
+import threading
+import logging
+
+from timeutil import now_ms
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_EVENT = 'state_snapshot'
+PATCH_EVENT = 'state_patch'
+
+
+class StateChannel:
+    """一个状态通道：计算函数 + 上次推送的状态"""
+
+    def __init__(self, name, compute, max_age=10.0, keep_warm=False):
+        """
+        Args:
+            name: 通道名称
+            compute: 返回完整状态 {键(字符串): 条目(可JSON序列化)} 的函数
+            max_age: 状态最长多久重新计算一次（秒），用于在线状态等随时间变化的字段
+            keep_warm: 没有订阅者时也按 max_age 重新计算
+        """
+        self.name = name
+        self.compute = compute
+        self.max_age = max_age
+        self.keep_warm = keep_warm
+        self.room = f"state:{name}"
+        self.items = {}
+        self.seq = 0
+        self.computed_at = None  # time.monotonic()
+        self.dirty = True
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.patches = 0
+        self.snapshots = 0
+
+    def due(self, now):
+        return self.dirty or self.computed_at is None or now - self.computed_at >= self.max_age
+
+    def refresh(self):
+        """重新计算状态（调用方持有锁），有变化时返回增量，否则返回None"""
+        items = self.compute()
+        upsert = {key: item for key, item in items.items() if self.items.get(key) != item}
+        remove = [key for key in self.items if key not in items]
+        self.items = items
+        self.computed_at = time.monotonic()
+        self.dirty = False
+        if not upsert and not remove:
+            return None
+        self.seq += 1
+        return {'channel': self.name, 'seq': self.seq, 'upsert': upsert, 'remove': remove}
+
+
+class ChartTail:
+    """实时曲线的最近N个采样点（全部在线设备的平均值），作为 chart 通道的计算函数"""
+
+    METRICS = (('temperature', 'temperature', 1), ('humidity', 'humidity', 1), ('smoke', 'smoke_level', 0),
+               ('flame', 'flame', 0), ('light', 'light_level', 0))
+
+    def __init__(self, source, points=20, interval=5.0):
+        """
+        Args:
+            source: 返回设备条目列表（/api/devices 格式）的函数
+            points: 保留的采样点数
+            interval: 采样间隔（秒）
+        """
+        self.source = source
+        self.points = points
+        self.interval = interval
+        self._samples = {}
+        self._sampled_at = None
+
+    def __call__(self):
+        now = time.monotonic()
+        if self._sampled_at is None or now - self._sampled_at >= self.interval:
+            self._sampled_at = now
+            self._sample()
+        return dict(self._samples)
+
+    def _sample(self):
+        devices = [device for device in self.source()
+                   if isinstance(device.get('temperature'), (int, float))
+                   and isinstance(device.get('smoke_level'), (int, float))]
+        if not devices:
+            return
+        timestamp = now_ms()
+        point = {'timestamp': timestamp}
+        for name, field, digits in self.METRICS:
+            point[name] = round(sum(device.get(field) or 0 for device in devices) / len(devices), digits)
+        self._samples[str(timestamp)] = point
+        while len(self._samples) > self.points:
+            del self._samples[next(iter(self._samples))]
+
+
+class StateChannels:
+    """状态通道注册、订阅与增量推送"""
+
+    def __init__(self, socketio, version=None, interval=1.0):
+        """
+        Args:
+            socketio: Flask-SocketIO 实例
+            version: DataVersion 实例，版本变化时全部通道在下一次检查时重新计算
+            interval: 检查间隔（秒），同一通道每个间隔最多推送一次增量
+        """
+        self.socketio = socketio
+        self.version = version
+        self.interval = interval
+        self._channels = {}
+        self._seen_version = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.stats = {
+            'ticks': 0,
+            'refreshes': 0,
+            'refresh_errors': 0,
+            'send_errors': 0,
+            'last_tick_ms': 0.0,
+            'max_tick_ms': 0.0
+        }
+
+    def register(self, name, compute, max_age=10.0, keep_warm=False):
+        channel = self._channels[name] = StateChannel(name, compute, max_age, keep_warm)
+        return channel
+
+    @property
+    def names(self):
+        return list(self._channels)
+
+    def touch(self, *names):
+        """标记通道需要重新计算（不指定时标记全部）"""
+        for name in names or self._channels:
+            channel = self._channels.get(name)
+            if channel is not None:
+                channel.dirty = True
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name='state-channels', daemon=True)
+        self._thread.start()
+        logger.info(f"状态通道启动: {', '.join(self._channels)}，检查间隔 {int(self.interval * 1000)} 毫秒")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(self.interval + 5)
+            self._thread = None
+
+    def subscribe(self, sid, names):
+        """订阅通道：加入房间并向该客户端发送快照，返回实际订阅的通道名"""
+        subscribed = []
+        for name in names:
+            channel = self._channels.get(name)
+            if channel is None:
+                continue
+            with channel.lock:
+                # 没有其他订阅者时状态可能已过期，先重新计算（增量没有接收者，直接丢弃）
+                if not channel.subscribers or channel.computed_at is None:
+                    self._refresh(channel)
+                channel.subscribers.add(sid)
+                self.socketio.server.enter_room(sid, channel.room, namespace='/')
+                if self._emit(SNAPSHOT_EVENT, {'channel': name, 'seq': channel.seq, 'items': channel.items}, sid):
+                    channel.snapshots += 1
+            subscribed.append(name)
+        return subscribed
+
+    def unsubscribe(self, sid, names=None):
+        """取消订阅（客户端断开时不指定通道名，取消全部）"""
+        for name in names or list(self._channels):
+            channel = self._channels.get(name)
+            if channel is None or sid not in channel.subscribers:
+                continue
+            with channel.lock:
+                channel.subscribers.discard(sid)
+            if names:
+                self.socketio.server.leave_room(sid, channel.room, namespace='/')
+
+    def tick(self):
+        """重新计算到期的通道并推送增量，返回推送的增量数"""
+        started = time.perf_counter()
+        if self.version is not None and self.version.counter != self._seen_version:
+            self._seen_version = self.version.counter
+            self.touch()
+
+        sent = 0
+        now = time.monotonic()
+        for channel in list(self._channels.values()):
+            if not (channel.subscribers or channel.keep_warm) or not channel.due(now):
+                continue
+            with channel.lock:
+                patch = self._refresh(channel)
+                if patch and channel.subscribers and self._emit(PATCH_EVENT, patch, channel.room):
+                    channel.patches += 1
+                    sent += 1
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats['ticks'] += 1
+        self.stats['last_tick_ms'] = round(elapsed_ms, 3)
+        self.stats['max_tick_ms'] = round(max(self.stats['max_tick_ms'], elapsed_ms), 3)
+        return sent
+
+    def _refresh(self, channel):
+        try:
+            patch = channel.refresh()
+        except Exception as e:
+            self.stats['refresh_errors'] += 1
+            logger.error(f"状态通道 {channel.name} 计算失败: {e}")
+            return None
+        self.stats['refreshes'] += 1
+        return patch
+
+    def _emit(self, event, payload, to):
+        try:
+            self.socketio.emit(event, payload, to=to)
+            return True
+        except Exception as e:
+            self.stats['send_errors'] += 1
+            logger.error(f"状态通道推送失败({event}): {e}")
+            return False
+
+    def _loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"状态通道检查失败: {e}")
+
+    def get_stats(self):
+        return dict(self.stats,
+                    interval_ms=int(self.interval * 1000),
+                    channels={name: {
+                        'subscribers': len(channel.subscribers),
+                        'items': len(channel.items),
+                        'seq': channel.seq,
+                        'patches': channel.patches,
+                        'snapshots': channel.snapshots,
+                        'max_age': channel.max_age
+                    } for name, channel in self._channels.items()})
@@ -2,6 +2,7 @@
 
 // 全局变量
 let socket;
+let stateChannels;
 let devices = {};
 let slaves = {};
 let alarmHistory = [];
@@ -47,6 +48,7 @@ function initializeSocket() {
 
     // 建立Socket.IO连接
     socket = io();
+    attachUpdateBatch(socket);
 
     // 连接成功
     socket.on('connect', function() {
@@ -72,37 +74,35 @@ function initializeSocket() {
         // 可以在这里处理实时传感器数据
     });
 
+    // 接收AI复核结果（警告/报警数据由后台异步复核）
+    socket.on('ai_decision', function(decisionData) {
+        console.log('收到AI复核结果:', decisionData);
+        if (decisionData.ai_decision && decisionData.ai_decision.intervention) {
+            showNotification('AI复核', `${decisionData.device_id}: ${decisionData.ai_decision.reasoning}`, 'info');
+        }
+    });
+
     // 接收报警信息 - 关键修复点！
     socket.on('alarm', function(alarmData) {
         console.log('收到报警消息:', alarmData);
         handleAlarm(alarmData);
     });
 
-    // 接收设备状态更新
-    socket.on('devices_update', function(devicesData) {
-        console.log('收到设备状态更新:', devicesData);
-        updateDevices(devicesData);
-        updateStatusOverview(devicesData);
+    // 服务端状态通道：订阅时收到一次快照，之后只收到增量，不再定时轮询HTTP接口
+    stateChannels = attachStateChannels(socket, {
+        devices: function(items) {
+            const deviceList = Object.values(items);
+            updateDevices(deviceList);
+            updateStatusOverview(deviceList);
+        },
+        slaves: renderSlaves,
+        chart: renderChartTail,
+        connection: updateConnectionStatus
     });
 }
 
-// 加载初始数据
+// 加载初始数据（设备、从机、实时曲线由状态通道的快照提供）
 function loadInitialData() {
-    // 通过API获取初始设备数据
-    fetch('/api/devices')
-        .then(response => response.json())
-        .then(data => {
-            updateDevices(data);
-            updateStatusOverview(data);
-        })
-        .catch(error => {
-            console.error('加载设备数据失败:', error);
-            showNotification('加载失败', '无法加载设备数据', 'error');
-        });
-
-    // 加载从机数据
-    refreshSlaves();
-
     // 加载报警历史
     fetch('/api/history')
         .then(response => response.json())
@@ -147,33 +147,8 @@ function setupEventListeners() {
 
 // 启动定时器
 function startTimers() {
-    // 每30秒检查一次连接状态
-    setInterval(checkConnection, 30000);
-
     // 每秒更新时间显示
     setInterval(updateCurrentTime, 1000);
-
-    // 每5秒获取一次传感器数据用于图表
-    setInterval(fetchSensorDataForChart, 5000);
-
-    // 每3秒刷新一次从机数据
-    setInterval(refreshSlaves, 3000);
-
-    // 每10秒刷新一次设备数据
-    setInterval(refreshDevices, 10000);
-}
-
-// 刷新设备数据
-function refreshDevices() {
-    fetch('/api/devices')
-        .then(response => response.json())
-        .then(data => {
-            updateDevices(data);
-            updateStatusOverview(data);
-        })
-        .catch(error => {
-            console.error('刷新设备数据失败:', error);
-        });
 }
 
 // 更新设备显示
@@ -181,6 +156,9 @@ function updateDevices(deviceData) {
     const container = document.getElementById('devices-container');
     if (!container) return;
 
+    // 完整列表替换本地设备缓存
+    devices = {};
+
     container.innerHTML = '';
 
     // 如果没有设备，显示提示信息
@@ -770,106 +748,35 @@ function restoreOriginalData() {
     datasets[2].label = '火焰值';
 }
 
-// 用新数据更新图表
-function updateChartWithNewData(deviceData) {
+// 用服务器采样的曲线尾部重绘图表（chart 通道：{采样时间: 全部在线设备的平均值}）
+function renderChartTail(items) {
     if (!realtimeChart) return;
 
-    const now = new Date();
-    const timeLabel = now.toLocaleTimeString('zh-CN');
-
-    let avgTemp = 0, avgHumidity = 0, avgSmoke = 0, avgFlame = 0, avgLight = 0;
-    let validDevices = 0;
-
-    // 调试：输出接收到的设备数据
-    console.log('接收到设备数据:', deviceData);
-
-    // 只有在有真实设备数据时才计算平均值
-    if (deviceData && deviceData.length > 0) {
-        deviceData.forEach(device => {
-            if (device && typeof device.temperature === 'number' &&
-                typeof device.smoke_level === 'number') {
-                avgTemp += device.temperature;
-                avgHumidity += device.humidity || 0;
-                avgSmoke += device.smoke_level;
-                avgFlame += device.flame || 0;
-                avgLight += device.light_level || 0;
-                validDevices++;
-                console.log(`设备 ${device.device_id}: 温度=${device.temperature}, 湿度=${device.humidity || 0}, 烟雾=${device.smoke_level}, 火焰=${device.flame || 0}, 光照=${device.light_level || 0}`);
-            }
-        });
-
-        if (validDevices > 0) {
-            avgTemp /= validDevices;
-            avgHumidity /= validDevices;
-            avgSmoke /= validDevices;
-            avgFlame /= validDevices;
-            avgLight /= validDevices;
-        }
-    }
+    const points = Object.values(items).sort((a, b) => a.timestamp - b.timestamp);
+    const series = ['labels', 'temperature', 'humidity', 'smoke', 'flame', 'light'];
 
-    // 如果没有有效数据，使用0值
-    if (validDevices === 0) {
-        avgTemp = 0;
-        avgSmoke = 0;
-        avgFlame = 0;
-        console.log('无传感器数据，显示0值');
-    }
-
-    console.log(`计算平均值: 温度=${avgTemp.toFixed(1)}, 烟雾=${avgSmoke.toFixed(0)}, 火焰=${avgFlame.toFixed(0)}`);
-
-    // 添加新数据点
-    sensorData.labels.push(timeLabel);
-    sensorData.temperature.push(Number(avgTemp.toFixed(1)));
-    sensorData.humidity.push(Number(avgHumidity.toFixed(1)));
-    sensorData.smoke.push(Number(avgSmoke.toFixed(0)));
-    sensorData.flame.push(Number(avgFlame.toFixed(0)));
-    sensorData.light.push(Number(avgLight.toFixed(0)));
-
-    // 保持数据点数量限制
-    if (sensorData.labels.length > MAX_DATA_POINTS) {
-        sensorData.labels.shift();
-        sensorData.temperature.shift();
-        sensorData.humidity.shift();
-        sensorData.smoke.shift();
-        sensorData.flame.shift();
-        sensorData.light.shift();
-    }
+    // 原地替换数组内容，图表数据集仍引用同一个数组
+    series.forEach(name => {
+        sensorData[name].length = 0;
+    });
+    points.forEach(point => {
+        sensorData.labels.push(new Date(point.timestamp).toLocaleTimeString('zh-CN'));
+        sensorData.temperature.push(point.temperature);
+        sensorData.humidity.push(point.humidity);
+        sensorData.smoke.push(point.smoke);
+        sensorData.flame.push(point.flame);
+        sensorData.light.push(point.light);
+    });
 
-    // 更新图表
+    // 按当前视图重新套用数据（综合视图需要重新标准化）
     try {
-        // 检查当前是否为综合视图，如果是则需要重新标准化数据
         const activeChartBtn = document.querySelector('.chart-btn.active');
-        if (activeChartBtn && activeChartBtn.dataset.chart === 'combined') {
-            normalizeDataForCombinedView();
-        }
-
-        realtimeChart.update('none');
+        updateChartView(activeChartBtn ? activeChartBtn.dataset.chart : 'combined');
     } catch (error) {
         console.error('图表更新失败:', error);
     }
 }
 
-// 获取传感器数据用于图表
-function fetchSensorDataForChart() {
-    fetch('/api/devices')
-        .then(response => {
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            return response.json();
-        })
-        .then(data => {
-            if (data && Array.isArray(data) && data.length > 0) {
-                updateChartWithNewData(data);
-            } else {
-                console.log('没有获取到设备数据');
-            }
-        })
-        .catch(error => {
-            console.error('获取传感器数据失败:', error);
-        });
-}
-
 // 更新当前时间显示
 function updateCurrentTime() {
     const timeElement = document.getElementById('current-time');
@@ -879,20 +786,22 @@ function updateCurrentTime() {
     }
 }
 
-// 检查连接状态
-function checkConnection() {
-    // 使用HTTP检查服务器连接状态
-    fetch('/api/devices')
-        .then(response => {
-            if (!response.ok) {
-                throw new Error('服务器连接异常');
-            }
-            console.log('服务器连接正常');
-        })
-        .catch(error => {
-            console.warn('连接检查失败:', error);
-            showNotification('连接断开', '正在尝试重新连接...', 'warning');
-        });
+// 连接状态（connection 通道；与服务器的连接由Socket.IO的 connect/disconnect 事件提示）
+function updateConnectionStatus(items, changes) {
+    const mqtt = items.mqtt;
+    if (!mqtt) return;
+    console.log(`MQTT连接: ${mqtt.connected ? '正常' : '断开'} (${mqtt.broker}:${mqtt.port})`);
+
+    // 只在状态变化时提示，快照不提示正常状态
+    if (changes && changes.upsert.mqtt) {
+        if (mqtt.connected) {
+            showNotification('MQTT已连接', '设备数据接收已恢复', 'success');
+        } else {
+            showNotification('MQTT断开', '服务器与MQTT Broker的连接已断开，设备数据暂停更新', 'warning');
+        }
+    } else if (!changes && !mqtt.connected) {
+        showNotification('MQTT断开', '服务器与MQTT Broker的连接已断开，设备数据暂停更新', 'warning');
+    }
 }
 
 // 更新时间显示
@@ -1126,51 +1035,37 @@ window.addEventListener('beforeunload', function() {
     }
 });
 
-// 设备刷新函数
+// 设备刷新函数（重新获取 devices 通道的快照）
 function refreshDevices() {
-    fetch('/api/devices')
-        .then(response => response.json())
-        .then(data => {
-            updateDevices(data);
-            updateStatusOverview(data);
-            showNotification('刷新成功', '设备数据已更新', 'success');
-        })
-        .catch(error => {
-            console.error('刷新设备数据失败:', error);
-            showNotification('刷新失败', '无法更新设备数据', 'error');
-        });
+    if (!stateChannels || !socket.connected) {
+        showNotification('刷新失败', '未连接到服务器，正在尝试重新连接...', 'error');
+        return;
+    }
+    stateChannels.resync(['devices']);
+    showNotification('刷新成功', '设备数据已更新', 'success');
 }
 
 // 显示特定状态的设备
 function showStatusDevices(status) {
     console.log(`显示状态为 ${status} 的设备`);
 
-    // 获取所有设备数据
-    fetch('/api/devices')
-        .then(response => response.json())
-        .then(data => {
-            // 筛选指定状态的设备
-            const filteredDevices = data.filter(device => {
-                const deviceStatus = device.status;
-                if (status === 'normal') {
-                    return deviceStatus === '正常' || deviceStatus === 'normal';
-                } else if (status === 'warning') {
-                    return deviceStatus === '警告' || deviceStatus === 'warning';
-                } else if (status === 'alarm') {
-                    return deviceStatus === '警报' || deviceStatus === 'alarm';
-                }
-                return false;
-            });
+    // 筛选指定状态的设备（devices 通道维护的当前设备列表）
+    const filteredDevices = Object.values(devices).filter(device => {
+        const deviceStatus = device.status;
+        if (status === 'normal') {
+            return deviceStatus === '正常' || deviceStatus === 'normal';
+        } else if (status === 'warning') {
+            return deviceStatus === '警告' || deviceStatus === 'warning';
+        } else if (status === 'alarm') {
+            return deviceStatus === '警报' || deviceStatus === 'alarm';
+        }
+        return false;
+    });
 
-            console.log(`找到 ${filteredDevices.length} 个${getStatusName(status)}设备`);
+    console.log(`找到 ${filteredDevices.length} 个${getStatusName(status)}设备`);
 
-            // 显示模态框
-            showStatusDevicesModal(status, filteredDevices);
-        })
-        .catch(error => {
-            console.error('获取设备数据失败:', error);
-            showNotification('获取失败', '无法获取设备数据', 'error');
-        });
+    // 显示模态框
+    showStatusDevicesModal(status, filteredDevices);
 }
 
 // 获取状态中文名称
@@ -1412,53 +1307,33 @@ function testSlaveAPI() {
         });
 }
 
+// 重新获取 slaves 通道的快照
 function refreshSlaves() {
-    console.log('刷新从机数据...');
+    if (stateChannels && socket.connected) {
+        stateChannels.resync(['slaves']);
+    }
+}
 
-    fetch('/api/slaves')
-        .then(response => {
-            console.log('API响应状态:', response.status, response.statusText);
-            if (!response.ok) {
-                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
-            }
-            return response.json();
-        })
-        .then(data => {
-            console.log('获取到从机数据:', data);
-
-            // 更新从机数据存储
-            data.forEach(slave => {
-                console.log(`处理从机: ${slave.device_id}`, slave);
-                slaves[slave.device_id] = {
-                    device_id: slave.device_id,
-                    device_type: 'slave',
-                    slave_name: slave.name,
-                    slave_location: slave.location,
-                    overall_status: slave.status || 'normal',
-                    flame: slave.latest_data?.flame || 0,
-                    smoke: slave.latest_data?.smoke || 0,
-                    temperature: slave.latest_data?.temperature || 0,
-                    humidity: slave.latest_data?.humidity || 0,
-                    light_level: slave.latest_data?.light_level || 0,
-                    timestamp: slave.latest_data?.timestamp ? new Date(slave.latest_data.timestamp * 1000).toISOString() : null
-                };
-                console.log(`从机 ${slave.device_id} 数据已更新:`, slaves[slave.device_id]);
-            });
-
-            // 更新显示
-            updateSlavesDisplay();
-
-            // showNotification('刷新成功', `已加载 ${data.length} 个从机设备`, 'success');
-        })
-        .catch(error => {
-            console.error('刷新从机数据失败:', error);
-            console.error('错误详情:', {
-                message: error.message,
-                stack: error.stack,
-                response: error.response
-            });
-            // showNotification('刷新失败', `无法加载从机数据: ${error.message}`, 'error');
-        });
+// 在线从机（slaves 通道，条目格式与 /api/slaves 相同）
+function renderSlaves(items) {
+    slaves = {};
+    Object.values(items).forEach(slave => {
+        slaves[slave.device_id] = {
+            device_id: slave.device_id,
+            device_type: 'slave',
+            slave_name: slave.name,
+            slave_location: slave.location,
+            overall_status: slave.status || 'normal',
+            flame: slave.latest_data?.flame || 0,
+            smoke: slave.latest_data?.smoke || 0,
+            temperature: slave.latest_data?.temperature || 0,
+            humidity: slave.latest_data?.humidity || 0,
+            light_level: slave.latest_data?.light_level || 0,
+            timestamp: slave.latest_data?.timestamp ? new Date(slave.latest_data.timestamp * 1000).toISOString() : null
+        };
+    });
+
+    updateSlavesDisplay();
 }
 
 function showSlaveDetail(slaveId) {
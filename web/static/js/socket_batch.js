@@ -0,0 +1,19 @@
+// WebSocket批量推送解包
+// 服务器每帧只发送一个 update_batch 事件：{事件名: [数据, ...]}
+// 这里按原事件名逐条分发给已注册的监听函数，页面原有的 socket.on('sensor_data', ...) 等处理无需改动
+function attachUpdateBatch(socket) {
+    socket.on('update_batch', function(batch) {
+        Object.keys(batch).forEach(function(eventName) {
+            const listeners = socket.listeners(eventName);
+            batch[eventName].forEach(function(payload) {
+                listeners.forEach(function(listener) {
+                    try {
+                        listener(payload);
+                    } catch (error) {
+                        console.error(`处理批量事件 ${eventName} 失败:`, error);
+                    }
+                });
+            });
+        });
+    });
+}
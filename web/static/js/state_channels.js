@@ -0,0 +1,56 @@
+// 服务端状态通道
+// 连接（包括重连）后订阅通道，服务器先推送一次 state_snapshot：{channel, seq, items}，
+// 之后只推送 state_patch：{channel, seq, upsert, remove}；序号不连续时重新订阅该通道取得新的快照
+// handlers: {通道名: function(items, changes)}，items 为 {键: 条目} 的完整状态，changes 为本次增量（快照时为null）
+function attachStateChannels(socket, handlers) {
+    const channels = {};
+    const names = Object.keys(handlers);
+
+    function subscribe(channelNames) {
+        channelNames.forEach(function(name) {
+            channels[name] = null;  // 等待快照，期间收到的增量丢弃
+        });
+        socket.emit('subscribe', { channels: channelNames });
+    }
+
+    function notify(name, changes) {
+        try {
+            handlers[name](channels[name].items, changes);
+        } catch (error) {
+            console.error(`处理状态通道 ${name} 失败:`, error);
+        }
+    }
+
+    socket.on('connect', function() {
+        subscribe(names);
+    });
+
+    socket.on('state_snapshot', function(snapshot) {
+        if (!handlers[snapshot.channel]) return;
+        channels[snapshot.channel] = { seq: snapshot.seq, items: snapshot.items };
+        notify(snapshot.channel, null);
+    });
+
+    socket.on('state_patch', function(patch) {
+        const channel = channels[patch.channel];
+        if (!channel || patch.seq <= channel.seq) return;
+        if (patch.seq !== channel.seq + 1) {
+            console.warn(`状态通道 ${patch.channel} 序号不连续(${channel.seq} -> ${patch.seq})，重新订阅`);
+            subscribe([patch.channel]);
+            return;
+        }
+        channel.seq = patch.seq;
+        Object.assign(channel.items, patch.upsert);
+        patch.remove.forEach(function(key) {
+            delete channel.items[key];
+        });
+        notify(patch.channel, patch);
+    });
+
+    return {
+        // 重新获取通道快照（手动刷新按钮）
+        resync: function(channelNames) {
+            subscribe(channelNames || names);
+        }
+    };
+}
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite存储层 - WAL模式、单写连接与只读连接池
+===========================================
+
+功能:
+1. 统一配置数据库连接：WAL日志、synchronous、busy_timeout、mmap_size、cache_size
+2. 持有唯一的写连接，批量入库等写操作在锁内串行执行，不会互相抢占写锁
+3. 维护只读连接池，智能分析、AI决策和查询接口共用，读操作不阻塞数据写入
+4. Flask-SQLAlchemy 的连接也经过同一配置（SQLALCHEMY_ENGINE_OPTIONS），查询接口的ORM读取使用只读引擎
+"""
+
+import os
+import time
+import queue
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+
+logger = logging.getLogger(__name__)
+
+# 默认连接参数
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',      # WAL下NORMAL只在检查点时同步，断电最多丢失最近的提交，不会损坏数据库
+    'busy_timeout': 5000,         # 毫秒
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32768,         # 负数表示KB，即每个连接32MB页缓存
+    'temp_store': 'MEMORY',
+    'journal_size_limit': 64 * 1024 * 1024,
+}
+
+
+class SQLiteStorage:
+    """SQLite存储引擎：一个串行写连接 + 只读连接池"""
+
+    def __init__(self, db_path, readers=4, pragmas=None):
+        """
+        Args:
+            db_path: 数据库文件路径
+            readers: 只读连接池大小
+            pragmas: 覆盖 DEFAULT_PRAGMAS 中的参数
+        """
+        self.db_path = os.path.abspath(db_path)
+        self.readers = readers
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update({key: value for key, value in pragmas.items() if value is not None})
+
+        self._write_lock = threading.Lock()
+        self._writer_engine = None
+        self._reader_pool = queue.Queue()
+        self._reader_count = 0
+        self._pool_lock = threading.Lock()
+        self._wal_checked = False
+
+        # 运行统计
+        self.writes = 0
+        self.write_wait_ms = 0.0
+        self.max_write_wait_ms = 0.0
+        self.reads = 0
+        self.read_wait_ms = 0.0
+
+    def connect(self, readonly=False):
+        """创建一个按统一参数配置的连接（也作为 SQLAlchemy 的 creator 使用）"""
+        if readonly:
+            uri = 'file:' + self.db_path.replace('\\', '/') + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+
+        for name, value in self.pragmas.items():
+            if name == 'journal_mode' and (readonly or self._wal_checked):
+                continue  # 日志模式保存在数据库文件中，设置一次即可
+            conn.execute(f"PRAGMA {name} = {value}")
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        elif not self._wal_checked:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            if mode.lower() != str(self.pragmas['journal_mode']).lower():
+                logger.warning(f"数据库日志模式为 {mode}，未能切换到 {self.pragmas['journal_mode']}")
+            self._wal_checked = True
+        return conn
+
+    def engine_options(self, readonly=False):
+        """Flask-SQLAlchemy 使用的 SQLALCHEMY_ENGINE_OPTIONS（readonly 为 SQLALCHEMY_BINDS 中只读引擎的参数）"""
+        if readonly:
+            return {'creator': lambda: self.connect(readonly=True), 'pool_size': self.readers}
+        return {'creator': self.connect}
+
+    @contextmanager
+    def write(self):
+        """获取唯一的写连接（SQLAlchemy Connection），在同一事务中执行，退出时提交"""
+        started = time.perf_counter()
+        with self._write_lock:
+            waited_ms = (time.perf_counter() - started) * 1000
+            self.writes += 1
+            self.write_wait_ms += waited_ms
+            self.max_write_wait_ms = max(self.max_write_wait_ms, waited_ms)
+
+            if self._writer_engine is None:
+                self._writer_engine = self._create_writer_engine()
+            with self._writer_engine.begin() as conn:
+                yield conn
+
+    def _create_writer_engine(self):
+        """写连接只有一个，由写锁保证同一时刻只有一个线程使用"""
+        def connect_writer():
+            conn = self.connect()
+            conn.isolation_level = None  # 事务由下面的 BEGIN IMMEDIATE 显式开始，DDL也在事务内
+            return conn
+
+        engine = create_engine('sqlite://', creator=connect_writer, poolclass=StaticPool)
+        # 事务开始时即获取写锁，避免多进程写入时读锁升级失败（SQLITE_BUSY）
+        event.listen(engine, 'begin', lambda conn: conn.exec_driver_sql('BEGIN IMMEDIATE'))
+        return engine
+
+    @contextmanager
+    def read(self):
+        """从连接池借出一个只读的 sqlite3 连接"""
+        started = time.perf_counter()
+        conn = self._acquire_reader()
+        self.reads += 1
+        self.read_wait_ms += (time.perf_counter() - started) * 1000
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._reader_pool.put(conn)
+
+    def _acquire_reader(self):
+        try:
+            return self._reader_pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            if self._reader_count < self.readers:
+                self._reader_count += 1
+                try:
+                    if not self._wal_checked:
+                        # 只读连接不能切换日志模式，先用一个写连接设置，否则第一次写入前的读会阻塞写入
+                        self.connect().close()
+                    return self.connect(readonly=True)
+                except Exception:
+                    self._reader_count -= 1
+                    raise
+        return self._reader_pool.get()
+
+    def close(self):
+        """关闭写连接和空闲的只读连接"""
+        with self._write_lock:
+            if self._writer_engine is not None:
+                self._writer_engine.dispose()
+                self._writer_engine = None
+        while True:
+            try:
+                conn = self._reader_pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._pool_lock:
+                self._reader_count -= 1
+
+    def get_stats(self):
+        """获取存储层运行统计"""
+        return {
+            'db_path': self.db_path,
+            'journal_mode': self.pragmas['journal_mode'],
+            'synchronous': self.pragmas['synchronous'],
+            'writes': self.writes,
+            'avg_write_wait_ms': round(self.write_wait_ms / self.writes, 3) if self.writes else 0.0,
+            'max_write_wait_ms': round(self.max_write_wait_ms, 3),
+            'reads': self.reads,
+            'avg_read_wait_ms': round(self.read_wait_ms / self.reads, 3) if self.reads else 0.0,
+            'readers_open': self._reader_count,
+            'readers_idle': self._reader_pool.qsize(),
+            'readers_max': self.readers
+        }
+
+
+def execute(conn, sql, params=None):
+    """执行SQL，兼容 sqlite3 连接与 SQLAlchemy Connection（数据库迁移与写连接共用的DDL/DML）"""
+    if hasattr(conn, 'exec_driver_sql'):
+        return conn.exec_driver_sql(sql, params) if params else conn.exec_driver_sql(sql)
+    return conn.execute(sql, params or ())
+
+
+def executemany(conn, sql, rows):
+    if hasattr(conn, 'exec_driver_sql'):
+        return conn.exec_driver_sql(sql, rows)
+    return conn.executemany(sql, rows)
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def get_storage(db_path, **kwargs):
+    """按数据库路径获取共享的存储实例（首次调用时创建，参数只在创建时生效）"""
+    key = os.path.abspath(db_path)
+    with _storages_lock:
+        storage = _storages.get(key)
+        if storage is None:
+            storage = _storages[key] = SQLiteStorage(key, **kwargs)
+        return storage
+
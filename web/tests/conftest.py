@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+pytest 公共夹具
+==============
+
+说明:
+    web/ 下的模块按脚本方式互相导入（import storage、import rollups），测试时把 web/ 加入 sys.path。
+    app 模块在导入时就创建数据库、后台线程和MQTT客户端，整个测试会话只导入一次，
+    数据目录指向临时目录；用到 app 的测试使用各自的设备ID前缀，互不影响。
+"""
+
+import os
+import sys
+import logging
+import tempfile
+
+import pytest
+
+WEB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if WEB_DIR not in sys.path:
+    sys.path.insert(0, WEB_DIR)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """导入 app 模块（数据目录为临时目录，MQTT broker 指向不可用的本地端口）"""
+    os.environ['FIRE_ALARM_DATA_DIR'] = tempfile.mkdtemp(prefix='fire_alarm_test_')
+    os.environ['FIRE_ALARM_MQTT_BROKER'] = '127.0.0.1'
+    os.environ['FIRE_ALARM_MQTT_PORT'] = '1'
+    logging.getLogger('app').setLevel(logging.WARNING)
+    # 后台线程在解释器退出时（atexit）还会写日志，此时 pytest 已关闭捕获的输出流
+    logging.raiseExceptions = False
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
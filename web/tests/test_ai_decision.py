@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""AI复核结果回写：设备状态更新为最终报警状态并推送设备更新"""
+
+from timeutil import now_ms
+
+
+def _decision(device_id, final_result, hardware_result='alarm'):
+    return {'device_id': device_id, 'final_result': final_result, 'hardware_result': hardware_result,
+            'confidence': 0.9, 'intervention': final_result != hardware_result, 'reasoning': 'test'}
+
+
+def test_ai_verdict_updates_device_state(app_module, monkeypatch):
+    published = []
+    monkeypatch.setattr(app_module.broadcaster, 'publish',
+                        lambda event, payload, key=None: published.append((event, payload)))
+
+    timestamp = now_ms()
+    app_module.device_state.update('ai_test_master', 'master', '101宿舍', 1500, 300, 26.0, 50.0, 30.0,
+                                   True, timestamp)
+
+    # AI 判定为误报
+    app_module.apply_ai_decision(_decision('ai_test_master', 'normal'), {'timestamp': timestamp, 'is_slave': False})
+
+    state = app_module.device_state.get('ai_test_master')
+    assert state.alert is False and state.updated_at == timestamp
+    updates = [payload for event, payload in published if event == 'devices_update']
+    assert updates and updates[-1][0]['device_id'] == 'ai_test_master'
+    assert updates[-1][0]['alert'] is False
+    assert any(event == 'ai_decision' for event, _ in published)
+
+
+def test_ai_verdict_does_not_override_newer_state(app_module, monkeypatch):
+    published = []
+    monkeypatch.setattr(app_module.broadcaster, 'publish',
+                        lambda event, payload, key=None: published.append((event, payload)))
+
+    timestamp = now_ms()
+    app_module.device_state.update('ai_test_newer', 'master', '102宿舍', 1500, 300, 26.0, 50.0, 30.0,
+                                   False, timestamp + 1500)
+
+    # 复核的是更早的一条记录，之后已经收到了新数据
+    app_module.apply_ai_decision(_decision('ai_test_newer', 'alarm', 'warning'),
+                                 {'timestamp': timestamp, 'is_slave': False})
+
+    state = app_module.device_state.get('ai_test_newer')
+    assert state.alert is False and state.updated_at == timestamp + 1500
+    assert not [payload for event, payload in published if event == 'devices_update']
+
+
+def test_ai_timeout_keeps_hardware_result(app_module, monkeypatch):
+    """远程AI调用超时时沿用硬件判断：记录和设备状态保持报警，不以默认置信度参与加权"""
+    import time
+    import ai_alarm_decision
+
+    def timeout(*args, **kwargs):
+        raise TimeoutError('Request timed out')
+
+    monkeypatch.setattr(ai_alarm_decision, 'new', timeout)
+    published = []
+    monkeypatch.setattr(app_module.broadcaster, 'publish',
+                        lambda event, payload, key=None: published.append((event, payload)))
+    errors = app_module.decision_pool.get_stats()['fallback_error']
+
+    device_id = 'ai_test_timeout'
+    app_module.process_sensor_data({'device_id': device_id, 'flame': 300, 'smoke': 2500, 'temperature': 60.0,
+                                    'humidity': 20.0, 'alert': True}, f"esp32/{device_id}/data/json")
+    deadline = time.monotonic() + 10
+    while not any(event == 'ai_decision' for event, _ in published) and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+    decision = [payload for event, payload in published if event == 'ai_decision'][-1]
+    assert decision['alert'] is True and decision['overall_status'] == 'alarm'
+    assert decision['ai_decision']['fallback'] is True
+    assert app_module.decision_pool.get_stats()['fallback_error'] == errors + 1
+    assert app_module.device_state.get(device_id).alert is True
+
+    app_module.ingest_buffer.flush()
+    with app_module.storage.read() as conn:
+        rows = conn.execute("SELECT alert_status FROM sensor_data WHERE device_id = ?", (device_id,)).fetchall()
+    assert rows == [(1,)]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""推送合并器测试：同一帧内按设备合并，序列化耗时按发送次数抽样统计"""
+
+import json
+
+import broadcaster as broadcaster_module
+from broadcaster import SocketBroadcaster
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data):
+        self.emitted.append((event, data))
+
+
+def test_frame_coalesces_per_device():
+    socket = RecordingSocket()
+    broadcaster = SocketBroadcaster(socket)
+    broadcaster.publish('sensor_data', {'device_id': 'a', 'value': 1}, key='a')
+    broadcaster.publish('sensor_data', {'device_id': 'b', 'value': 1}, key='b')
+    broadcaster.publish('sensor_data', {'device_id': 'a', 'value': 2}, key='a')
+    assert broadcaster.flush() == 2
+    assert socket.emitted == [('update_batch', {'sensor_data': [{'device_id': 'b', 'value': 1},
+                                                                {'device_id': 'a', 'value': 2}]})]
+    assert broadcaster.get_stats()['events']['sensor_data']['coalesced'] == 1
+
+
+def test_serialization_timing_is_sampled(monkeypatch):
+    dumps = []
+    original = json.dumps
+
+    def counting_dumps(*args, **kwargs):
+        dumps.append(args[0])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(broadcaster_module.json, 'dumps', counting_dumps)
+
+    socket = RecordingSocket()
+    broadcaster = SocketBroadcaster(socket, serialize_sample=10)
+    for index in range(25):
+        broadcaster.publish('sensor_data', {'value': index}, key='a')
+        broadcaster.flush()
+
+    assert len(socket.emitted) == 25
+    assert len(dumps) == 3  # 第1、11、21次发送
+    stats = broadcaster.get_stats()
+    assert stats['frames_sent'] == 25
+    assert stats['events']['sensor_data']['sent'] == 25
+    assert stats['events']['sensor_data']['serialize_samples'] == 3
+
+
+def test_serialization_timing_disabled():
+    socket = RecordingSocket()
+    broadcaster = SocketBroadcaster(socket, serialize_sample=0)
+    broadcaster.urgent('alarm', {'device_id': 'a'})
+    stats = broadcaster.get_stats()
+    assert stats['urgent_sent'] == 1
+    assert stats['events']['alarm']['serialize_samples'] == 0
+    assert stats['events']['alarm']['avg_serialize_ms'] == 0
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""设备快照测试：快照的登记信息与默认值，设备接口执行的SQL语句数与设备数无关"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+import device_latest
+from storage import SQLiteStorage
+from timeutil import now_ms
+from device_registry import DeviceRegistry
+from fleet_snapshot import FleetSnapshotService
+from ingest_benchmark import VirtualMaster, VirtualSlave
+
+FLEET_ENDPOINTS = ('/api/devices/all', '/api/slaves', '/api/slaves/realtime')
+
+
+def _seed(db_path, devices):
+    """device_info / device_latest 测试数据：每10个设备有1个没有读数，每20个有读数的设备有1个未登记"""
+    storage = SQLiteStorage(db_path)
+    with storage.write() as conn:
+        conn.exec_driver_sql("CREATE TABLE device_info (id INTEGER PRIMARY KEY, device_id VARCHAR(50) UNIQUE NOT NULL, "
+                             "name VARCHAR(100) NOT NULL, location VARCHAR(200), ip_address VARCHAR(15), "
+                             "device_type VARCHAR(20), master_id VARCHAR(50), last_seen DATETIME, "
+                             "status VARCHAR(20), config TEXT, created_at DATETIME)")
+        device_latest.create_table(conn)
+        now = now_ms()
+        for index in range(devices):
+            device_id = f"esp32_device_{index:04d}"
+            device_type = 'slave' if index % 3 else 'master'
+            if index % 20 != 1:
+                conn.exec_driver_sql("INSERT INTO device_info (device_id, name, location, device_type, last_seen, "
+                                     "status) VALUES (?, ?, ?, ?, '2025-01-01 00:00:00.250000', 'online')",
+                                     (device_id, device_id, f"位置{index}", device_type))
+            if index % 10:
+                conn.exec_driver_sql(device_latest.UPSERT_SQL,
+                                     (device_id, device_type, 1500, 1800, 25.0, 50.0, 30.0, False, now - index))
+    return storage
+
+
+@pytest.mark.parametrize('devices', [10, 1000])
+def test_snapshot_is_one_query(tmp_path, devices):
+    storage = _seed(os.path.join(tmp_path, 'fleet.db'), devices)
+    statements = []
+    with storage.read() as conn:
+        conn.set_trace_callback(statements.append)
+
+    service = FleetSnapshotService(storage, ttl=60)
+    snapshot = service.current()
+    assert len(statements) == 1
+    service.current()  # 缓存命中，不执行SQL
+    assert len(statements) == 1
+
+    assert len(snapshot) == devices
+    # 没有读数的设备保留登记信息
+    assert snapshot.get('esp32_device_0000') is not None
+    assert not snapshot.get('esp32_device_0000').has_reading
+    # 有读数但未登记的设备使用默认值
+    unregistered = snapshot.get('esp32_device_0001')
+    assert unregistered.name == 'ESP32-esp32_device_0001'
+    assert unregistered.location == 'Dormitory' and unregistered.status == 'online'
+    assert unregistered.last_seen == unregistered.timestamp
+    assert unregistered.alert_status is False
+    assert snapshot.get('esp32_device_0002').last_seen == 1735689600250
+    storage.close()
+
+
+def test_registry_metadata_overrides_device_info(tmp_path):
+    """设备注册表中尚未写回 device_info 的设备和状态变化立即出现在快照中"""
+    storage = _seed(os.path.join(tmp_path, 'fleet.db'), 10)
+    registry = DeviceRegistry()
+    service = FleetSnapshotService(storage, ttl=60, registry=registry)
+
+    assert registry.touch('esp32_device_0001', 'slave', None, name='新从机', location='302宿舍')
+    assert registry.touch('esp32_device_new', 'master', None)
+    service.invalidate()
+    snapshot = service.current()
+
+    assert snapshot.get('esp32_device_0001').name == '新从机'
+    assert snapshot.get('esp32_device_0001').location == '302宿舍'
+    fresh = snapshot.get('esp32_device_new')
+    assert fresh is not None and not fresh.has_reading
+    assert fresh.name == 'ESP32-esp32_device_new' and fresh.status == 'online'
+    storage.close()
+
+
+@pytest.fixture
+def statements(app_module, monkeypatch):
+    """记录当前线程执行的SQL语句（SQLAlchemy 引擎与存储层的只读连接）"""
+    executed = []
+    thread = threading.get_ident()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            executed.append(statement)
+
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+
+    storage = app_module.storage
+    read = storage.read
+
+    @contextmanager
+    def traced_read():
+        with read() as conn:
+            traced = threading.get_ident() == thread
+            if traced:
+                conn.set_trace_callback(executed.append)
+            try:
+                yield conn
+            finally:
+                if traced:
+                    conn.set_trace_callback(None)
+
+    monkeypatch.setattr(storage, 'read', traced_read)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _ensure_fleet(app_module, devices):
+    """通过正常的数据处理流程登记 devices 个测试设备（三分之一为主机），并写入数据库"""
+    registered = {record.device_id for record in app_module.device_registry.all()}
+    for index in range(devices):
+        device = VirtualMaster(index) if index % 3 == 0 else VirtualSlave(index)
+        device.device_id = f"fleet_test_{index:04d}"
+        device.topic = f"esp32/{device.device_id}/data/json"
+        if device.device_id not in registered:
+            app_module.process_sensor_data(device.payload(), device.topic)
+    app_module.ingest_buffer.flush()
+    app_module.device_registry.flush()
+
+
+@pytest.mark.parametrize('devices', [10, 1000])
+def test_fleet_endpoints_query_count(app_module, client, statements, devices):
+    _ensure_fleet(app_module, devices)
+
+    for endpoint in FLEET_ENDPOINTS:
+        # 快照和响应缓存都失效，接口需要重新构建快照
+        app_module.fleet_snapshots.invalidate()
+        app_module.data_version.bump()
+        statements.clear()
+        response = client.get(endpoint)
+        assert response.status_code == 200
+        assert len(response.get_json()) >= devices * 2 // 3 - 1
+        assert len(statements) == 1, f"{endpoint} 执行了 {len(statements)} 条SQL: {statements}"
+
+        # 快照缓存命中时不访问数据库
+        app_module.data_version.bump()
+        statements.clear()
+        assert client.get(endpoint).status_code == 200
+        assert statements == [], f"{endpoint} 快照缓存命中时执行了SQL: {statements}"
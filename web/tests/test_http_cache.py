@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""轮询接口缓存测试：ETag/304、按数据版本失效、并发请求下的统计"""
+
+import threading
+
+import pytest
+from flask import Flask, jsonify
+
+from http_cache import DataVersion, HttpCache
+
+
+@pytest.fixture
+def cached_app():
+    app = Flask(__name__)
+    version = DataVersion()
+    cache = HttpCache(version)
+    calls = []
+
+    @app.route('/api/devices')
+    @cache.cached(max_age=3600)
+    def devices():
+        calls.append(1)
+        return jsonify([{'device_id': 'a', 'version': version.counter}])
+
+    return app, version, cache, calls
+
+
+def test_etag_and_version(cached_app):
+    app, version, cache, calls = cached_app
+    client = app.test_client()
+
+    first = client.get('/api/devices')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and len(calls) == 1
+
+    assert client.get('/api/devices', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/devices').get_data() == first.get_data()
+    assert len(calls) == 1
+
+    version.bump()
+    changed = client.get('/api/devices', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert len(calls) == 2
+
+    stats = cache.get_stats()
+    assert (stats['not_modified'], stats['cache_hits'], stats['misses']) == (1, 1, 2)
+
+
+def test_stats_are_consistent_under_concurrency(cached_app):
+    app, version, cache, calls = cached_app
+    etag = app.test_client().get('/api/devices').headers['ETag']
+    threads, requests_per_thread = 8, 200
+
+    def poll(index):
+        client = app.test_client()
+        for request_index in range(requests_per_thread):
+            headers = {'If-None-Match': etag} if (index + request_index) % 2 else {}
+            assert client.get('/api/devices', headers=headers).status_code in (200, 304)
+
+    workers = [threading.Thread(target=poll, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    stats = cache.get_stats()
+    assert stats['not_modified'] + stats['cache_hits'] + stats['misses'] == threads * requests_per_thread + 1
+    assert stats['misses'] == len(calls) == 1
+
+
+def test_resource_versions():
+    from http_cache import READINGS, ALERTS, DEVICES
+
+    version = DataVersion()
+    alerts = version.value_of((ALERTS,))
+    device_a = version.value_of((READINGS,), 'a')
+    fleet = version.value_of((READINGS,))
+
+    version.bump(READINGS, devices=('b',))
+    assert version.value_of((ALERTS,)) == alerts
+    assert version.value_of((READINGS,), 'a') == device_a
+    assert version.value_of((READINGS,)) != fleet
+
+    version.bump(READINGS, devices=('a',))
+    assert version.value_of((READINGS,), 'a') != device_a
+    device_a = version.value_of((READINGS,), 'a')
+
+    version.bump(DEVICES)
+    assert version.value_of((ALERTS,)) == alerts and version.value_of((READINGS,), 'a') == device_a
+
+    # 不指定资源时全部资源（包括每个设备的读数）都视为变化
+    version.bump()
+    assert version.value_of((ALERTS,)) != alerts and version.value_of((READINGS,), 'a') != device_a
+    assert version.value_of((READINGS,), 'never_seen') == version.value_of((READINGS,), 'a')
+
+
+def test_not_modified_while_ingest_runs(app_module, client, monkeypatch):
+    """其他设备持续入库时，只依赖报警记录或单个设备读数的接口仍返回304"""
+    import types
+    import http_cache
+    monkeypatch.setattr(http_cache, 'time', types.SimpleNamespace(time=lambda: 1800000000.0))
+
+    def ingest(device_id, smoke=300):
+        app_module.process_sensor_data({'device_id': device_id, 'flame': 1500, 'smoke': smoke, 'temperature': 25.0,
+                                        'humidity': 50.0, 'alert': False}, f"esp32/{device_id}/data/json")
+        app_module.ingest_buffer.flush()
+
+    ingest('etag_test_a')
+    ingest('etag_test_b')
+    app_module.device_registry.flush()
+    unchanged = ('/api/history', '/api/data/recent?device_id=etag_test_a',
+                 '/api/intelligence/health-score/etag_test_a', '/api/intelligence/trends/etag_test_a')
+    etags = {}
+    for endpoint in unchanged + ('/api/devices/all', '/api/data/recent'):
+        response = client.get(endpoint)
+        assert response.status_code == 200, endpoint
+        etags[endpoint] = response.headers['ETag']
+
+    for index in range(5):
+        ingest('etag_test_b', smoke=300 + index)
+        app_module.device_registry.flush()  # 写回在线时间
+        for endpoint in unchanged:
+            response = client.get(endpoint, headers={'If-None-Match': etags[endpoint]})
+            assert response.status_code == 304, endpoint
+    # 读取全部设备的接口随入库更新
+    for endpoint in ('/api/devices/all', '/api/data/recent'):
+        assert client.get(endpoint, headers={'If-None-Match': etags[endpoint]}).status_code == 200
+
+    ingest('etag_test_a', smoke=310)
+    assert client.get('/api/data/recent?device_id=etag_test_a',
+                      headers={'If-None-Match': etags['/api/data/recent?device_id=etag_test_a']}).status_code == 200
+    assert client.get('/api/history', headers={'If-None-Match': etags['/api/history']}).status_code == 304
+
+    app_module.process_alert_data({'type': 'fire', 'level': 'high', 'device_id': 'etag_test_a', 'data': {}})
+    assert client.get('/api/history', headers={'If-None-Match': etags['/api/history']}).status_code == 200
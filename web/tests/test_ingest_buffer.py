@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""写缓冲测试：错误数据只影响自身，数据库暂时不可用时整批重试"""
+
+import sqlite3
+
+import pytest
+
+from ingest_buffer import SensorIngestBuffer, is_retryable
+from timeutil import now_ms
+
+
+class FakeDatabase:
+    """flame_value 为None的数据违反约束；locked 为True时模拟数据库被锁"""
+
+    def __init__(self):
+        self.rows = []
+        self.calls = 0
+        self.locked = False
+
+    def write(self, rows):
+        self.calls += 1
+        if self.locked:
+            raise sqlite3.OperationalError('database is locked')
+        if any(row['flame_value'] is None for row in rows):
+            raise sqlite3.IntegrityError('NOT NULL constraint failed: flame_value')
+        self.rows.extend(rows)
+
+
+def _rows(count, bad=()):
+    return [{'index': index, 'flame_value': None if index in bad else 1500} for index in range(count)]
+
+
+def test_bad_row_in_the_middle_of_a_batch_is_quarantined():
+    database = FakeDatabase()
+    buffer = SensorIngestBuffer(database.write, max_rows=1000)
+    for row in _rows(50, bad={23}):
+        buffer.append(row)
+
+    assert buffer.flush() == 49
+    assert [row['index'] for row in database.rows] == [index for index in range(50) if index != 23]
+    stats = buffer.get_stats()
+    assert stats['queue_depth'] == 0
+    assert stats['rows_rejected'] == 1 and stats['quarantined'] == 1
+    assert buffer.quarantine[0][0]['index'] == 23
+
+    # 之后的数据正常写入
+    for row in _rows(5):
+        buffer.append(row)
+    assert buffer.flush() == 5
+    assert buffer.get_stats()['rows_flushed'] == 54
+
+
+def test_several_bad_rows():
+    database = FakeDatabase()
+    buffer = SensorIngestBuffer(database.write, max_rows=1000)
+    bad = {0, 7, 8, 99}
+    for row in _rows(100, bad=bad):
+        buffer.append(row)
+    assert buffer.flush() == 96
+    assert {row['index'] for row in database.rows} == set(range(100)) - bad
+    assert {row['index'] for row, _, _ in buffer.quarantine} == bad
+
+
+def test_locked_database_requeues_the_whole_batch():
+    database = FakeDatabase()
+    database.locked = True
+    buffer = SensorIngestBuffer(database.write, max_rows=1000)
+    for row in _rows(10):
+        buffer.append(row)
+
+    assert buffer.flush() is None
+    assert database.calls == 1  # 不拆分
+    stats = buffer.get_stats()
+    assert stats['queue_depth'] == 10 and stats['rows_rejected'] == 0 and stats['flush_errors'] == 1
+
+    database.locked = False
+    assert buffer.flush() == 10
+    assert [row['index'] for row in database.rows] == list(range(10))
+
+
+def test_is_retryable():
+    assert is_retryable(sqlite3.OperationalError('database is locked'))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(sqlite3.IntegrityError('NOT NULL constraint failed: flame_value'))
+    assert not is_retryable(TypeError('int() argument must be a string'))
+
+    from sqlalchemy.exc import OperationalError, IntegrityError
+    assert is_retryable(OperationalError('INSERT', {}, sqlite3.OperationalError('database is locked')))
+    assert not is_retryable(IntegrityError('INSERT', {}, sqlite3.IntegrityError('NOT NULL constraint failed')))
+
+
+@pytest.mark.parametrize('bad_value', [{'flame_value': None}, {'smoke_value': None}])
+def test_app_flush_isolates_bad_row(app_module, bad_value):
+    """经过实际的写入流程（分区、汇总表、最新读数、时序分块），一条错误数据不影响同批其他数据"""
+    buffer = app_module.ingest_buffer
+    device_id = f"buffer_test_{next(iter(bad_value))}"
+    rejected = buffer.get_stats()['rows_rejected']
+    timestamp = now_ms() - 600 * 1000
+    buffer.flush()
+    for index in range(50):
+        row = {
+            'device_id': device_id, 'device_type': 'master', 'flame_value': 1500, 'smoke_value': 300,
+            'temperature': 25.0, 'humidity': 50.0, 'light_level': 30.0, 'alert_status': False,
+            'timestamp': timestamp + index * 1000
+        }
+        if index == 25:
+            row.update(bad_value)
+        buffer.append(row)
+
+    buffer.flush()
+    assert buffer.get_stats()['rows_rejected'] == rejected + 1
+    assert buffer.get_stats()['queue_depth'] == 0
+    with app_module.storage.read() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM sensor_data WHERE device_id = ?", (device_id,)).fetchone()[0]
+    assert count == 49
+    series = app_module.sensor_series.scan(device_id, timestamp, timestamp + 60 * 1000)
+    assert len(series['timestamp']) == 49
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""分页接口测试：下一页游标放在 X-Next-Cursor 响应头，跨域请求可以读取"""
+
+from timeutil import now_ms
+
+
+def test_next_cursor_is_exposed_to_cross_origin_clients(app_module, client):
+    timestamp = now_ms() - 3600 * 1000
+    app_module.flush_sensor_rows([{
+        'device_id': 'page_test_device', 'device_type': 'master', 'flame_value': 1500, 'smoke_value': 300,
+        'temperature': 25.0, 'humidity': 50.0, 'light_level': 30.0, 'alert_status': False,
+        'timestamp': timestamp + index * 1000
+    } for index in range(5)])
+
+    response = client.get('/api/data/range?device_id=page_test_device&limit=2',
+                          headers={'Origin': 'http://example.com'})
+    assert response.status_code == 200
+    assert len(response.get_json()) == 2
+    assert response.headers.get('X-Next-Cursor')
+    assert 'X-Next-Cursor' in response.headers.get('Access-Control-Expose-Headers', '')
+
+    # 按游标取完剩余的页，最后一页没有游标
+    seen = [row['id'] for row in response.get_json()]
+    while response.headers.get('X-Next-Cursor'):
+        response = client.get(f"/api/data/range?device_id=page_test_device&limit=2"
+                              f"&cursor={response.headers['X-Next-Cursor']}")
+        seen += [row['id'] for row in response.get_json()]
+    assert len(seen) == len(set(seen)) == 5
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""载荷规整测试：各种上报格式的字段提取，同一来源后续消息的字段变化不受首条消息影响"""
+
+import pytest
+
+from payload_normalizer import (PayloadNormalizer, SHAPE_MASTER, SHAPE_MASTER_NESTED, SHAPE_SLAVE,
+                                SHAPE_SLAVE_FORWARDED, SHAPE_UNKNOWN, SLAVE_FLAME_DEFAULT)
+
+
+def _slave(flame=None, smoke=None, **extra):
+    sensors = {}
+    if flame is not None:
+        sensors['flame'] = {'analog': flame, 'digital': 1}
+    if smoke is not None:
+        sensors['mq2_smoke'] = {'analog': smoke, 'digital': 1}
+    return dict({'slave_id': 'esp32_slave_01', 'sensors': sensors, 'overall_status': 'normal'}, **extra)
+
+
+@pytest.fixture
+def normalizer():
+    return PayloadNormalizer()
+
+
+def test_master(normalizer):
+    reading = normalizer.normalize('t', {'device_id': 'esp32_master', 'flame': 1500, 'smoke': 300,
+                                         'temperature': 25.5, 'humidity': 40, 'lux': 80, 'alert': True})
+    assert reading.shape == SHAPE_MASTER and reading.device_type == 'master'
+    assert (reading.device_id, reading.flame, reading.smoke, reading.light) == ('esp32_master', 1500, 300, 80)
+    assert reading.alert is True
+
+
+def test_master_nested(normalizer):
+    reading = normalizer.normalize('t', {'device_id': 'esp32_master', 'data': {'flame': 900, 'smoke': 1200,
+                                                                                'light_level': 12}})
+    assert reading.shape == SHAPE_MASTER_NESTED
+    assert (reading.flame, reading.smoke, reading.light) == (900, 1200, 12)
+
+
+def test_slave_and_forwarded(normalizer):
+    reading = normalizer.normalize('s', _slave(1100, 1900, sequence=7, slave_name='从机1'))
+    assert reading.shape == SHAPE_SLAVE and reading.is_slave
+    assert (reading.device_id, reading.flame, reading.smoke, reading.sequence) == ('esp32_slave_01', 1100, 1900, 7)
+
+    forwarded = {'device_id': 'esp32_slave_02', 'sensors': {'flame': {}, 'mq2_smoke': {'analog': 2100}},
+                 'overall_status': 'alarm'}
+    reading = normalizer.normalize('f', forwarded)
+    assert reading.shape == SHAPE_SLAVE_FORWARDED and reading.device_id == 'esp32_slave_02'
+    assert (reading.flame, reading.smoke, reading.alert) == (SLAVE_FLAME_DEFAULT, 2100, True)
+
+
+def test_unknown_shape(normalizer):
+    reading = normalizer.normalize('u', {'device_id': 'x', 'temperature': 20})
+    assert reading.shape == SHAPE_UNKNOWN and (reading.flame, reading.smoke) == (0, 0)
+    assert normalizer.get_stats()['unknown_shapes'] == 1
+    assert normalizer.normalize('u', ['not', 'a', 'dict']) is None
+
+    # 同一来源之后出现读数字段，不再计为未知格式
+    reading = normalizer.normalize('u', {'device_id': 'x', 'flame': 1500, 'smoke': 300})
+    assert reading.shape == SHAPE_MASTER and reading.flame == 1500
+    assert normalizer.get_stats()['unknown_shapes'] == 2
+
+
+def test_light_resolved_per_message(normalizer):
+    """首条消息没有光照字段，之后的光照数值仍然读取"""
+    assert normalizer.normalize('t', {'device_id': 'm', 'flame': 1500, 'smoke': 300}).light is None
+    assert normalizer.normalize('t', {'device_id': 'm', 'flame': 1500, 'smoke': 300, 'light': 55}).light == 55
+    assert normalizer.normalize('t', {'device_id': 'm', 'flame': 1500, 'smoke': 300, 'illuminance': 7}).light == 7
+    assert normalizer.normalize('t', {'device_id': 'm', 'data': {'flame': 1, 'smoke': 2, 'lux': 9}}).light == 9
+    # 顶层键名优先于嵌套字段
+    assert normalizer.normalize('t', {'device_id': 'm', 'lux': 3, 'data': {'flame': 1, 'light': 9}}).light == 3
+    assert normalizer.get_stats()['compiled'] == 1
+
+
+def test_slave_sensors_resolved_per_message(normalizer):
+    """首条从机消息没有火焰传感器，之后的火焰读数仍然读取"""
+    reading = normalizer.normalize('s', _slave(smoke=1900))
+    assert (reading.flame, reading.smoke) == (0, 1900)
+    reading = normalizer.normalize('s', _slave(flame=7, smoke=1900))
+    assert (reading.flame, reading.smoke) == (7, 1900)
+    reading = normalizer.normalize('s', _slave(flame=8))
+    assert (reading.flame, reading.smoke) == (8, 0)
+    assert normalizer.get_stats()['compiled'] == 1
+
+
+def test_source_switches_between_master_and_forwarded(normalizer):
+    forwarded = {'device_id': 'esp32_slave_02', 'sensors': {'flame': {'analog': 5}}}
+    master = {'device_id': 'esp32_master', 'sensors': ['flame', 'mq2_smoke'], 'flame': 1500, 'smoke': 300}
+
+    assert normalizer.normalize('m', master).shape == SHAPE_MASTER
+    reading = normalizer.normalize('m', forwarded)
+    assert reading.shape == SHAPE_SLAVE_FORWARDED and (reading.flame, reading.smoke) == (5, 0)
+    assert normalizer.normalize('m', master).shape == SHAPE_MASTER
+    assert normalizer.get_stats()['errors'] == 0
+
+
+def test_malformed_sensor_is_an_error(normalizer):
+    assert normalizer.normalize('s', {'slave_id': 'x', 'sensors': {'flame': 5}}) is None
+    assert normalizer.get_stats()['errors'] == 1
+
+
+def test_analog_values_are_integers(normalizer):
+    """浮点读数四舍五入，null 按字段缺失处理（入库列为整数且不允许为空）"""
+    reading = normalizer.normalize('t', {'device_id': 'm', 'flame': 12.7, 'smoke': '300.2'})
+    assert (reading.flame, reading.smoke) == (13, 300)
+    assert isinstance(reading.flame, int) and isinstance(reading.smoke, int)
+    reading = normalizer.normalize('t', {'device_id': 'm', 'flame': None, 'smoke': 300})
+    assert (reading.flame, reading.smoke) == (0, 300)
+
+    payload = _slave(flame=1, smoke=1899.6)
+    payload['sensors']['flame']['analog'] = None
+    reading = normalizer.normalize('s', payload)
+    assert (reading.flame, reading.smoke) == (SLAVE_FLAME_DEFAULT, 1900)
+
+    assert normalizer.normalize('t', {'device_id': 'm', 'flame': 'high', 'smoke': 300}) is None
+    assert normalizer.normalize('t', {'device_id': 'm', 'flame': float('nan'), 'smoke': 300}) is None
+    assert normalizer.get_stats()['errors'] == 2
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""统计摘要回归测试：/api/history/summary 与直接按原始数据聚合的结果一致（窗口起止不按分钟对齐）"""
+
+import random
+from contextlib import contextmanager
+
+import pytest
+
+from rollups import bucket_start
+from timeutil import now_ms, iso_ms
+
+HOURS = 48
+DEVICES = [(f"summary_test_{index:02d}", 'slave' if index % 3 else 'master') for index in range(6)]
+
+
+@pytest.fixture(scope='module')
+def window(app_module):
+    """固定的查询窗口：结束时间在分钟内第30.5秒，窗口前后同一分钟内都有不应计入的数据"""
+    end = bucket_start(now_ms(), '1m') - 5 * 60 * 1000 + 30500
+    start = end - HOURS * 3600 * 1000
+    rng = random.Random(24)
+
+    timestamps = list(range(start + 1500, end, 7 * 60 * 1000 + 1300))
+    # 边界：起止时刻本身计入，起点前/终点后同一分钟内的数据不计入
+    timestamps += [start, start + 100, end, end - 1, start - 1, start - 20000, end + 1, end + 20000]
+    rows = []
+    for timestamp in timestamps:
+        for device_id, device_type in DEVICES:
+            rows.append({
+                'device_id': device_id,
+                'device_type': device_type,
+                'flame_value': rng.randint(100, 2000),
+                'smoke_value': rng.randint(300, 2200),
+                'temperature': round(rng.uniform(18, 60), 1),
+                'humidity': round(rng.uniform(30, 80), 1),
+                'light_level': round(rng.uniform(0, 100), 1) if device_type == 'master' else None,
+                'alert_status': rng.random() < 0.1,
+                'timestamp': timestamp
+            })
+    app_module.flush_sensor_rows(rows)
+    return start, end
+
+
+def _baseline(app_module, start, end, device_type=None):
+    """按原始数据统计每个设备和全部设备（汇总表之前的实现方式）"""
+    where = "timestamp >= ? AND timestamp <= ?" + (" AND device_type = ?" if device_type else "")
+    params = [start, end] + ([device_type] if device_type else [])
+    aggregates = ("COUNT(*), COALESCE(SUM(alert_status), 0), AVG(temperature), MAX(temperature), "
+                  "AVG(smoke_value), AVG(flame_value)")
+    with app_module.storage.read() as conn:
+        devices = {row[0]: row[1:] for row in conn.execute(
+            f"SELECT device_id, {aggregates}, MAX(timestamp) FROM sensor_data WHERE {where} GROUP BY device_id",
+            params).fetchall()}
+        total = conn.execute(f"SELECT {aggregates} FROM sensor_data WHERE {where}", params).fetchone()
+    return devices, total
+
+
+@pytest.mark.parametrize('device_type', [None, 'master', 'slave'])
+def test_summary_matches_raw_aggregation(app_module, client, monkeypatch, window, device_type):
+    start, end = window
+    assert start % 60000 and end % 60000
+    monkeypatch.setattr(app_module, 'now_ms', lambda: end)
+
+    query = f'/api/history/summary?hours={HOURS}' + (f'&device_type={device_type}' if device_type else '')
+    result = client.get(query).get_json()
+    devices, total = _baseline(app_module, start, end, device_type)
+    assert devices
+
+    assert result['time_range'] == {'start': iso_ms(start), 'end': iso_ms(end), 'hours': HOURS}
+    assert {device['device_id'] for device in result['devices']} == set(devices)
+    for device in result['devices']:
+        count, alerts, avg_temp, max_temp, avg_smoke, _, last_timestamp = devices[device['device_id']]
+        assert device['data_count'] == count
+        assert device['alert_count'] == alerts
+        assert device['avg_temp'] == pytest.approx(avg_temp)
+        assert device['max_temp'] == pytest.approx(max_temp)
+        assert device['avg_smoke'] == pytest.approx(avg_smoke)
+        assert device['last_update'] == iso_ms(last_timestamp)
+
+    count, alerts, avg_temp, max_temp, avg_smoke, avg_flame = total
+    assert result['total_records'] == count
+    assert result['statistics'] == {
+        'avg_temperature': pytest.approx(avg_temp),
+        'avg_smoke': pytest.approx(avg_smoke),
+        'avg_flame': pytest.approx(avg_flame),
+        'max_temperature': pytest.approx(max_temp),
+        'alert_count': alerts
+    }
+
+
+def test_summary_is_one_statement(app_module, monkeypatch, window):
+    """每个设备的汇总行和合计行由同一条SQL得到"""
+    start, end = window
+    storage = app_module.storage
+    read = storage.read
+    statements = []
+
+    @contextmanager
+    def traced_read():
+        with read() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                yield conn
+            finally:
+                conn.set_trace_callback(None)
+
+    monkeypatch.setattr(storage, 'read', traced_read)
+    devices, total = app_module.sensor_rollups.summarize(start, end)
+    assert len(statements) == 1
+    assert total['count'] == sum(summary['count'] for summary in devices.values())
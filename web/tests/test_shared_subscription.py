@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""共享订阅测试：两个接收工作进程通过 $share 分担设备消息，工作进程重启前后不丢失、不重复
+
+需要本机安装 mosquitto（不在 PATH 中时跳过）。工作进程与 app 使用相同的订阅方式：
+subscription_topics(ROLE_INGEST, 组名) 共享订阅、QoS 1、固定客户端ID的持久会话。
+"""
+
+import os
+import json
+import time
+import shutil
+import socket
+import threading
+import subprocess
+
+import pytest
+
+paho = pytest.importorskip('paho.mqtt.client')
+
+from ingest_worker import ROLE_INGEST, subscription_topics
+
+MOSQUITTO = shutil.which('mosquitto')
+pytestmark = pytest.mark.skipif(MOSQUITTO is None, reason='mosquitto 不在 PATH 中')
+
+GROUP = 'fire_alarm_ingest_test'
+QOS = 1
+DEVICES = 5
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(predicate, timeout=15.0, interval=0.05):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+
+@pytest.fixture
+def broker(tmp_path):
+    port = _free_port()
+    config = os.path.join(tmp_path, 'mosquitto.conf')
+    with open(config, 'w') as f:
+        f.write(f"listener {port} 127.0.0.1\nallow_anonymous true\npersistence false\n"
+                f"max_queued_messages 10000\n")
+    process = subprocess.Popen([MOSQUITTO, '-c', config], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def accepting():
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return True
+        except OSError:
+            return False
+
+    if not _wait_for(accepting, timeout=10.0):
+        process.kill()
+        pytest.fail('mosquitto 未能启动')
+    yield port
+    process.terminate()
+    process.wait(10)
+
+
+class Worker:
+    """按 app 的方式订阅设备主题的接收工作进程（只记录收到的消息）"""
+
+    def __init__(self, name, port, received, lock):
+        self.name = name
+        self.port = port
+        self.received = received
+        self.lock = lock
+        self.client = None
+        self.subscribed = threading.Event()
+
+    def start(self):
+        self.subscribed.clear()
+        self.client = paho.Client(client_id=f"fire_alarm_ingest_test_{self.name}", clean_session=False)
+        self.client.on_connect = self._on_connect
+        self.client.on_subscribe = lambda client, userdata, mid, granted_qos: self.subscribed.set()
+        self.client.on_message = self._on_message
+        self.client.connect('127.0.0.1', self.port, 60)
+        self.client.loop_start()
+        assert self.subscribed.wait(10), f"工作进程 {self.name} 订阅超时"
+
+    def stop(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        for topic in subscription_topics(ROLE_INGEST, GROUP):
+            client.subscribe(topic, qos=QOS)
+
+    def _on_message(self, client, userdata, msg):
+        data = json.loads(msg.payload)
+        with self.lock:
+            self.received.append((self.name, data['slave_id'], data['sequence']))
+
+
+def test_shared_subscription_survives_worker_restart(broker):
+    received = []
+    lock = threading.Lock()
+    workers = [Worker(name, broker, received, lock) for name in ('a', 'b')]
+    for worker in workers:
+        worker.start()
+
+    publisher = paho.Client(client_id='fire_alarm_test_publisher')
+    publisher.connect('127.0.0.1', broker, 60)
+    publisher.loop_start()
+    sequences = {}
+
+    def publish(count):
+        for index in range(count):
+            device_id = f"share_test_{index % DEVICES:02d}"
+            sequences[device_id] = sequences.get(device_id, 0) + 1
+            payload = {'type': 'sensor_data', 'slave_id': device_id, 'sequence': sequences[device_id]}
+            publisher.publish(f"esp32/{device_id}/data/json", json.dumps(payload), qos=QOS).wait_for_publish()
+        return sum(sequences.values())
+
+    def delivered():
+        with lock:
+            return len(received)
+
+    try:
+        sent = publish(200)
+        assert _wait_for(lambda: delivered() >= sent)
+        with lock:
+            before_restart = {name for name, _, _ in received}
+        assert before_restart == {'a', 'b'}, "两个工作进程都应分到消息"
+
+        # 工作进程 b 下线期间发布的消息由 a 处理或保留在 b 的持久会话中
+        workers[1].stop()
+        sent = publish(200)
+        workers[1].start()
+        sent = publish(200)
+
+        assert _wait_for(lambda: delivered() >= sent)
+        time.sleep(1.0)  # 等待可能的重复投递
+    finally:
+        publisher.loop_stop()
+        publisher.disconnect()
+        for worker in workers:
+            worker.stop()
+
+    with lock:
+        messages = [(device_id, sequence) for _, device_id, sequence in received]
+        after_restart = {name for name, _, _ in received[-200:]}
+    expected = {(device_id, sequence) for device_id, count in sequences.items() for sequence in range(1, count + 1)}
+    assert len(messages) == len(set(messages)), "存在重复投递"
+    assert set(messages) == expected, f"丢失 {len(expected - set(messages))} 条消息"
+    assert 'b' in after_restart, "重启后的工作进程没有重新分到消息"
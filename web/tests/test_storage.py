@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""存储层并发测试：WAL模式下多个写线程与读线程同时运行，读操作不阻塞写入"""
+
+import os
+import time
+import sqlite3
+import threading
+
+import pytest
+
+from storage import SQLiteStorage
+
+WRITERS = 4
+READERS = 4
+BATCHES = 50
+BATCH_ROWS = 100
+
+
+@pytest.fixture
+def storage(tmp_path):
+    db_path = os.path.join(tmp_path, 'fire_alarm.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, device_id VARCHAR(50), smoke_value INTEGER)")
+    conn.executemany("INSERT INTO sensor_data (device_id, smoke_value) VALUES (?, ?)",
+                     ((f"esp32_device_{i % 20:03d}", 1000 + i % 1000) for i in range(20000)))
+    conn.commit()
+    conn.close()
+
+    storage = SQLiteStorage(db_path, readers=READERS)
+    yield storage
+    storage.close()
+
+
+def test_wal_mode(storage):
+    with storage.write() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar().lower() == 'wal'
+    with storage.read() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == 'wal'
+
+
+def test_concurrent_writers_and_readers(storage):
+    stop = threading.Event()
+    errors = []
+    reads = [0] * READERS
+    latencies = []
+
+    def reader(index):
+        while not stop.is_set():
+            try:
+                with storage.read() as conn:
+                    conn.execute("SELECT device_id, COUNT(*), AVG(smoke_value) FROM sensor_data "
+                                 "GROUP BY device_id").fetchall()
+                reads[index] += 1
+            except Exception as e:
+                errors.append(('read', e))
+
+    def writer(index):
+        for batch in range(BATCHES):
+            rows = [(f"writer_{index}", batch) for _ in range(BATCH_ROWS)]
+            started = time.perf_counter()
+            try:
+                with storage.write() as conn:
+                    conn.exec_driver_sql("INSERT INTO sensor_data (device_id, smoke_value) VALUES (?, ?)", rows)
+            except Exception as e:
+                errors.append(('write', e))
+            latencies.append(time.perf_counter() - started)
+
+    reader_threads = [threading.Thread(target=reader, args=(i,), daemon=True) for i in range(READERS)]
+    writer_threads = [threading.Thread(target=writer, args=(i,), daemon=True) for i in range(WRITERS)]
+    for thread in reader_threads + writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join(60)
+    stop.set()
+    for thread in reader_threads:
+        thread.join(10)
+
+    assert not errors
+    assert all(count > 0 for count in reads)
+    assert not any(thread.is_alive() for thread in writer_threads)
+
+    # 所有写入都已提交
+    with storage.read() as conn:
+        written = conn.execute("SELECT device_id, COUNT(*) FROM sensor_data "
+                               "WHERE device_id LIKE 'writer_%' GROUP BY device_id").fetchall()
+    assert dict(written) == {f"writer_{i}": BATCHES * BATCH_ROWS for i in range(WRITERS)}
+    # 写锁等待只来自其他写线程，远小于 busy_timeout（5秒）
+    assert max(latencies) < 2.0
+
+
+def test_open_read_transaction_does_not_block_write(storage):
+    """读连接持有未结束的读事务（快照）时，写入仍能立即提交，读事务看到的数据不变"""
+    with storage.read() as reader:
+        reader.execute("BEGIN")
+        before = reader.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+
+        done = threading.Event()
+
+        def write():
+            with storage.write() as conn:
+                conn.exec_driver_sql("INSERT INTO sensor_data (device_id, smoke_value) VALUES ('late', 1)")
+            done.set()
+
+        thread = threading.Thread(target=write, daemon=True)
+        started = time.perf_counter()
+        thread.start()
+        assert done.wait(2.0), "写入被未结束的读事务阻塞"
+        assert time.perf_counter() - started < 1.0
+
+        # 读事务仍然看到开始时的快照
+        assert reader.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0] == before
+
+    with storage.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0] == before + 1
+
+
+def test_alert_writes_use_writer_connection(app_module, client):
+    """报警记录的写入与标记已处理都经过存储层的写连接"""
+    storage = app_module.storage
+    writes = storage.writes
+
+    app_module.process_alert_data({
+        'type': 'fire', 'level': 'high', 'device_id': 'storage_test_device',
+        'data': {'flame': 300, 'smoke': 800, 'temperature': 55.5, 'location': 'Room 101'}
+    })
+    assert storage.writes == writes + 1
+
+    with storage.read() as conn:
+        alert_id, resolved = conn.execute("SELECT id, resolved FROM alert_history "
+                                          "WHERE device_id = 'storage_test_device'").fetchone()
+    assert not resolved
+
+    response = client.put(f'/api/alerts/{alert_id}/resolve')
+    assert response.status_code == 200
+    assert storage.writes == writes + 2
+    with storage.read() as conn:
+        resolved, resolved_time = conn.execute("SELECT resolved, resolved_time FROM alert_history "
+                                               "WHERE id = ?", (alert_id,)).fetchone()
+    assert resolved and resolved_time
+
+    assert client.put('/api/alerts/999999999/resolve').status_code == 404
+
+
+QUERY_ENDPOINTS = ('/api/data/recent', '/api/data/recent?device_id=storage_test_slave', '/api/data/range',
+                   '/api/alerts', '/api/slaves/alerts', '/api/history', '/api/slaves/storage_test_slave/data',
+                   '/api/sensor/history', '/api/sensor/history?device_id=storage_test_slave')
+
+
+def test_query_endpoints_use_readonly_connections(app_module, client):
+    """查询接口的ORM读取只经过只读引擎（query_only），不使用写入所用的默认连接"""
+    from sqlalchemy import event
+    from sqlalchemy.exc import OperationalError
+
+    app_module.process_sensor_data({'slave_id': 'storage_test_slave', 'overall_status': 'normal',
+                                    'sensors': {'flame': {'analog': 1500}, 'mq2_smoke': {'analog': 1900}}},
+                                   'esp32/storage_test_slave/data/json')
+    app_module.ingest_buffer.flush()
+
+    thread = threading.get_ident()
+    executed = {None: [], app_module.READONLY_BIND: []}
+    with app_module.app.app_context():
+        engines = {key: app_module.db.engines[key] for key in executed}
+
+    listeners = {}
+    for key, engine in engines.items():
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany, key=key):
+            if threading.get_ident() == thread:
+                executed[key].append(statement)
+        listeners[key] = before_cursor_execute
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        for endpoint in QUERY_ENDPOINTS:
+            response = client.get(endpoint)
+            assert response.status_code == 200, endpoint
+    finally:
+        for key, engine in engines.items():
+            event.remove(engine, 'before_cursor_execute', listeners[key])
+
+    assert executed[None] == []
+    assert any('sensor_data' in statement for statement in executed[app_module.READONLY_BIND])
+    assert any('alert_history' in statement for statement in executed[app_module.READONLY_BIND])
+
+    with engines[app_module.READONLY_BIND].connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.exec_driver_sql("DELETE FROM alert_history")
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""列式时序存储测试：各列编码往返一致，范围扫描/最近N条/计数的边界，乱序写入的块合并排序"""
+
+import os
+
+import numpy as np
+import pytest
+
+import tsengine
+from storage import SQLiteStorage
+from tsengine import (COLUMN_NAMES, TimeSeriesStore, decode_chunk, decode_column, encode_chunk, encode_column,
+                      series_from_rows)
+
+BASE = 1735689600000
+
+
+@pytest.mark.parametrize('values', [
+    [BASE],
+    [BASE, BASE + 1500, BASE + 3000, BASE + 4510, BASE + 4510, BASE + 90000],
+    [BASE + 5000, BASE, BASE + 100],  # 时间戳不要求递增
+    [0, 2 ** 62, -2 ** 62, 7],
+])
+def test_dod_round_trip(values):
+    values = np.array(values, dtype=np.int64)
+    decoded = decode_column('dod', encode_column('dod', values), len(values), int(values[0]))
+    assert decoded.dtype == np.int64 and decoded.tolist() == values.tolist()
+
+
+@pytest.mark.parametrize('values', [[1500], [0, 4095, 0, 4095], [1800, 1799, 1799, 1805, -3], [2 ** 40, -2 ** 40]])
+def test_delta_round_trip(values):
+    values = np.array(values, dtype=np.int64)
+    assert decode_column('delta', encode_column('delta', values), len(values), 0).tolist() == values.tolist()
+
+
+def test_xor_round_trip():
+    values = np.array([25.0, 25.1, 25.1, -0.0, np.nan, np.inf, -np.inf, 1e-300, 12.7], dtype=np.float64)
+    decoded = decode_column('xor', encode_column('xor', values), len(values), 0)
+    # 按位相同（包括 NaN 与 -0.0）
+    assert decoded.view(np.uint64).tolist() == values.view(np.uint64).tolist()
+
+
+@pytest.mark.parametrize('count', [1, 7, 8, 9, 513])
+def test_bits_round_trip(count):
+    values = np.random.default_rng(count).random(count) < 0.3
+    decoded = decode_column('bits', encode_column('bits', values), count, 0)
+    assert decoded.dtype == np.bool_ and decoded.tolist() == values.tolist()
+
+
+def _rows(timestamps, flame=1500):
+    return [(timestamp, flame + index % 7, 1800 - index % 5, 25.0 + index / 10, None if index % 4 == 0 else 50.5,
+             30.0, index % 9 == 0) for index, timestamp in enumerate(timestamps)]
+
+
+def _assert_series_equal(series, rows):
+    expected = series_from_rows(rows)
+    assert set(series) == set(expected)
+    for name in expected:
+        np.testing.assert_array_equal(series[name], expected[name], err_msg=name)
+
+
+def test_chunk_round_trip_and_column_selection():
+    rows = _rows(range(BASE, BASE + 100 * 1500, 1500))
+    data = encode_chunk(series_from_rows(rows))
+    _assert_series_equal(decode_chunk(data), rows)
+    assert set(decode_chunk(data, ('smoke_value',))) == {'timestamp', 'smoke_value'}
+    with pytest.raises(ValueError):
+        decode_chunk(b'XXXX' + data[4:])
+
+
+def test_series_from_rows_rounds_and_rejects_missing_values():
+    """整数列的浮点值四舍五入而不是截断；缺失值在写入事务中抛出 ValueError，只拒绝这一批（由写缓冲拆分）"""
+    series = series_from_rows([(BASE, 12.7, 1799.5, 25.0, 50.0, None, 0), (BASE + 1, 12.2, 3, 25.0, 50.0, 1.0, 1)])
+    assert series['flame_value'].dtype == np.int64 and series['flame_value'].tolist() == [13, 12]
+    assert series['smoke_value'].tolist() == [1800, 3]
+    assert np.isnan(series['light_level'][0])
+
+    for bad in (None, float('nan')):
+        with pytest.raises(ValueError):
+            series_from_rows([(BASE, 1500, 1800, 25.0, 50.0, 1.0, 0), (BASE + 1, bad, 1800, 25.0, 50.0, 1.0, 0)])
+
+
+@pytest.fixture
+def store(tmp_path):
+    storage = SQLiteStorage(os.path.join(tmp_path, 'series.db'))
+    with storage.write() as conn:
+        tsengine.create_table(conn)
+    yield TimeSeriesStore(storage, chunk_rows=16)
+    storage.close()
+
+
+def _append(store, device_id, rows, batch=10):
+    for offset in range(0, len(rows), batch):
+        with store.storage.write() as conn:
+            store.append(conn, [dict(zip(COLUMN_NAMES, row), device_id=device_id, device_type='master')
+                                for row in rows[offset:offset + batch]])
+
+
+def test_scan_recent_count_edges(store):
+    timestamps = list(range(BASE, BASE + 100 * 1000, 1000))
+    rows = _rows(timestamps)
+    _append(store, 'ts_device', rows)
+    _append(store, 'ts_other', _rows(timestamps[:5]))
+
+    _assert_series_equal(store.scan('ts_device'), rows)
+    # 起止时刻本身包含在内，块边界两侧的记录都不丢失
+    _assert_series_equal(store.scan('ts_device', BASE + 15000, BASE + 16000), rows[15:17])
+    _assert_series_equal(store.scan('ts_device', BASE + 15001, BASE + 15999), [])
+    _assert_series_equal(store.scan('ts_device', BASE + 99000, None), rows[99:])
+    _assert_series_equal(store.scan('ts_device', None, BASE), rows[:1])
+    _assert_series_equal(store.scan('ts_device', BASE + 200000, BASE + 300000), [])
+    _assert_series_equal(store.scan('ts_missing'), [])
+    assert set(store.scan('ts_device', names=('temperature',))) == {'timestamp', 'temperature'}
+
+    _assert_series_equal(store.recent('ts_device', 1), rows[-1:])
+    _assert_series_equal(store.recent('ts_device', 17), rows[-17:])
+    _assert_series_equal(store.recent('ts_device', 1000), rows)
+    _assert_series_equal(store.recent('ts_missing', 5), [])
+
+    assert store.count('ts_device') == 100
+    assert store.count('ts_device', BASE, BASE + 99000) == 100
+    assert store.count('ts_device', BASE + 15000, BASE + 16000) == 2
+    assert store.count('ts_device', BASE + 15001, BASE + 15999) == 0
+    assert store.count('ts_device', BASE + 500, None) == 99
+    assert store.count('ts_missing') == 0
+    assert store.devices() == [('ts_device', 'master'), ('ts_other', 'master')]
+
+
+def test_out_of_order_chunks_are_merged(store):
+    """较早的数据晚到（多个接收进程）时单独成块，扫描和最近N条仍按时间排序"""
+    timestamps = list(range(BASE, BASE + 60 * 1000, 1000))
+    rows = _rows(timestamps)
+    late = rows[20:30]
+    _append(store, 'ts_late', rows[:20] + rows[30:])
+    _append(store, 'ts_late', late[::-1], batch=3)  # 晚到的一批本身也是乱序的
+
+    scanned = store.scan('ts_late')
+    assert scanned['timestamp'].tolist() == timestamps
+    _assert_series_equal(scanned, rows)
+    _assert_series_equal(store.scan('ts_late', BASE + 25000, BASE + 34000), rows[25:35])
+    assert store.count('ts_late', BASE + 25000, BASE + 34000) == 10
+    # 晚到的块与已封存的块时间范围重叠，取满 limit 条后仍要读取可能包含更新数据的块
+    for limit in range(1, len(rows) + 2):
+        _assert_series_equal(store.recent('ts_late', limit), rows[-limit:])
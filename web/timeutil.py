@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+时间戳工具 - 整数毫秒时间戳与API边界转换
+=======================================
+
+功能:
+1. 传感器数据、报警记录、汇总表统一以 UTC 纪元毫秒（整数）存储，范围过滤、分桶、排序都是整数运算
+2. 入库前与查询参数的转换：datetime（无时区视为UTC）或毫秒整数 -> 毫秒整数
+3. API输出时的转换：毫秒整数 -> ISO字符串 / 秒级时间戳
+4. EpochMillis 列类型：ORM 查询可以继续用 datetime 做比较参数，读出的值是毫秒整数
+5. 旧数据迁移用的SQL表达式（'YYYY-MM-DD HH:MM:SS.ffffff' 文本 -> 毫秒整数）
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.types import BigInteger, TypeDecorator
+
+EPOCH = datetime(1970, 1, 1)
+MS_PER_SECOND = 1000
+MS_PER_DAY = 86400 * MS_PER_SECOND
+_ONE_MS = timedelta(milliseconds=1)
+
+
+def now_ms():
+    """当前UTC时间的毫秒时间戳"""
+    return time.time_ns() // 1_000_000
+
+
+def to_ms(value):
+    """datetime（无时区视为UTC）或数值（已是毫秒）转换为毫秒整数，None保持None"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return (value - EPOCH) // _ONE_MS
+    return int(value)
+
+
+def from_ms(ms):
+    """毫秒时间戳转换为无时区的UTC datetime"""
+    return EPOCH + timedelta(milliseconds=ms)
+
+
+def iso_ms(ms):
+    """毫秒时间戳转换为ISO字符串（无时区，UTC），None返回None"""
+    if ms is None:
+        return None
+    return from_ms(ms).isoformat(timespec='milliseconds')
+
+
+def epoch_seconds(value):
+    """毫秒时间戳或datetime转换为秒级时间戳（浮点）"""
+    if isinstance(value, datetime):
+        return to_ms(value) / MS_PER_SECOND
+    return value / MS_PER_SECOND
+
+
+def floor_ms(ms, unit_ms):
+    """向下对齐到 unit_ms 的整数倍（分桶）"""
+    return ms - ms % unit_ms
+
+
+def text_to_ms_sql(column):
+    """把SQLAlchemy格式的文本时间列转换为毫秒整数的SQL表达式（已是整数的值保持不变）"""
+    return (f"CASE WHEN typeof({column}) = 'text' THEN "
+            f"CAST(strftime('%s', substr({column}, 1, 19)) AS INTEGER) * 1000 "
+            f"+ CAST(substr({column} || '.000', 21, 3) AS INTEGER) ELSE {column} END")
+
+
+class EpochMillis(TypeDecorator):
+    """以毫秒整数存储的时间列，绑定参数接受 datetime 或毫秒整数"""
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_ms(value)
+
+    def process_literal_param(self, value, dialect):
+        return str(to_ms(value))
+
+    @property
+    def python_type(self):
+        return int
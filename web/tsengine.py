@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列式时序存储 - 按设备压缩分块保存传感器读数
+===========================================
+
+功能:
+1. 每个设备的读数按时间顺序切成块（默认最多512条），每块一行：
+   时间戳 delta-of-delta、整数列 delta、浮点列与前值XOR，编码后按字节转置再 zlib 压缩；报警状态按位打包
+2. 入库时在同一写事务中追加（与汇总表相同的 in_transaction 回调）：每批先写成未封存的小块，
+   累计满一块（或小块过多）时合并重编码，写满的块封存后不再修改
+3. 范围扫描只读取与窗口重叠的块，解码结果为 NumPy 数组（timestamp 为UTC毫秒 int64，缺失的浮点值为NaN）
+4. SeriesReader 接口：TimeSeriesStore（分块存储）与 TableSeriesReader（直接读 sensor_data）实现相同的
+   scan / recent / count / devices，智能分析和历史曲线接口通过该接口读取
+5. 基准测试：python tsengine.py --benchmark 对比分块存储与 sensor_data 表的空间占用和扫描速度
+
+说明:
+    块与原始分区相互独立：原始分区按 SENSOR_RETENTION_DAYS 整体删除后，更长时间的历史仍保存在分块存储中。
+    多个接收进程乱序写入时，早于最后一块起始时间的数据单独成块，扫描时合并排序。
+"""
+
+import os
+import sys
+import time
+import zlib
+import struct
+import random
+import sqlite3
+import argparse
+import tempfile
+import logging
+
+import numpy as np
+
+from storage import execute, SQLiteStorage
+from partitions import VIEW_NAME, list_partitions, partition_bounds
+from timeutil import now_ms
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = 'sensor_series_chunks'
+CHUNK_ROWS = 512
+MAX_OPEN_CHUNKS = 16  # 每个设备未封存小块的数量上限
+COMPRESS_LEVEL = 6
+
+# 列名 -> 编码方式（顺序即块内的存储顺序）
+SERIES_COLUMNS = (
+    ('timestamp', 'dod'),
+    ('flame_value', 'delta'),
+    ('smoke_value', 'delta'),
+    ('temperature', 'xor'),
+    ('humidity', 'xor'),
+    ('light_level', 'xor'),
+    ('alert_status', 'bits'),
+)
+COLUMN_NAMES = tuple(name for name, _ in SERIES_COLUMNS)
+VALUE_COLUMNS = COLUMN_NAMES[1:]
+DTYPES = {'dod': np.int64, 'delta': np.int64, 'xor': np.float64, 'bits': np.bool_}
+
+CHUNK_MAGIC = b'TSC1'
+CHUNK_HEADER = struct.Struct('<4sIq')  # 标识, 条数, 第一条时间戳
+BLOCK_LENGTH = struct.Struct('<I')
+
+
+# ---------- 编解码 ----------
+
+def _zigzag(values):
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def _unzigzag(values):
+    return (values >> np.uint64(1)).view(np.int64) ^ -(values & np.uint64(1)).view(np.int64)
+
+
+def _pack_words(words):
+    """64位字按字节转置后压缩（变化小的数据高位字节为0，转置后连续为0，压缩率高）"""
+    shuffled = words.astype('<u8', copy=False).view(np.uint8).reshape(-1, 8).T
+    return zlib.compress(shuffled.tobytes(), COMPRESS_LEVEL)
+
+
+def _unpack_words(block, count):
+    shuffled = np.frombuffer(zlib.decompress(block), dtype=np.uint8).reshape(8, count)
+    return np.ascontiguousarray(shuffled.T).view('<u8').reshape(count)
+
+
+def encode_column(kind, values):
+    if kind == 'dod':
+        deltas = np.diff(values, prepend=values[:1])
+        return _pack_words(_zigzag(np.diff(deltas, prepend=0)))
+    if kind == 'delta':
+        return _pack_words(_zigzag(np.diff(values, prepend=0)))
+    if kind == 'xor':
+        words = values.view(np.uint64).copy()
+        words[1:] ^= values.view(np.uint64)[:-1]
+        return _pack_words(words)
+    return zlib.compress(np.packbits(values).tobytes(), COMPRESS_LEVEL)
+
+
+def decode_column(kind, block, count, first):
+    if kind == 'dod':
+        return first + np.cumsum(np.cumsum(_unzigzag(_unpack_words(block, count))))
+    if kind == 'delta':
+        return np.cumsum(_unzigzag(_unpack_words(block, count)))
+    if kind == 'xor':
+        return np.bitwise_xor.accumulate(_unpack_words(block, count)).view(np.float64)
+    return np.unpackbits(np.frombuffer(zlib.decompress(block), dtype=np.uint8), count=count).astype(np.bool_)
+
+
+def encode_chunk(columns):
+    """把按时间排序的列数组编码为一个块"""
+    count = len(columns['timestamp'])
+    parts = [CHUNK_HEADER.pack(CHUNK_MAGIC, count, int(columns['timestamp'][0]))]
+    for name, kind in SERIES_COLUMNS:
+        block = encode_column(kind, columns[name])
+        parts += [BLOCK_LENGTH.pack(len(block)), block]
+    return b''.join(parts)
+
+
+def decode_chunk(data, names=None):
+    """解码块，names 指定时只解码这些列（timestamp 总是解码）"""
+    magic, count, first = CHUNK_HEADER.unpack_from(data)
+    if magic != CHUNK_MAGIC:
+        raise ValueError('无效的时序数据块')
+    wanted = set(names or COLUMN_NAMES) | {'timestamp'}
+    columns = {}
+    offset = CHUNK_HEADER.size
+    for name, kind in SERIES_COLUMNS:
+        length, = BLOCK_LENGTH.unpack_from(data, offset)
+        offset += BLOCK_LENGTH.size
+        if name in wanted:
+            columns[name] = decode_column(kind, data[offset:offset + length], count, first)
+        offset += length
+    return columns
+
+
+# ---------- 列数组工具 ----------
+
+def empty_series(names=None):
+    return {name: np.empty(0, dtype=DTYPES[kind]) for name, kind in SERIES_COLUMNS
+            if names is None or name in names or name == 'timestamp'}
+
+
+def _int_column(name, values):
+    """整数列：浮点值四舍五入（不截断），缺失值抛出 ValueError（写入流程中只拒绝这一条数据）"""
+    array = np.array(values)
+    if array.dtype == object or (array.dtype.kind == 'f' and np.isnan(array).any()):
+        raise ValueError(f"{name} 缺失或不是数值")
+    if array.dtype.kind == 'f':
+        array = np.rint(array)
+    return array.astype(np.int64)
+
+
+def series_from_rows(rows, names=COLUMN_NAMES):
+    """行元组列表（列顺序与 names 一致）转换为列数组，None 浮点值转换为 NaN"""
+    if not rows:
+        return empty_series(names)
+    kinds = dict(SERIES_COLUMNS)
+    series = {}
+    for index, name in enumerate(names):
+        values = [row[index] for row in rows]
+        if kinds[name] == 'bits':
+            series[name] = np.array([bool(value) for value in values], dtype=np.bool_)
+        elif kinds[name] == 'xor':
+            series[name] = np.array(values, dtype=np.float64)
+        else:
+            series[name] = _int_column(name, values)
+    return series
+
+
+def concat_series(parts, names=None):
+    parts = [part for part in parts if len(part['timestamp'])]
+    if not parts:
+        return empty_series(names)
+    series = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    timestamps = series['timestamp']
+    if len(timestamps) > 1 and np.any(timestamps[1:] < timestamps[:-1]):
+        order = np.argsort(timestamps, kind='stable')
+        series = {name: values[order] for name, values in series.items()}
+    return series
+
+
+def slice_series(series, start=None, end=None):
+    """保留 [start, end] 范围内的记录（series 已按时间排序）"""
+    timestamps = series['timestamp']
+    lower = 0 if start is None else np.searchsorted(timestamps, start, side='left')
+    upper = len(timestamps) if end is None else np.searchsorted(timestamps, end, side='right')
+    if lower == 0 and upper == len(timestamps):
+        return series
+    return {name: values[lower:upper] for name, values in series.items()}
+
+
+def tail_series(series, limit):
+    return {name: values[-limit:] for name, values in series.items()} if limit else series
+
+
+def column_values(series, name):
+    """列数组转换为Python列表（NaN转换为None），用于JSON输出"""
+    values = series[name].tolist()
+    if series[name].dtype == np.float64:
+        return [None if value != value else value for value in values]
+    return values
+
+
+# ---------- 表结构 ----------
+
+def create_table(conn):
+    """创建分块表（数据库迁移时调用）"""
+    execute(conn, f"CREATE TABLE IF NOT EXISTS {TABLE_NAME} ("
+                  f"id INTEGER PRIMARY KEY, device_id VARCHAR(50) NOT NULL, device_type VARCHAR(20), "
+                  f"chunk_start INTEGER NOT NULL, chunk_end INTEGER NOT NULL, row_count INTEGER NOT NULL, "
+                  f"sealed BOOLEAN NOT NULL DEFAULT 0, data BLOB NOT NULL)")
+    # 覆盖索引：按设备和时间窗口定位块时不需要读取块数据
+    execute(conn, f"CREATE INDEX IF NOT EXISTS ix_{TABLE_NAME}_device_start "
+                  f"ON {TABLE_NAME} (device_id, chunk_start, chunk_end, row_count)")
+    execute(conn, f"CREATE INDEX IF NOT EXISTS ix_{TABLE_NAME}_end ON {TABLE_NAME} (chunk_end)")
+    execute(conn, f"CREATE INDEX IF NOT EXISTS ix_{TABLE_NAME}_open ON {TABLE_NAME} (device_id) WHERE sealed = 0")
+
+
+def rebuild(conn, chunk_rows=CHUNK_ROWS):
+    """从原始分区重建全部分块（数据库迁移时调用），返回写入的记录数"""
+    execute(conn, f"DELETE FROM {TABLE_NAME}")
+    writer = TimeSeriesStore(None, chunk_rows=chunk_rows)
+    written = 0
+    for partition in list_partitions(conn):
+        # 每次只读取一个分区时间范围内一个设备的数据
+        bounds = partition_bounds(partition)
+        devices = execute(conn, f"SELECT DISTINCT device_id FROM {VIEW_NAME} "
+                                f"WHERE timestamp >= ? AND timestamp < ?", bounds).fetchall()
+        for (device_id,) in devices:
+            rows = execute(conn, f"SELECT {', '.join(COLUMN_NAMES)}, device_type FROM {VIEW_NAME} "
+                                 f"WHERE device_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp",
+                           (device_id,) + bounds).fetchall()
+            writer._append_device(conn, device_id, rows[-1][-1], series_from_rows(rows))
+            written += len(rows)
+    return written
+
+
+# ---------- 读取接口 ----------
+
+class SeriesReader:
+    """传感器时序读取接口，返回按时间正序的列数组字典（见 COLUMN_NAMES）"""
+
+    def scan(self, device_id, start=None, end=None, names=None):
+        """设备在 [start, end]（毫秒）内的全部读数"""
+        raise NotImplementedError
+
+    def recent(self, device_id, limit=20, names=None):
+        """设备最近 limit 条读数（仍按时间正序）"""
+        raise NotImplementedError
+
+    def count(self, device_id, start=None, end=None):
+        raise NotImplementedError
+
+    def devices(self, device_type=None):
+        """[(设备ID, 设备类型), ...]"""
+        raise NotImplementedError
+
+
+class TableSeriesReader(SeriesReader):
+    """直接从 sensor_data 读取（未启用分块存储时使用）"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def _select(self, sql, params, names):
+        names = [name for name in COLUMN_NAMES if names is None or name in names or name == 'timestamp']
+        with self.storage.read() as conn:
+            rows = conn.execute(sql.format(columns=', '.join(names)), params).fetchall()
+        return series_from_rows(rows, names)
+
+    def scan(self, device_id, start=None, end=None, names=None):
+        return self._select("SELECT {columns} FROM sensor_data WHERE device_id = ? AND timestamp >= ? "
+                            "AND timestamp <= ? ORDER BY timestamp",
+                            (device_id, start if start is not None else 0,
+                             end if end is not None else 2 ** 62), names)
+
+    def recent(self, device_id, limit=20, names=None):
+        series = self._select("SELECT {columns} FROM sensor_data WHERE device_id = ? "
+                              "ORDER BY timestamp DESC LIMIT ?", (device_id, limit), names)
+        return {name: values[::-1] for name, values in series.items()}
+
+    def count(self, device_id, start=None, end=None):
+        with self.storage.read() as conn:
+            return conn.execute("SELECT COUNT(*) FROM sensor_data WHERE device_id = ? AND timestamp >= ? "
+                                "AND timestamp <= ?", (device_id, start if start is not None else 0,
+                                                      end if end is not None else 2 ** 62)).fetchone()[0]
+
+    def devices(self, device_type=None):
+        sql = "SELECT device_id, device_type FROM device_latest"
+        params = ()
+        if device_type:
+            sql += " WHERE device_type = ?"
+            params = (device_type,)
+        with self.storage.read() as conn:
+            return conn.execute(sql + " ORDER BY device_id", params).fetchall()
+
+
+class TimeSeriesStore(SeriesReader):
+    """按设备压缩分块的时序存储"""
+
+    def __init__(self, storage, chunk_rows=CHUNK_ROWS):
+        """
+        Args:
+            storage: SQLiteStorage 实例（只写入迁移时可为None）
+            chunk_rows: 每块最多条数
+        """
+        self.storage = storage
+        self.chunk_rows = chunk_rows
+        self.rows_appended = 0
+        self.chunks_written = 0
+        self.compactions = 0
+
+    # ----- 写入 -----
+
+    def append(self, conn, rows):
+        """在入库的写事务中追加一批记录（in_transaction 回调）"""
+        by_device = {}
+        for row in rows:
+            by_device.setdefault(row['device_id'], []).append(row)
+        for device_id, device_rows in by_device.items():
+            series = series_from_rows([tuple(row.get(name) for name in COLUMN_NAMES) for row in device_rows])
+            self._append_device(conn, device_id, device_rows[-1].get('device_type'), series)
+        self.rows_appended += len(rows)
+
+    def _append_device(self, conn, device_id, device_type, series):
+        """新数据先写成未封存的小块；未封存的块累计满一块或块数过多时合并，每条数据只重新编码少数几次"""
+        self._insert_chunks(conn, device_id, device_type, concat_series([series]))
+        pending, pending_rows = execute(conn, f"SELECT COUNT(*), COALESCE(SUM(row_count), 0) FROM {TABLE_NAME} "
+                                              f"WHERE device_id = ? AND sealed = 0", (device_id,)).fetchone()
+        if pending > 1 and (pending_rows >= self.chunk_rows or pending >= MAX_OPEN_CHUNKS):
+            self._compact(conn, device_id, device_type)
+
+    def _insert_chunks(self, conn, device_id, device_type, series):
+        """按 chunk_rows 切块写入，写满的块封存"""
+        for offset in range(0, len(series['timestamp']), self.chunk_rows):
+            part = {name: values[offset:offset + self.chunk_rows] for name, values in series.items()}
+            count = len(part['timestamp'])
+            execute(conn, f"INSERT INTO {TABLE_NAME} (device_id, device_type, chunk_start, chunk_end, row_count, "
+                          f"sealed, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (device_id, device_type, int(part['timestamp'][0]), int(part['timestamp'][-1]), count,
+                     1 if count >= self.chunk_rows else 0, encode_chunk(part)))
+            self.chunks_written += 1
+
+    def _compact(self, conn, device_id, device_type):
+        chunks = execute(conn, f"SELECT id, data FROM {TABLE_NAME} WHERE device_id = ? AND sealed = 0",
+                         (device_id,)).fetchall()
+        execute(conn, f"DELETE FROM {TABLE_NAME} WHERE id IN ({', '.join('?' for _ in chunks)})",
+                tuple(chunk_id for chunk_id, _ in chunks))
+        self._insert_chunks(conn, device_id, device_type, concat_series([decode_chunk(data) for _, data in chunks]))
+        self.compactions += 1
+
+    def drop_before(self, cutoff):
+        """删除结束时间早于 cutoff（毫秒）的块，返回删除的块数"""
+        with self.storage.write() as conn:
+            deleted = execute(conn, f"DELETE FROM {TABLE_NAME} WHERE chunk_end < ?", (cutoff,)).rowcount
+        return deleted
+
+    # ----- 读取 -----
+
+    def _chunks(self, conn, device_id, start, end, descending=False):
+        sql = f"SELECT data FROM {TABLE_NAME} WHERE device_id = ?"
+        params = [device_id]
+        if start is not None:
+            sql += " AND chunk_end >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND chunk_start <= ?"
+            params.append(end)
+        sql += " ORDER BY chunk_start DESC" if descending else " ORDER BY chunk_start"
+        return conn.execute(sql, params)
+
+    def scan(self, device_id, start=None, end=None, names=None):
+        with self.storage.read() as conn:
+            blobs = [row[0] for row in self._chunks(conn, device_id, start, end)]
+        return slice_series(concat_series([decode_chunk(blob, names) for blob in blobs], names), start, end)
+
+    def recent(self, device_id, limit=20, names=None):
+        parts = []
+        rows = 0
+        oldest_needed = None  # 已取到 limit 条时，其中最早一条的时间戳
+        with self.storage.read() as conn:
+            # 按块结束时间倒序读取；乱序写入的块与其他块的时间范围重叠，
+            # 取满 limit 条后，结束时间不早于其中最早一条的块仍可能包含更新的数据
+            for data, chunk_end in conn.execute(f"SELECT data, chunk_end FROM {TABLE_NAME} WHERE device_id = ? "
+                                                f"ORDER BY chunk_end DESC", (device_id,)):
+                if oldest_needed is not None and chunk_end < oldest_needed:
+                    break
+                parts.append(decode_chunk(data, names))
+                rows += len(parts[-1]['timestamp'])
+                if limit and rows >= limit:
+                    timestamps = np.concatenate([part['timestamp'] for part in parts])
+                    oldest_needed = np.partition(timestamps, len(timestamps) - limit)[len(timestamps) - limit]
+        return tail_series(concat_series(parts, names), limit)
+
+    def count(self, device_id, start=None, end=None):
+        start = 0 if start is None else start
+        end = 2 ** 62 if end is None else end
+        with self.storage.read() as conn:
+            # 完全落在窗口内的块直接累加条数，只解码两端的块
+            inside = conn.execute(f"SELECT COALESCE(SUM(row_count), 0) FROM {TABLE_NAME} WHERE device_id = ? "
+                                  f"AND chunk_start >= ? AND chunk_end <= ?", (device_id, start, end)).fetchone()[0]
+            edges = conn.execute(f"SELECT data FROM {TABLE_NAME} WHERE device_id = ? AND chunk_end >= ? "
+                                 f"AND chunk_start <= ? AND NOT (chunk_start >= ? AND chunk_end <= ?)",
+                                 (device_id, start, end, start, end)).fetchall()
+        for (data,) in edges:
+            timestamps = decode_chunk(data, ('timestamp',))['timestamp']
+            inside += int(np.count_nonzero((timestamps >= start) & (timestamps <= end)))
+        return inside
+
+    def devices(self, device_type=None):
+        sql = f"SELECT device_id, MAX(device_type) FROM {TABLE_NAME} GROUP BY device_id"
+        with self.storage.read() as conn:
+            rows = conn.execute(sql + " ORDER BY device_id").fetchall()
+        return [row for row in rows if device_type is None or row[1] == device_type]
+
+    def get_stats(self):
+        with self.storage.read() as conn:
+            chunks, rows, size = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(row_count), 0), "
+                                              f"COALESCE(SUM(length(data)), 0) FROM {TABLE_NAME}").fetchone()
+        return {
+            'chunks': chunks,
+            'rows': rows,
+            'bytes': size,
+            'bytes_per_row': round(size / rows, 2) if rows else 0.0,
+            'chunk_rows': self.chunk_rows,
+            'rows_appended': self.rows_appended,
+            'chunks_written': self.chunks_written,
+            'compactions': self.compactions
+        }
+
+
+# ---------- 基准测试 ----------
+
+def _benchmark_rows(rows, devices, interval_ms=1500):
+    """模拟每个设备 interval_ms 采样一次的读数"""
+    start = now_ms() - rows // devices * interval_ms
+    state = {f"esp32_device_{index:03d}": [random.randint(1200, 1800), random.randint(1500, 1900),
+                                           25.0, 50.0, 40.0] for index in range(devices)}
+    for index in range(rows):
+        device_id = f"esp32_device_{index % devices:03d}"
+        values = state[device_id]
+        values[0] = min(max(values[0] + random.randint(-5, 5), 0), 4095)
+        values[1] = min(max(values[1] + random.randint(-5, 5), 0), 4095)
+        values[2] = round(values[2] + random.choice((-0.1, 0.0, 0.0, 0.1)), 1)
+        values[3] = round(values[3] + random.choice((-0.1, 0.0, 0.0, 0.1)), 1)
+        values[4] = round(values[4] + random.choice((-0.5, 0.0, 0.5)), 1)
+        yield {'device_id': device_id, 'device_type': 'master',
+               'timestamp': start + (index // devices) * interval_ms + random.randint(0, 40),
+               'flame_value': values[0], 'smoke_value': values[1], 'temperature': values[2],
+               'humidity': values[3], 'light_level': values[4], 'alert_status': values[1] < 1000}
+
+
+def _file_size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+
+def benchmark(rows=500000, devices=30, batch_rows=200, repeat=5):
+    """对比 sensor_data 表（含 v1 索引）与分块存储的空间占用和扫描速度"""
+    work_dir = tempfile.mkdtemp(prefix='fire_alarm_tsengine_')
+    table_path = os.path.join(work_dir, 'table.db')
+    chunk_path = os.path.join(work_dir, 'chunks.db')
+    data = list(_benchmark_rows(rows, devices))
+
+    conn = sqlite3.connect(table_path)
+    conn.execute("CREATE TABLE sensor_data (id INTEGER PRIMARY KEY AUTOINCREMENT, device_id VARCHAR(50) NOT NULL, "
+                 "device_type VARCHAR(20), flame_value INTEGER NOT NULL, smoke_value INTEGER NOT NULL, "
+                 "temperature FLOAT, humidity FLOAT, light_level FLOAT, alert_status BOOLEAN, "
+                 "timestamp INTEGER NOT NULL)")
+    conn.execute("CREATE INDEX ix_sensor_data_device_time ON sensor_data (device_id, timestamp)")
+    conn.execute("CREATE INDEX ix_sensor_data_time ON sensor_data (timestamp)")
+    columns = ('device_id', 'device_type') + COLUMN_NAMES
+    conn.executemany(f"INSERT INTO sensor_data ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                     [tuple(row[name] for name in columns) for row in data])
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+
+    storage = SQLiteStorage(chunk_path)
+    with storage.write() as write_conn:
+        create_table(write_conn)
+    store = TimeSeriesStore(storage)
+    started = time.perf_counter()
+    for offset in range(0, len(data), batch_rows):
+        with storage.write() as write_conn:
+            store.append(write_conn, data[offset:offset + batch_rows])
+    append_ms = (time.perf_counter() - started) * 1000 / (len(data) / batch_rows)
+    storage.close()
+    conn = sqlite3.connect(chunk_path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.close()
+
+    table_bytes, chunk_bytes = _file_size(table_path), _file_size(chunk_path)
+    print(f"记录数 {rows}（{devices} 个设备，1.5秒采样）")
+    print(f"  sensor_data 表   {table_bytes / 1048576:8.2f} MB  {table_bytes / rows:6.1f} 字节/条")
+    print(f"  分块存储         {chunk_bytes / 1048576:8.2f} MB  {chunk_bytes / rows:6.1f} 字节/条  "
+          f"（{table_bytes / chunk_bytes:.1f}x）")
+    print(f"  追加一批 {batch_rows} 条平均 {append_ms:.2f} ms")
+
+    device_id = data[-1]['device_id']
+    end = data[-1]['timestamp']
+    table_reader = TableSeriesReader(SQLiteStorage(table_path))
+    chunk_reader = TimeSeriesStore(SQLiteStorage(chunk_path))
+    for label, window_ms in (('1小时', 3600 * 1000), ('24小时', 86400 * 1000), ('全部', None)):
+        start = end - window_ms if window_ms else None
+        timings = {}
+        for name, reader in (('table', table_reader), ('chunks', chunk_reader)):
+            began = time.perf_counter()
+            for _ in range(repeat):
+                series = reader.scan(device_id, start, end)
+            timings[name] = ((time.perf_counter() - began) * 1000 / repeat, len(series['timestamp']))
+        print(f"  扫描单设备{label:4s} ({timings['table'][1]:6d} 条)  表 {timings['table'][0]:8.2f} ms  "
+              f"分块 {timings['chunks'][0]:8.2f} ms  ({timings['table'][0] / max(timings['chunks'][0], 1e-6):.1f}x)")
+    if timings['table'][1] != timings['chunks'][1]:
+        print("  警告: 两种存储的扫描结果条数不一致")
+
+    table_reader.storage.close()
+    chunk_reader.storage.close()
+    return {'table_bytes': table_bytes, 'chunk_bytes': chunk_bytes, 'append_ms': append_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='火灾报警系统列式时序存储')
+    parser.add_argument('--benchmark', action='store_true', help='对比 sensor_data 表与分块存储')
+    parser.add_argument('--rows', type=int, default=500000, help='基准测试记录数')
+    parser.add_argument('--devices', type=int, default=30, help='基准测试设备数')
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        parser.print_help()
+        return 0
+    benchmark(rows=args.rows, devices=args.devices)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())